@@ -2,7 +2,8 @@ import tkinter as tk
 from tkinter import messagebox
 import math
 import re
-from typing import List, Dict, Optional, Tuple
+
+from CalculatorEngine import CalculatorEngine
 
 
 class Calculator:
@@ -24,20 +25,11 @@ class Calculator:
         self.result_var.set("0")
         self.last_was_operator = False
         self.last_was_equals = False
-        self.angle_mode = "deg"  # "deg" or "rad"
-        self.history: List[str] = []
-        self.max_history = 20
+        # Evaluation, angle mode and history live in the headless engine
+        self.engine = CalculatorEngine()
+        self.number_mode_labels = {"float": "FLOAT", "decimal": "DEC", "fraction": "FRAC"}
         self.second_mode = False  # Track if we're in second function mode
         
-        # Error messages for better user experience
-        self.error_messages = {
-            "division_by_zero": "Cannot divide by zero",
-            "invalid_input": "Invalid input",
-            "math_error": "Mathematical error",
-            "overflow": "Number too large",
-            "domain_error": "Invalid domain for function"
-        }
-        
         self.create_widgets()
         self.setup_keyboard_bindings()
         self.frame.pack_forget()  # Hide initially
@@ -90,6 +82,21 @@ class Calculator:
             command=self.toggle_angle_mode
         )
         self.angle_btn.pack(side=tk.RIGHT, padx=5)
+        
+        # Number mode toggle (float, decimal or exact fractions)
+        self.number_mode_btn = tk.Button(
+            top_frame,
+            text=self.number_mode_labels[self.engine.number_mode],
+            font=('Arial', 10, 'bold'),
+            bg='#666666',
+            fg='white',
+            activebackground='#888888',
+            activeforeground='white',
+            border=0,
+            cursor='hand2',
+            command=self.toggle_number_mode
+        )
+        self.number_mode_btn.pack(side=tk.RIGHT, padx=5)
     
     def create_display(self) -> None:
         """Create the calculator display with improved styling."""
@@ -463,12 +470,11 @@ class Calculator:
     
     def toggle_angle_mode(self) -> None:
         """Toggle between degrees and radians for trigonometric functions."""
-        if self.angle_mode == "deg":
-            self.angle_mode = "rad"
-            self.angle_btn.config(text="RAD")
-        else:
-            self.angle_mode = "deg"
-            self.angle_btn.config(text="DEG")
+        self.angle_btn.config(text=self.engine.toggle_angle_mode().upper())
+    
+    def toggle_number_mode(self) -> None:
+        """Cycle between float, decimal and exact fraction calculation."""
+        self.number_mode_btn.config(text=self.number_mode_labels[self.engine.cycle_number_mode()])
     
     def toggle_second_functions(self) -> None:
         """Toggle second functions (inverse trig functions)."""
@@ -500,194 +506,21 @@ class Calculator:
     
     def calculate(self) -> None:
         """Calculate the result of the expression with improved error handling."""
+        if not self.expression:
+            return
+        
         try:
-            if not self.expression:
-                return
-            
-            # Prepare expression for calculation
-            calc_expression = self.prepare_expression()
-            
-            # Evaluate the expression
-            result = eval(calc_expression, {"__builtins__": {}}, {
-                "math": math,
-                "sin": self.safe_sin,
-                "cos": self.safe_cos,
-                "tan": self.safe_tan,
-                "ln": self.safe_ln,
-                "lg": self.safe_lg,
-                "sqrt": self.safe_sqrt,
-                "factorial": self.safe_factorial,
-                "pi": math.pi,
-                "e": math.e,
-                "sin⁻¹": self.safe_asin,
-                "cos⁻¹": self.safe_acos,
-                "tan⁻¹": self.safe_atan
-            })
-            
-            # Format result
-            formatted_result = self.format_result(result)
-            
-            # Add to history
-            self.add_to_history(f"{self.expression} = {formatted_result}")
-            
-            # Update display
-            self.result_var.set(formatted_result)
-            self.expression_var.set(self.expression)
-            self.expression = str(result)
-            self.last_was_equals = True
-            self.last_was_operator = False
-            
-        except ZeroDivisionError:
-            self.show_error(self.error_messages["division_by_zero"])
-        except ValueError as e:
-            if "math domain error" in str(e).lower():
-                self.show_error(self.error_messages["domain_error"])
-            else:
-                self.show_error(self.error_messages["invalid_input"])
-        except OverflowError:
-            self.show_error(self.error_messages["overflow"])
+            result, formatted_result = self.engine.calculate(self.expression)
         except Exception as e:
-            self.show_error(self.error_messages["math_error"])
-    
-    def prepare_expression(self) -> str:
-        """
-        Prepare the expression for evaluation by replacing custom functions.
-        
-        Returns:
-            str: The prepared expression
-        """
-        calc_expression = self.expression
-        
-        # Replace custom functions
-        calc_expression = calc_expression.replace('sin(', 'sin(')
-        calc_expression = calc_expression.replace('cos(', 'cos(')
-        calc_expression = calc_expression.replace('tan(', 'tan(')
-        calc_expression = calc_expression.replace('ln(', 'ln(')
-        calc_expression = calc_expression.replace('lg(', 'lg(')
-        calc_expression = calc_expression.replace('sqrt(', 'sqrt(')
-        calc_expression = calc_expression.replace('sin⁻¹(', 'sin⁻¹(')
-        calc_expression = calc_expression.replace('cos⁻¹(', 'cos⁻¹(')
-        calc_expression = calc_expression.replace('tan⁻¹(', 'tan⁻¹(')
-        
-        # Handle factorial
-        calc_expression = self.handle_factorial(calc_expression)
-        
-        return calc_expression
-    
-    def handle_factorial(self, expression: str) -> str:
-        """
-        Handle factorial operations in the expression.
-        
-        Args:
-            expression: The expression containing factorial operations
-            
-        Returns:
-            str: The expression with factorial operations converted
-        """
-        # Simple factorial handling - can be improved
-        if '!' in expression:
-            # This is a simplified approach
-            parts = expression.split('!')
-            if len(parts) == 2:
-                number_part = parts[0]
-                # Extract the last number
-                import re
-                match = re.search(r'(\d+)$', number_part)
-                if match:
-                    num = match.group(1)
-                    expression = expression.replace(f'{num}!', f'factorial({num})')
-        
-        return expression
-    
-    def safe_sin(self, x: float) -> float:
-        """Safe sine function with angle mode support."""
-        if self.angle_mode == "deg":
-            x = math.radians(x)
-        return math.sin(x)
-    
-    def safe_cos(self, x: float) -> float:
-        """Safe cosine function with angle mode support."""
-        if self.angle_mode == "deg":
-            x = math.radians(x)
-        return math.cos(x)
-    
-    def safe_tan(self, x: float) -> float:
-        """Safe tangent function with angle mode support."""
-        if self.angle_mode == "deg":
-            x = math.radians(x)
-        return math.tan(x)
-    
-    def safe_ln(self, x: float) -> float:
-        """Safe natural logarithm function."""
-        if x <= 0:
-            raise ValueError("Math domain error")
-        return math.log(x)
-    
-    def safe_lg(self, x: float) -> float:
-        """Safe base-10 logarithm function."""
-        if x <= 0:
-            raise ValueError("Math domain error")
-        return math.log10(x)
-    
-    def safe_sqrt(self, x: float) -> float:
-        """Safe square root function."""
-        if x < 0:
-            raise ValueError("Math domain error")
-        return math.sqrt(x)
-    
-    def safe_factorial(self, x: float) -> float:
-        """Safe factorial function."""
-        if x < 0 or x != int(x):
-            raise ValueError("Math domain error")
-        return math.factorial(int(x))
-    
-    def safe_asin(self, x: float) -> float:
-        """Safe arcsine function with angle mode support."""
-        if x < -1 or x > 1:
-            raise ValueError("Math domain error")
-        result = math.asin(x)
-        if self.angle_mode == "deg":
-            result = math.degrees(result)
-        return result
-
-    def safe_acos(self, x: float) -> float:
-        """Safe arccosine function with angle mode support."""
-        if x < -1 or x > 1:
-            raise ValueError("Math domain error")
-        result = math.acos(x)
-        if self.angle_mode == "deg":
-            result = math.degrees(result)
-        return result
-
-    def safe_atan(self, x: float) -> float:
-        """Safe arctangent function with angle mode support."""
-        result = math.atan(x)
-        if self.angle_mode == "deg":
-            result = math.degrees(result)
-        return result
-    
-    def format_result(self, result: float) -> str:
-        """
-        Format the result for display.
+            self.show_error(self.engine.error_message(e))
+            return
         
-        Args:
-            result: The calculation result
-            
-        Returns:
-            str: The formatted result
-        """
-        if isinstance(result, (int, float)):
-            if abs(result) > 1e15:
-                return f"{result:.4e}"
-            elif abs(result) < 1e-10 and result != 0:
-                return f"{result:.4e}"
-            elif result == int(result):
-                return str(int(result))
-            else:
-                # Format with appropriate decimal places
-                formatted = f"{result:.10f}".rstrip('0').rstrip('.')
-                return formatted
-        return str(result)
+        # Update display
+        self.result_var.set(formatted_result)
+        self.expression_var.set(self.expression)
+        self.expression = self.engine.result_text(result)
+        self.last_was_equals = True
+        self.last_was_operator = False
     
     def update_display(self) -> None:
         """Update the calculator display."""
@@ -713,20 +546,9 @@ class Calculator:
         self.last_was_equals = False
         self.last_was_operator = False
     
-    def add_to_history(self, calculation: str) -> None:
-        """
-        Add a calculation to the history.
-        
-        Args:
-            calculation: The calculation to add to history
-        """
-        self.history.append(calculation)
-        if len(self.history) > self.max_history:
-            self.history.pop(0)
-    
     def show_history(self) -> None:
         """Show the calculation history in a popup window."""
-        if not self.history:
+        if not self.engine.history:
             messagebox.showinfo("History", "No calculations in history")
             return
         
@@ -754,8 +576,8 @@ class Calculator:
         scrollbar.config(command=text_widget.yview)
         
         # Add history items
-        for i, calc in enumerate(reversed(self.history)):
-            text_widget.insert(tk.END, f"{len(self.history) - i}. {calc}\n")
+        for i, calc in enumerate(reversed(self.engine.history)):
+            text_widget.insert(tk.END, f"{len(self.engine.history) - i}. {calc}\n")
         
         text_widget.config(state=tk.DISABLED)
         
@@ -766,14 +588,10 @@ class Calculator:
             font=('Arial', 10),
             bg='#ff4444',
             fg='white',
-            command=lambda: (self.clear_history(), history_window.destroy())
+            command=lambda: (self.engine.clear_history(), history_window.destroy())
         )
         clear_btn.pack(pady=5)
     
-    def clear_history(self) -> None:
-        """Clear the calculation history."""
-        self.history.clear()
-    
     def show(self) -> None:
         """Show the calculator interface."""
         self.frame.pack(fill=tk.BOTH, expand=True)
@@ -0,0 +1,389 @@
+"""
+Headless calculator core: evaluation, angle mode and history.
+
+Nothing here imports Tk, so expressions can be evaluated in scripts,
+servers and tests. The Tk ``Calculator`` is a view over this engine.
+"""
+import math
+from decimal import Decimal, InvalidOperation, Overflow, localcontext
+from fractions import Fraction
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from ExpressionParser import ExpressionError, compile_expression, factorial
+from NumberModes import NUMBER_MODES, decimal_context, evaluate_in_mode
+
+# Results that are ints are shown in full up to this size.
+MAX_PLAIN_INT = 10 ** 15
+
+# Ints with more digits are handed back to the expression in scientific
+# notation (10 significant digits) rather than converted to text in full.
+MAX_EXACT_TEXT_DIGITS = 4000
+
+
+class Result(NamedTuple):
+    """The outcome of one expression in :meth:`CalculatorEngine.evaluate_many`."""
+    value: Optional[Union[int, float, Decimal, Fraction]]
+    error: Optional[str]  # user-facing message, None on success
+
+
+class CalculatorEngine:
+    """
+    Scientific calculator state and evaluation without any UI.
+    """
+
+    def __init__(self, angle_mode: str = "deg", max_history: int = 20,
+                 number_mode: str = "float", precision: int = 50):
+        """
+        Initialize the engine.
+
+        Args:
+            angle_mode: "deg" or "rad", used by the trigonometric functions
+            max_history: Number of calculations kept in the history
+            number_mode: "float", "decimal" (``precision`` significant
+                digits) or "fraction" (exact rationals)
+            precision: Significant digits in decimal mode
+        """
+        self.angle_mode = angle_mode
+        self.number_mode = number_mode
+        self.precision = precision
+        self.history: List[str] = []
+        self.max_history = max_history
+
+        # Error messages for better user experience
+        self.error_messages = {
+            "division_by_zero": "Cannot divide by zero",
+            "invalid_input": "Invalid input",
+            "math_error": "Mathematical error",
+            "overflow": "Number too large",
+            "domain_error": "Invalid domain for function"
+        }
+
+        # Implementations of the functions an expression can call
+        self.functions = {
+            "sin": self.safe_sin,
+            "cos": self.safe_cos,
+            "tan": self.safe_tan,
+            "ln": self.safe_ln,
+            "lg": self.safe_lg,
+            "sqrt": self.safe_sqrt,
+            "factorial": self.safe_factorial,
+            "sin⁻¹": self.safe_asin,
+            "cos⁻¹": self.safe_acos,
+            "tan⁻¹": self.safe_atan
+        }
+
+    def toggle_angle_mode(self) -> str:
+        """
+        Switch between degrees and radians.
+
+        Returns:
+            str: The new angle mode
+        """
+        self.angle_mode = "rad" if self.angle_mode == "deg" else "deg"
+        return self.angle_mode
+
+    def cycle_number_mode(self) -> str:
+        """
+        Switch to the next of float, decimal and fraction mode.
+
+        Returns:
+            str: The new number mode
+        """
+        index = NUMBER_MODES.index(self.number_mode)
+        self.number_mode = NUMBER_MODES[(index + 1) % len(NUMBER_MODES)]
+        return self.number_mode
+
+    def evaluate(self, expression: str, **variables: Union[int, float]) -> Union[int, float]:
+        """
+        Evaluate an expression in the current angle and number mode.
+
+        Args:
+            expression: The expression, e.g. "2*sin(30)"
+            **variables: Values for names used in the expression, e.g. x=2
+
+        Returns:
+            The result; ints stay exact. A Decimal in decimal mode, a
+            Fraction in fraction mode (a float after an inexact function).
+
+        Raises:
+            ExpressionError: If the expression is not valid
+            ArithmeticError, ValueError: If the calculation itself fails
+        """
+        if self.number_mode != "float":
+            return evaluate_in_mode(expression, variables, self.number_mode, self.precision,
+                                    self.angle_mode, self.functions)
+        if variables:
+            compiled = compile_expression(expression, tuple(sorted(variables)))
+            return compiled({**self.functions, **variables})
+        return compile_expression(expression)(self.functions)
+
+    def calculate(self, expression: str) -> Tuple[Union[int, float, Decimal, Fraction], str]:
+        """
+        Evaluate an expression, format it and record it in the history.
+
+        Args:
+            expression: The expression to calculate
+
+        Returns:
+            Tuple: The result and its formatted display text
+
+        Raises:
+            The same exceptions as :meth:`evaluate`; see :meth:`error_message`
+        """
+        result = self.evaluate(expression)
+        formatted_result = self.format_result(result)
+        self.add_to_history(f"{expression} = {formatted_result}")
+        return result, formatted_result
+
+    def evaluate_many(self, expressions: Iterable[str]) -> Iterator[Result]:
+        """
+        Evaluate expressions one after another, without touching the history.
+
+        Results are yielded lazily, so any number of expressions can be
+        streamed through. A failing expression yields its error message
+        instead of stopping the run.
+
+        Args:
+            expressions: The expressions to evaluate
+
+        Returns:
+            Iterator: One Result per expression, in order
+        """
+        if self.number_mode != "float":
+            for expression in expressions:
+                try:
+                    yield Result(self.evaluate(expression), None)
+                except Exception as e:
+                    yield Result(None, self.error_message(e))
+            return
+        compile_cached = compile_expression
+        functions = self.functions
+        for expression in expressions:
+            try:
+                yield Result(compile_cached(expression)(functions), None)
+            except Exception as e:
+                yield Result(None, self.error_message(e))
+
+    def evaluate_array(self, expression: str, masked: bool = False, **arrays):
+        """
+        Evaluate an expression element-wise over NumPy arrays.
+
+        Much faster than calling :meth:`evaluate` per element when tabulating
+        a function. Elements where the calculation fails are NaN, or masked
+        with ``masked=True``, instead of raising. Requires NumPy.
+
+        Args:
+            expression: The expression, e.g. "sin(x)^2+ln(x)"
+            masked: Return a masked array instead of NaNs
+            **arrays: Arrays for the names used in the expression, e.g.
+                x=numpy.linspace(0, 360, 1000)
+
+        Returns:
+            ndarray: The results, broadcast to the arrays' shape
+
+        Raises:
+            ExpressionError: If the expression is not valid
+            ImportError: If NumPy is not installed
+        """
+        try:
+            from VectorEvaluator import evaluate_vectorized
+        except ImportError as e:
+            raise ImportError("evaluate_array needs NumPy: pip install numpy") from e
+        return evaluate_vectorized(expression, arrays, self.angle_mode, masked)
+
+    def error_message(self, error: Exception) -> str:
+        """
+        Translate an evaluation error into a message for the user.
+
+        Args:
+            error: The exception raised by :meth:`evaluate`
+
+        Returns:
+            str: The message to display
+        """
+        if isinstance(error, ExpressionError):
+            return error.message
+        if isinstance(error, ZeroDivisionError):
+            return self.error_messages["division_by_zero"]
+        if isinstance(error, (OverflowError, Overflow)):
+            return self.error_messages["overflow"]
+        if isinstance(error, InvalidOperation):
+            return self.error_messages["domain_error"]
+        if isinstance(error, ValueError):
+            if "math domain error" in str(error).lower():
+                return self.error_messages["domain_error"]
+            return self.error_messages["invalid_input"]
+        return self.error_messages["math_error"]
+
+    def safe_sin(self, x: float) -> float:
+        """Safe sine function with angle mode support."""
+        if self.angle_mode == "deg":
+            x = math.radians(x)
+        return math.sin(x)
+
+    def safe_cos(self, x: float) -> float:
+        """Safe cosine function with angle mode support."""
+        if self.angle_mode == "deg":
+            x = math.radians(x)
+        return math.cos(x)
+
+    def safe_tan(self, x: float) -> float:
+        """Safe tangent function with angle mode support."""
+        if self.angle_mode == "deg":
+            x = math.radians(x)
+        return math.tan(x)
+
+    def safe_ln(self, x: float) -> float:
+        """Safe natural logarithm function."""
+        if x <= 0:
+            raise ValueError("Math domain error")
+        return math.log(x)
+
+    def safe_lg(self, x: float) -> float:
+        """Safe base-10 logarithm function."""
+        if x <= 0:
+            raise ValueError("Math domain error")
+        return math.log10(x)
+
+    def safe_sqrt(self, x: float) -> float:
+        """Safe square root function."""
+        if x < 0:
+            raise ValueError("Math domain error")
+        return math.sqrt(x)
+
+    def safe_factorial(self, x: float) -> float:
+        """Safe factorial function; Gamma(x + 1) for non-integers."""
+        return factorial(x)
+
+    def safe_asin(self, x: float) -> float:
+        """Safe arcsine function with angle mode support."""
+        if x < -1 or x > 1:
+            raise ValueError("Math domain error")
+        result = math.asin(x)
+        if self.angle_mode == "deg":
+            result = math.degrees(result)
+        return result
+
+    def safe_acos(self, x: float) -> float:
+        """Safe arccosine function with angle mode support."""
+        if x < -1 or x > 1:
+            raise ValueError("Math domain error")
+        result = math.acos(x)
+        if self.angle_mode == "deg":
+            result = math.degrees(result)
+        return result
+
+    def safe_atan(self, x: float) -> float:
+        """Safe arctangent function with angle mode support."""
+        result = math.atan(x)
+        if self.angle_mode == "deg":
+            result = math.degrees(result)
+        return result
+
+    def format_result(self, result: Union[int, float, Decimal, Fraction]) -> str:
+        """
+        Format the result for display.
+        
+        Huge ints are shown in scientific notation worked out from their
+        logarithm, so they are never converted to text in full.
+
+        Args:
+            result: The calculation result
+
+        Returns:
+            str: The formatted result
+        """
+        if isinstance(result, Fraction):
+            if result.denominator == 1:
+                return self.format_result(result.numerator)
+            if max(abs(result.numerator), result.denominator) < MAX_PLAIN_INT:
+                return f"{result.numerator}/{result.denominator}"
+            try:
+                return self.format_result(float(result))
+            except OverflowError:
+                return self.format_scientific(
+                    math.log10(abs(result.numerator)) - math.log10(result.denominator),
+                    result < 0)
+        if isinstance(result, Decimal):
+            if result.is_zero():
+                return "0"
+            with localcontext(decimal_context(self.precision)):
+                result = result.normalize()
+                if -10 <= result.adjusted() < self.precision:
+                    return f"{result:f}"
+                return f"{result:e}"
+        if isinstance(result, int):
+            if -MAX_PLAIN_INT <= result <= MAX_PLAIN_INT:
+                return str(result)
+            return self.format_scientific(math.log10(abs(result)), result < 0)
+        if isinstance(result, float):
+            if abs(result) > 1e15:
+                return f"{result:.4e}"
+            elif abs(result) < 1e-10 and result != 0:
+                return f"{result:.4e}"
+            elif result == int(result):
+                return str(int(result))
+            else:
+                # Format with appropriate decimal places
+                formatted = f"{result:.10f}".rstrip('0').rstrip('.')
+                return formatted
+        return str(result)
+
+    def format_scientific(self, log10: float, negative: bool = False, digits: int = 5) -> str:
+        """
+        Scientific notation for a number given by its base-10 logarithm.
+
+        Args:
+            log10: log10 of the number's magnitude
+            negative: Whether the number is negative
+            digits: Significant digits to show
+
+        Returns:
+            str: e.g. "1.2346e+2567"
+        """
+        exponent = math.floor(log10)
+        mantissa = round(10 ** (log10 - exponent), digits - 1)
+        if mantissa >= 10:
+            mantissa /= 10
+            exponent += 1
+        sign = "-" if negative else ""
+        return f"{sign}{mantissa:.{digits - 1}f}e{exponent:+d}"
+
+    def result_text(self, result: Union[int, float, Decimal, Fraction]) -> str:
+        """
+        The result as expression text, to calculate on with.
+
+        Exact except for ints longer than ``MAX_EXACT_TEXT_DIGITS``, which
+        continue rounded to 10 significant digits.
+
+        Args:
+            result: The calculation result
+
+        Returns:
+            str: Text the parser reads back as the result
+        """
+        if isinstance(result, Fraction):
+            if result.denominator == 1:
+                return self.result_text(result.numerator)
+            if max(abs(result.numerator), result.denominator) >= 10 ** MAX_EXACT_TEXT_DIGITS:
+                return self.format_scientific(
+                    math.log10(abs(result.numerator)) - math.log10(result.denominator),
+                    result < 0, digits=10)
+        if isinstance(result, int) and abs(result) >= 10 ** MAX_EXACT_TEXT_DIGITS:
+            return self.format_scientific(math.log10(abs(result)), result < 0, digits=10)
+        return str(result)
+
+    def add_to_history(self, calculation: str) -> None:
+        """
+        Add a calculation to the history.
+
+        Args:
+            calculation: The calculation to add to history
+        """
+        self.history.append(calculation)
+        if len(self.history) > self.max_history:
+            self.history.pop(0)
+
+    def clear_history(self) -> None:
+        """Clear the calculation history."""
+        self.history.clear()
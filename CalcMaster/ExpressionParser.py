@@ -0,0 +1,402 @@
+"""
+Tokenizer, parser and compiler for calculator expressions.
+
+Expressions are parsed with a Pratt (top-down operator precedence) parser
+into a small AST, which is then compiled into nested Python closures.
+Compiling is done once per distinct expression text and cached, so
+evaluating the same expression again only runs the closures. Nothing is
+ever passed to ``eval``.
+
+Grammar, loosest binding first (the same precedence as Python):
+
+    + -          binary, left-associative
+    * / %        binary, left-associative (× and ÷ are accepted too)
+    + -          unary prefix
+    ** ^         power, right-associative; the exponent may be signed
+    !            postfix factorial
+    f(x)         function call, (x) grouping, numbers, constants
+"""
+import math
+import operator
+import re
+from decimal import Decimal
+from fractions import Fraction
+from functools import lru_cache
+from typing import Callable, List, Mapping, NamedTuple, Optional, Tuple, Union
+
+
+class ExpressionError(ValueError):
+    """A syntax error in an expression, with the position it was found at."""
+
+    def __init__(self, message: str, position: int):
+        super().__init__(f"{message} at position {position}")
+        self.message = message
+        self.position = position
+
+
+class Token(NamedTuple):
+    kind: str  # 'number', 'name', 'op' or 'end'
+    text: str
+    position: int
+
+
+class Number(NamedTuple):
+    value: Union[int, float]
+    text: str
+
+
+class Constant(NamedTuple):
+    name: str
+
+
+class Variable(NamedTuple):
+    name: str
+
+
+class Unary(NamedTuple):
+    op: str
+    operand: tuple
+
+
+class Binary(NamedTuple):
+    op: str
+    left: tuple
+    right: tuple
+
+
+class Postfix(NamedTuple):
+    op: str
+    operand: tuple
+
+
+class Call(NamedTuple):
+    name: str
+    argument: tuple
+
+
+# Functions the calculator provides; all take one argument.
+FUNCTIONS = frozenset({
+    'sin', 'cos', 'tan', 'sin⁻¹', 'cos⁻¹', 'tan⁻¹', 'ln', 'lg', 'sqrt', 'factorial',
+})
+
+CONSTANTS = {'pi': math.pi, 'π': math.pi, 'e': math.e}
+
+# Display spellings of operators.
+OPERATOR_ALIASES = {'^': '**', '×': '*', '÷': '/'}
+
+TOKEN_RE = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<name>[A-Za-z_][A-Za-z_0-9]*(?:⁻¹)?|π)
+  | (?P<op>\*\*|[-+*/%^!()×÷])
+""", re.VERBOSE)
+
+# Exact (int and Fraction) results are capped at this many digits; larger
+# ones take long enough to compute and print to freeze the UI.
+MAX_INT_DIGITS = 100_000
+
+# Left binding powers of infix and postfix operators.
+BINDING_POWER = {'+': 10, '-': 10, '*': 20, '/': 20, '%': 20, '**': 40, '!': 50}
+
+# Unary minus binds looser than ** (-2**2 == -4) but tighter than * and /.
+UNARY_POWER = 30
+
+
+def tokenize(text: str) -> List[Token]:
+    """
+    Split an expression into tokens.
+
+    Raises:
+        ExpressionError: On a character that cannot start a token
+    """
+    tokens = []
+    position = 0
+    while position < len(text):
+        match = TOKEN_RE.match(text, position)
+        if match is None:
+            raise ExpressionError(f"Unexpected character '{text[position]}'", position)
+        kind = match.lastgroup
+        if kind != 'space':
+            value = match.group()
+            if kind == 'op':
+                value = OPERATOR_ALIASES.get(value, value)
+            tokens.append(Token(kind, value, position))
+        position = match.end()
+    tokens.append(Token('end', '', len(text)))
+    return tokens
+
+
+class Parser:
+    """Pratt parser over the tokens of one expression."""
+
+    def __init__(self, text: str, variables: Tuple[str, ...] = ()):
+        self.tokens = tokenize(text)
+        self.variables = variables
+        self.index = 0
+
+    def peek(self) -> Token:
+        return self.tokens[self.index]
+
+    def advance(self) -> Token:
+        token = self.tokens[self.index]
+        self.index += 1
+        return token
+
+    def parse(self) -> tuple:
+        """Parse the whole expression; trailing tokens are an error."""
+        node = self.expression(0)
+        token = self.peek()
+        if token.kind != 'end':
+            raise ExpressionError(f"Unexpected '{token.text}'", token.position)
+        return node
+
+    def expression(self, right_power: int) -> tuple:
+        left = self.prefix(self.advance())
+        while True:
+            token = self.peek()
+            power = BINDING_POWER.get(token.text, 0) if token.kind == 'op' else 0
+            if power <= right_power:
+                return left
+            self.advance()
+            left = self.infix(token, left)
+
+    def prefix(self, token: Token) -> tuple:
+        if token.kind == 'number':
+            text = token.text
+            if '.' not in text and 'e' not in text and 'E' not in text:
+                return Number(int(text), text)
+            value = float(text)
+            if math.isinf(value):
+                # Too large for a float, e.g. a huge result formatted as
+                # "1.2346e+2567" and calculated with again: keep it exact.
+                exact = Decimal(text)
+                if exact.adjusted() >= MAX_INT_DIGITS:
+                    raise OverflowError("Number too large")
+                value = int(exact)
+            return Number(value, text)
+        if token.kind == 'name':
+            if self.peek().text == '(':
+                if token.text not in FUNCTIONS:
+                    raise ExpressionError(f"Unknown function '{token.text}'", token.position)
+                opening = self.advance()
+                return Call(token.text, self.group(opening))
+            if token.text in self.variables:
+                return Variable(token.text)
+            if token.text in FUNCTIONS:
+                raise ExpressionError(f"Missing '(' after '{token.text}'", token.position)
+            if token.text not in CONSTANTS:
+                raise ExpressionError(f"Unknown name '{token.text}'", token.position)
+            return Constant(token.text)
+        if token.text in ('-', '+'):
+            return Unary(token.text, self.expression(UNARY_POWER))
+        if token.text == '(':
+            return self.group(token)
+        if token.kind == 'end':
+            raise ExpressionError("Unexpected end of expression", token.position)
+        raise ExpressionError(f"Unexpected '{token.text}'", token.position)
+
+    def infix(self, token: Token, left: tuple) -> tuple:
+        if token.text == '!':
+            return Postfix('!', left)
+        power = BINDING_POWER[token.text]
+        if token.text == '**':
+            # Right-associative: 2**3**2 == 2**(3**2).
+            power -= 1
+        return Binary(token.text, left, self.expression(power))
+
+    def group(self, opening: Token) -> tuple:
+        """The expression after ``opening`` up to its closing bracket."""
+        node = self.expression(0)
+        token = self.advance()
+        if token.text != ')':
+            if token.kind == 'end':
+                raise ExpressionError("Missing ')'", opening.position)
+            raise ExpressionError(f"Unexpected '{token.text}'", token.position)
+        return node
+
+
+def exact_size(value) -> int:
+    """The largest of an int's or a Fraction's parts, 0 for other numbers."""
+    if isinstance(value, int):
+        return abs(value)
+    if isinstance(value, Fraction):
+        return max(abs(value.numerator), value.denominator)
+    return 0
+
+
+def power(base, exponent):
+    """
+    ``base ** exponent`` without Python's silent switch to complex numbers.
+
+    Exact powers whose result would have more than ``MAX_INT_DIGITS``
+    digits raise OverflowError up front instead of freezing the caller
+    while Python computes them.
+    """
+    if isinstance(exponent, Fraction) and exponent.denominator == 1:
+        exponent = exponent.numerator
+    if isinstance(exponent, int) and exponent > 0:
+        size = exact_size(base)
+        if size > 1 and exponent * math.log10(size) > MAX_INT_DIGITS:
+            raise OverflowError("Number too large")
+    result = base ** exponent
+    if isinstance(result, complex):
+        raise ValueError("Math domain error")
+    return result
+
+
+# 0! to 170! exactly: every factorial a float can also represent.
+FACTORIAL_TABLE = [1]
+for _n in range(1, 171):
+    FACTORIAL_TABLE.append(FACTORIAL_TABLE[-1] * _n)
+del _n
+
+
+@lru_cache(maxsize=32)
+def _large_factorial(n: int) -> int:
+    # CPython's math.factorial is already the fast algorithm in C: the odd
+    # part is built by binary splitting and the power of two is shifted in.
+    return math.factorial(n)
+
+
+def factorial(x):
+    """
+    ``x!``: exact for non-negative integers, Gamma(x + 1) for other numbers.
+
+    Small factorials come from a table and large ones are memoized, so
+    repeating ``1000!`` costs a dictionary lookup.
+
+    Raises:
+        ValueError: For negative integers, where Gamma has poles
+        OverflowError: If the result would have more than
+            ``MAX_INT_DIGITS`` digits (or overflow a float)
+    """
+    if x == int(x):
+        n = int(x)
+        if n < 0:
+            raise ValueError("Math domain error")
+        if n < len(FACTORIAL_TABLE):
+            return FACTORIAL_TABLE[n]
+        if math.lgamma(n + 1) / math.log(10) > MAX_INT_DIGITS:
+            raise OverflowError("Number too large")
+        return _large_factorial(n)
+    return math.gamma(float(x) + 1)
+
+
+BINARY_OPERATORS = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': operator.truediv,
+    '%': operator.mod,
+    '**': power,
+}
+
+UNARY_OPERATORS = {'-': operator.neg, '+': operator.pos}
+
+# Called with a mapping of the function names to callables and of the
+# variable names to values.
+Compiled = Callable[[Mapping[str, object]], Union[int, float]]
+
+# Marks a subexpression whose value is not known at compile time.
+_DYNAMIC = object()
+
+
+def compile_node(node: tuple, operators: Mapping[str, Callable] = BINARY_OPERATORS,
+                 literal: Optional[Callable[[str], object]] = None,
+                 constants: Mapping[str, object] = CONSTANTS) -> Tuple[Compiled, object]:
+    """
+    Compile ``node`` into ``(closure, constant)``.
+
+    ``constant`` is the node's value when it does not depend on the names
+    passed at evaluation time, so operators over constants are folded once
+    here instead of on every evaluation.
+
+    Args:
+        node: An AST from :func:`parse`
+        operators: Implementations of the binary operators
+        literal: Converts a number's source text to its value; by default
+            the int or float the parser read
+        constants: Values of the named constants
+
+    Returns:
+        Tuple: The closure and the constant value, or ``_DYNAMIC``
+    """
+    def build(node: tuple) -> Tuple[Compiled, object]:
+        if isinstance(node, Number):
+            value = literal(node.text) if literal else node.value
+            return (lambda names: value), value
+        if isinstance(node, Constant):
+            value = constants[node.name]
+            return (lambda names: value), value
+        if isinstance(node, Variable):
+            name = node.name
+            return (lambda names: names[name]), _DYNAMIC
+        if isinstance(node, Unary):
+            op = UNARY_OPERATORS[node.op]
+            operand, constant = build(node.operand)
+            if constant is not _DYNAMIC:
+                folded = _fold(op, constant)
+                if folded:
+                    return folded
+            return (lambda names: op(operand(names))), _DYNAMIC
+        if isinstance(node, Binary):
+            op = operators[node.op]
+            left, left_constant = build(node.left)
+            right, right_constant = build(node.right)
+            if left_constant is not _DYNAMIC and right_constant is not _DYNAMIC:
+                folded = _fold(op, left_constant, right_constant)
+                if folded:
+                    return folded
+            return (lambda names: op(left(names), right(names))), _DYNAMIC
+        if isinstance(node, Postfix):
+            operand, _ = build(node.operand)
+            return (lambda names: names['factorial'](operand(names))), _DYNAMIC
+        if isinstance(node, Call):
+            name = node.name
+            argument, _ = build(node.argument)
+            return (lambda names: names[name](argument(names))), _DYNAMIC
+        raise TypeError(f"Unknown node {node!r}")
+
+    return build(node)
+
+
+def _fold(op, *values):
+    """``(closure, value)`` for ``op(*values)``; None if it raises, so the error surfaces at evaluation."""
+    try:
+        value = op(*values)
+    except (ArithmeticError, ValueError):
+        return None
+    return (lambda names: value), value
+
+
+@lru_cache(maxsize=1024)
+def parse(text: str, variables: Tuple[str, ...] = ()) -> tuple:
+    """
+    Parse an expression into its AST.
+
+    Args:
+        text: The expression
+        variables: Names that may appear besides functions and constants
+
+    Raises:
+        ExpressionError: If the expression is not valid
+    """
+    return Parser(text, variables).parse()
+
+
+@lru_cache(maxsize=1024)
+def compile_expression(text: str, variables: Tuple[str, ...] = ()) -> Compiled:
+    """
+    Compile an expression into a function of the calculator's functions.
+
+    The result is called with a mapping from the names in ``FUNCTIONS`` to
+    callables (and from ``variables`` to values), e.g.
+    ``compile_expression('sin(30)*2')({'sin': ..., ...})``. Compiled
+    expressions are cached by their text.
+
+    Raises:
+        ExpressionError: If the expression is not valid
+    """
+    closure, _ = compile_node(parse(text, variables))
+    return closure
+
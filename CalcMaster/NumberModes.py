@@ -0,0 +1,348 @@
+"""
+Decimal and Fraction calculation modes.
+
+In "decimal" mode number literals are read as ``decimal.Decimal`` and
+every operation and function is carried out to a configurable number of
+significant digits, so ``0.1+0.2`` is exactly ``0.3``. In "fraction" mode
+literals are exact ``fractions.Fraction``s: ``1/3*3`` is exactly 1 and
+``1/3`` displays as ``1/3``. Functions without exact rational results
+(sin, ln, ...) fall back to floats there.
+
+Both modes reuse the parser and compiler in ExpressionParser; only the
+literals, constants, operators and functions differ.
+"""
+import math
+from decimal import (Context, Decimal, DivisionByZero, InvalidOperation, Overflow,
+                     ROUND_FLOOR, getcontext, localcontext)
+from fractions import Fraction
+from functools import lru_cache
+from typing import Callable, Dict, Mapping, Tuple
+
+from ExpressionParser import (BINARY_OPERATORS, Compiled, compile_node, factorial, parse,
+                              power)
+
+NUMBER_MODES = ("float", "decimal", "fraction")
+
+# Extra digits carried through a decimal calculation and rounded away at
+# the end, so sin(30) in degrees shows 0.5 rather than 0.4999...9.
+GUARD_DIGITS = 5
+
+# Largest decimal exponent in decimal mode; beyond it results overflow.
+DECIMAL_EMAX = 10 ** 9
+
+
+def decimal_context(precision: int) -> Context:
+    """A context for ``precision`` significant digits that raises on errors."""
+    return Context(prec=precision, Emax=DECIMAL_EMAX, Emin=-DECIMAL_EMAX,
+                   traps=[DivisionByZero, InvalidOperation, Overflow])
+
+
+def _decimal_mod(a, b):
+    # Floor modulo, like Python's % on floats (Decimal's % truncates).
+    a, b = Decimal(a), Decimal(b)
+    if b == 0:
+        raise ZeroDivisionError("Modulo by zero")
+    return a - b * (a / b).to_integral_value(ROUND_FLOOR)
+
+
+def _decimal_power(base, exponent):
+    # Decimal gives Infinity for 0 ** -n without signalling DivisionByZero,
+    # and 0 ** 0 is InvalidOperation; the other modes raise and give 1.
+    if base == 0 and exponent < 0:
+        raise ZeroDivisionError("Zero to a negative power")
+    if base == 0 and exponent == 0:
+        return Decimal(1)
+    try:
+        return power(base, exponent)
+    except InvalidOperation:
+        # e.g. a negative base with a fractional exponent
+        raise ValueError("Math domain error")
+
+
+DECIMAL_OPERATORS = {**BINARY_OPERATORS, '%': _decimal_mod, '**': _decimal_power}
+
+
+def decimal_pi() -> Decimal:
+    """Pi to the current context's precision."""
+    return _pi(getcontext().prec)
+
+
+@lru_cache(maxsize=8)
+def _pi(precision: int) -> Decimal:
+    # The recipe from the decimal module's documentation.
+    with localcontext(decimal_context(precision + 2)):
+        three = Decimal(3)
+        lasts, t, s, n, na, d, da = 0, three, 3, 1, 0, 0, 24
+        while s != lasts:
+            lasts = s
+            n, na = n + na, na + 8
+            d, da = d + da, da + 32
+            t = (t * n) / d
+            s += t
+    with localcontext(decimal_context(precision)):
+        return +s
+
+
+def _sin_cos(x: Decimal) -> Tuple[Decimal, Decimal]:
+    """sin(x) and cos(x) in radians, by Taylor series after reducing x to [-pi, pi]."""
+    with localcontext() as ctx:
+        working = ctx.prec + 2
+        # Reducing a large x needs digits for its integer part as well.
+        ctx.prec = working + max(0, x.adjusted())
+        pi = decimal_pi()
+        x = x % (2 * pi)
+        if x > pi:
+            x -= 2 * pi
+        elif x < -pi:
+            x += 2 * pi
+        ctx.prec = working
+        sin, cos = +x, Decimal(1)
+        sin_term, cos_term = sin, cos
+        n = 1
+        while True:
+            cos_term = -cos_term * x * x / (n * (n + 1))
+            sin_term = -sin_term * x * x / ((n + 1) * (n + 2))
+            if sin + sin_term == sin and cos + cos_term == cos:
+                break
+            sin += sin_term
+            cos += cos_term
+            n += 2
+    return +sin, +cos
+
+
+def _atan(x: Decimal) -> Decimal:
+    """arctan(x) in radians."""
+    with localcontext() as ctx:
+        ctx.prec += 4
+        if abs(x) > 1:
+            half_pi = decimal_pi() / 2
+            result = (half_pi if x > 0 else -half_pi) - _atan(1 / x)
+            return +result
+        # atan(x) = 2*atan(x / (1 + sqrt(1 + x^2))), twice, for fast convergence.
+        for _ in range(2):
+            x = x / (1 + (1 + x * x).sqrt())
+        result = term = x
+        n = 1
+        while True:
+            term = -term * x * x
+            n += 2
+            step = term / n
+            if result + step == result:
+                break
+            result += step
+        result *= 4
+    return +result
+
+
+def _check_unit_interval(x: Decimal) -> None:
+    if x < -1 or x > 1:
+        raise ValueError("Math domain error")
+
+
+def _asin(x: Decimal) -> Decimal:
+    _check_unit_interval(x)
+    if abs(x) == 1:
+        return decimal_pi() / 2 * x
+    with localcontext() as ctx:
+        ctx.prec += 2
+        result = _atan(x / (1 - x * x).sqrt())
+    return +result
+
+
+def _log_factorial(z: Decimal) -> Decimal:
+    """ln(z!) by Stirling's series; accurate when z^21 is far above 10^precision."""
+    # ln(z!) = z ln z - z + ln(2 pi z)/2 + 1/(12z) - 1/(360z^3) + ...
+    result = z * z.ln() - z + (2 * decimal_pi() * z).ln() / 2
+    for numerator, denominator, power_of_z in STIRLING_TERMS:
+        result += Decimal(numerator) / (denominator * z ** power_of_z)
+    return result
+
+
+def _factorial_decimal(x: Decimal) -> Decimal:
+    """
+    x! to the current precision; Gamma(x + 1) for non-integers.
+
+    Integers are exact until Stirling's series is accurate to the
+    precision, which makes e.g. 10^6! instant. Other numbers are shifted
+    up until the series is accurate and divided back down:
+    x! = (x + k)! / ((x + 1) (x + 2) ... (x + k)).
+    """
+    precision = getcontext().prec
+    # The first omitted term of the series is about 13.4 / z^21.
+    stirling_from = 10 ** ((precision + 2) / 21)
+    if x == x.to_integral_value():
+        if x < 0:
+            raise ValueError("Math domain error")
+        n = int(x)
+        digits = math.lgamma(n + 1) / math.log(10)
+        if digits <= STIRLING_MIN_DIGITS or n <= stirling_from:
+            return +Decimal(factorial(n))
+        with localcontext() as ctx:
+            # ln(n!) has about log10(n ln n) digits before the point.
+            ctx.prec += 10 + len(str(n))
+            result = _log_factorial(Decimal(n)).exp()
+        return +result
+    # Capped so a high precision cannot make the loop below run for ever;
+    # past about 80 digits non-integer factorials are accurate to ~80 digits.
+    shift = min(max(0, math.ceil(stirling_from - float(x))), MAX_GAMMA_SHIFT)
+    with localcontext() as ctx:
+        ctx.prec += 10 + len(str(int(abs(x)) + shift))
+        divisor = Decimal(1)
+        for k in range(1, shift + 1):
+            divisor *= x + k
+        result = _log_factorial(x + shift).exp() / divisor
+    return +result
+
+
+# Below this many digits n! is computed exactly; it is cheap there.
+STIRLING_MIN_DIGITS = 5000
+
+# Most factors a non-integer x! is shifted up by before using the series.
+MAX_GAMMA_SHIFT = 10_000
+
+# Terms B(2k) / (2k (2k-1) n^(2k-1)) of Stirling's series for ln(n!), as
+# (numerator, denominator, power of n).
+STIRLING_TERMS = (
+    (1, 12, 1), (-1, 360, 3), (1, 1260, 5), (-1, 1680, 7), (1, 1188, 9),
+    (-691, 360360, 11), (1, 156, 13), (-3617, 122400, 15), (43867, 244188, 17),
+    (-174611, 125400, 19),
+)
+
+
+# (sin, cos) at 0, 90, 180 and 270 degrees.
+EXACT_QUARTER_TURNS = (
+    (Decimal(0), Decimal(1)), (Decimal(1), Decimal(0)),
+    (Decimal(0), Decimal(-1)), (Decimal(-1), Decimal(0)),
+)
+
+
+@lru_cache(maxsize=2)
+def decimal_functions(angle_mode: str) -> Dict[str, Callable]:
+    """
+    The calculator's functions on Decimals for the given angle mode.
+
+    They work to the precision of the current decimal context and raise
+    ValueError("Math domain error") like the float functions.
+
+    Args:
+        angle_mode: "deg" or "rad"
+
+    Returns:
+        Dict: Function name to implementation
+    """
+    degrees = angle_mode == "deg"
+
+    def sin_cos(x):
+        x = Decimal(x)
+        if not degrees:
+            return _sin_cos(x)
+        # Multiples of 90 degrees are exact: cos(90) is 0, not 1E-55.
+        quarter = x / 90
+        if quarter == quarter.to_integral_value():
+            return EXACT_QUARTER_TURNS[int(quarter) % 4]
+        return _sin_cos(x * decimal_pi() / 180)
+
+    def from_radians(x):
+        return x * 180 / decimal_pi() if degrees else x
+
+    def tan(x):
+        sin, cos = sin_cos(x)
+        if cos == 0:
+            raise ValueError("Math domain error")
+        return sin / cos
+
+    def ln(x):
+        if x <= 0:
+            raise ValueError("Math domain error")
+        return Decimal(x).ln()
+
+    def lg(x):
+        if x <= 0:
+            raise ValueError("Math domain error")
+        return Decimal(x).log10()
+
+    def sqrt(x):
+        if x < 0:
+            raise ValueError("Math domain error")
+        return Decimal(x).sqrt()
+
+    def acos(x):
+        _check_unit_interval(Decimal(x))
+        return from_radians(decimal_pi() / 2 - _asin(Decimal(x)))
+
+    return {
+        "sin": lambda x: sin_cos(x)[0],
+        "cos": lambda x: sin_cos(x)[1],
+        "tan": tan,
+        "ln": ln,
+        "lg": lg,
+        "sqrt": sqrt,
+        "factorial": lambda x: _factorial_decimal(Decimal(x)),
+        "sin⁻¹": lambda x: from_radians(_asin(Decimal(x))),
+        "cos⁻¹": acos,
+        "tan⁻¹": lambda x: from_radians(_atan(Decimal(x))),
+    }
+
+
+def exact_sqrt(x):
+    """The square root of a Fraction, exact when it is rational, else a float."""
+    if x < 0:
+        raise ValueError("Math domain error")
+    x = Fraction(x)
+    numerator, denominator = math.isqrt(x.numerator), math.isqrt(x.denominator)
+    if numerator * numerator == x.numerator and denominator * denominator == x.denominator:
+        return Fraction(numerator, denominator)
+    return math.sqrt(x)
+
+
+@lru_cache(maxsize=256)
+def compile_in_mode(text: str, variables: Tuple[str, ...], mode: str, precision: int) -> Compiled:
+    """
+    Compile an expression for "decimal" or "fraction" mode.
+
+    Cached by text, variables, mode and precision (constants such as pi
+    are computed to the precision at compile time).
+
+    Raises:
+        ExpressionError: If the expression is not valid
+    """
+    node = parse(text, variables)
+    if mode == "fraction":
+        # Via Decimal, which reads "1.5e+5000" without a long int-to-str step.
+        closure, _ = compile_node(node, BINARY_OPERATORS, lambda text: Fraction(Decimal(text)))
+        return closure
+    with localcontext(decimal_context(precision + GUARD_DIGITS)):
+        pi = decimal_pi()
+        constants = {'pi': pi, 'π': pi, 'e': Decimal(1).exp()}
+        closure, _ = compile_node(node, DECIMAL_OPERATORS, Decimal, constants)
+    return closure
+
+
+def evaluate_in_mode(expression: str, variables: Mapping[str, object], mode: str,
+                     precision: int, angle_mode: str, float_functions: Mapping[str, Callable]):
+    """
+    Evaluate an expression in "decimal" or "fraction" mode.
+
+    Args:
+        expression: The expression
+        variables: Values for names used in the expression
+        mode: "decimal" or "fraction"
+        precision: Significant digits of decimal results
+        angle_mode: "deg" or "rad"
+        float_functions: The float implementations of the functions, used
+            by fraction mode where a result cannot be exact
+
+    Returns:
+        A Decimal, or a Fraction (a float once an inexact function is used)
+
+    Raises:
+        ExpressionError: If the expression is not valid
+        ArithmeticError, ValueError: If the calculation itself fails
+    """
+    compiled = compile_in_mode(expression, tuple(sorted(variables)), mode, precision)
+    if mode == "fraction":
+        return compiled({**float_functions, "sqrt": exact_sqrt, **variables})
+    with localcontext(decimal_context(precision + GUARD_DIGITS)):
+        result = compiled({**decimal_functions(angle_mode), **variables})
+    with localcontext(decimal_context(precision)):
+        return +Decimal(result)
@@ -0,0 +1,101 @@
+"""
+Throughput of CalculatorEngine.evaluate_many.
+
+Generates ``--count`` expressions in the shape the calculator produces
+(numbers, + - * / ^, brackets and function calls) from ``--distinct``
+templates, streams them through ``evaluate_many`` and, for comparison,
+through ``eval`` with the same functions the calculator used before it had
+a parser. Reports expressions per second as JSON.
+
+    python benchmarks/bench_evaluate.py --count 1000000 --distinct 500
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from CalculatorEngine import CalculatorEngine  # noqa: E402
+
+TEMPLATES = (
+    "{a}+{b}*{c}",
+    "({a}-{b})/{c}",
+    "sin({a})*cos({b})+tan({c})",
+    "sqrt({a})+ln({b})-lg({c})",
+    "{a}**2-{b}%{c}",
+    "-{a}**0.5*({b}+{c})",
+)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--count', type=int, default=1000000, help="expressions evaluated")
+    parser.add_argument('--distinct', type=int, default=500,
+                        help="distinct expression texts cycled through")
+    parser.add_argument('--baseline', type=int, default=100000,
+                        help="expressions evaluated with eval for comparison (0 to skip)")
+    parser.add_argument('--seed', type=int, default=1234, help="random seed")
+    parser.add_argument('--output', help="write JSON results here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def make_expressions(rng, distinct):
+    return [rng.choice(TEMPLATES).format(a=rng.randint(1, 999), b=rng.randint(1, 999),
+                                         c=round(rng.uniform(1, 99), 3))
+            for _ in range(distinct)]
+
+
+def stream(expressions, count):
+    for n in range(count):
+        yield expressions[n % len(expressions)]
+
+
+def timed(results):
+    started = time.perf_counter()
+    errors = sum(1 for result in results if result.error)
+    return time.perf_counter() - started, errors
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    expressions = make_expressions(random.Random(args.seed), args.distinct)
+    engine = CalculatorEngine()
+
+    elapsed, errors = timed(engine.evaluate_many(stream(expressions, args.count)))
+    results = {'engine': {'count': args.count, 'errors': errors,
+                          'per_second': round(args.count / elapsed)}}
+
+    if args.baseline:
+        names = dict(engine.functions, pi=3.141592653589793, e=2.718281828459045)
+        started = time.perf_counter()
+        for expression in stream(expressions, args.baseline):
+            try:
+                eval(expression, {"__builtins__": {}}, names)
+            except (ArithmeticError, ValueError):
+                pass
+        elapsed = time.perf_counter() - started
+        results['eval'] = {'count': args.baseline, 'per_second': round(args.baseline / elapsed)}
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'distinct': args.distinct,
+            'seed': args.seed,
+        },
+        'results': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            fh.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Time to calculate and display factorials.
+
+Runs ``CalculatorEngine.calculate`` on ``n!`` for each n in ``--sizes``
+in every number mode, first with cold caches and then repeated, and
+reports the median milliseconds per call (parse, factorial and
+formatting together) as JSON.
+
+    python benchmarks/bench_factorial.py --sizes 10,170,1000,10000,20000
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ExpressionParser  # noqa: E402
+import NumberModes  # noqa: E402
+from CalculatorEngine import CalculatorEngine  # noqa: E402
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', default='10,170,1000,2.5,10000,20000,1000000',
+                        help="comma-separated arguments of ! (default: %(default)s)")
+    parser.add_argument('--repeat', type=int, default=50, help="warm calls per size")
+    parser.add_argument('--output', help="write JSON results here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def clear_caches():
+    for cached in (ExpressionParser.parse, ExpressionParser.compile_expression,
+                   ExpressionParser._large_factorial, NumberModes.compile_in_mode):
+        cached.cache_clear()
+
+
+def time_calculate(engine, expression, repeat):
+    clear_caches()
+    started = time.perf_counter()
+    try:
+        _, display = engine.calculate(expression)
+    except Exception as e:
+        return {'display': engine.error_message(e)}
+    cold = time.perf_counter() - started
+    warm = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        engine.calculate(expression)
+        warm.append(time.perf_counter() - started)
+    return {
+        'display': display,
+        'cold_ms': round(cold * 1000, 3),
+        'warm_median_ms': round(statistics.median(warm) * 1000, 4),
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = []
+    for mode in ("float", "decimal", "fraction"):
+        engine = CalculatorEngine(number_mode=mode)
+        for size in args.sizes.split(','):
+            result = {'mode': mode, 'expression': f"{size}!"}
+            result.update(time_calculate(engine, f"{size}!", args.repeat))
+            results.append(result)
+            print(json.dumps(result), file=sys.stderr)
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            fh.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
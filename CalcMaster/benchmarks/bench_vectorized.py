@@ -0,0 +1,94 @@
+"""
+Tabulating an expression over a range: evaluate_array vs per-element evaluate.
+
+Evaluates ``--expression`` for ``--points`` values of ``x`` spread over
+``--start``..``--stop`` with ``CalculatorEngine.evaluate_array`` (NumPy),
+and for ``--scalar-points`` of them with ``evaluate`` one value at a time,
+which is what calling ``calculate()`` per element amounts to. Checks that
+both agree and reports points per second and the speedup as JSON.
+Requires NumPy.
+
+    python benchmarks/bench_vectorized.py --points 10000000
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from CalculatorEngine import CalculatorEngine  # noqa: E402
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--expression', default="sin(x)^2+ln(x)*sqrt(x)-lg(x)/(x+1)",
+                        help="expression in x (default: %(default)s)")
+    parser.add_argument('--points', type=int, default=1000000, help="points for evaluate_array")
+    parser.add_argument('--scalar-points', type=int, default=100000,
+                        help="points for per-element evaluate")
+    parser.add_argument('--start', type=float, default=0.1, help="first x")
+    parser.add_argument('--stop', type=float, default=1000.0, help="last x")
+    parser.add_argument('--repeat', type=int, default=5, help="evaluate_array runs (best is kept)")
+    parser.add_argument('--output', help="write JSON results here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def evaluate_or_nan(engine, expression, value):
+    """``evaluate`` for one x, NaN where it raises (as evaluate_array reports it)."""
+    try:
+        return float(engine.evaluate(expression, x=value))
+    except (ArithmeticError, ValueError):
+        return math.nan
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    engine = CalculatorEngine()
+    x = np.linspace(args.start, args.stop, args.points)
+
+    best = math.inf
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        vectorized = engine.evaluate_array(args.expression, x=x)
+        best = min(best, time.perf_counter() - started)
+
+    step = max(1, args.points // args.scalar_points)
+    sample = x[::step][:args.scalar_points]
+    started = time.perf_counter()
+    scalar = [evaluate_or_nan(engine, args.expression, value) for value in sample.tolist()]
+    scalar_elapsed = time.perf_counter() - started
+    assert np.allclose(vectorized[::step][:len(scalar)], scalar, equal_nan=True)
+
+    vector_rate = args.points / best
+    scalar_rate = len(scalar) / scalar_elapsed
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'expression': args.expression,
+        },
+        'results': {
+            'evaluate_array': {'points': args.points, 'best_s': round(best, 4),
+                               'per_second': round(vector_rate)},
+            'evaluate': {'points': len(scalar), 'elapsed_s': round(scalar_elapsed, 4),
+                         'per_second': round(scalar_rate)},
+            'speedup': round(vector_rate / scalar_rate, 1),
+        },
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            fh.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
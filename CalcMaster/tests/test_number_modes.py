@@ -0,0 +1,53 @@
+import math
+
+import pytest
+
+from CalculatorEngine import CalculatorEngine
+from NumberModes import NUMBER_MODES
+
+
+def outcome(mode, expression):
+    """The value as a float, or the error message the display would show."""
+    engine = CalculatorEngine(number_mode=mode)
+    try:
+        return float(engine.evaluate(expression))
+    except Exception as error:
+        return engine.error_message(error)
+
+
+@pytest.mark.parametrize('expression', [
+    '0^-1', '0**-2', '0^-0.5', '(1-1)^(0-3)', '0^0', '0^2', '2^-2', '(0-8)^(1/3)', '1/0', '5%0',
+    '2.5!', '0.5!', '(3+2)!', '3!+4!', '2^3!', '-3!', '(0-1)!',
+])
+def test_modes_agree(expression):
+    outcomes = {mode: outcome(mode, expression) for mode in NUMBER_MODES}
+    expected = outcomes['float']
+    for mode, result in outcomes.items():
+        if isinstance(expected, float) and isinstance(result, float):
+            assert math.isclose(result, expected), mode
+        else:
+            assert result == expected, mode
+
+
+def test_zero_to_negative_power_is_division_by_zero():
+    for mode in NUMBER_MODES:
+        assert outcome(mode, '0^-1') == "Cannot divide by zero"
+
+
+def test_decimal_and_fraction_results_are_exact():
+    assert CalculatorEngine(number_mode='decimal').calculate('0.1+0.2')[1] == '0.3'
+    assert CalculatorEngine(number_mode='fraction').calculate('1/3')[1] == '1/3'
+    assert CalculatorEngine(number_mode='fraction').calculate('1/3*3')[1] == '1'
+
+
+@pytest.mark.parametrize('expression, expected', [
+    ('(3+2)!', 120), ('3!+4!', 30), ('2^3!', 64), ('-3!', -6),
+])
+def test_factorial_precedence(expression, expected):
+    for mode in NUMBER_MODES:
+        assert outcome(mode, expression) == expected, mode
+
+
+def test_non_integer_factorial_uses_gamma():
+    for mode in NUMBER_MODES:
+        assert math.isclose(outcome(mode, '2.5!'), 1.875 * math.sqrt(math.pi)), mode
@@ -0,0 +1,53 @@
+import pytest
+
+from ExpressionParser import (Binary, ExpressionError, Number, Postfix, Unary,
+                              compile_expression, parse)
+
+
+def n(value):
+    return Number(value, str(value))
+
+
+def test_multiplication_binds_tighter_than_addition():
+    assert parse('1+2*3') == Binary('+', n(1), Binary('*', n(2), n(3)))
+    assert parse('(1+2)*3') == Binary('*', Binary('+', n(1), n(2)), n(3))
+    assert parse('8-4-2') == Binary('-', Binary('-', n(8), n(4)), n(2))
+
+
+def test_power_is_right_associative():
+    assert parse('2^3^2') == Binary('**', n(2), Binary('**', n(3), n(2)))
+    assert parse('2**3^2') == parse('2^3^2')
+
+
+def test_unary_minus_binds_looser_than_power():
+    assert parse('-2^2') == Unary('-', Binary('**', n(2), n(2)))
+    assert parse('2^-2') == Binary('**', n(2), Unary('-', n(2)))
+    assert compile_expression('-2^2')({}) == -4
+
+
+def test_factorial_binds_tighter_than_power():
+    assert parse('2^3!') == Binary('**', n(2), Postfix('!', n(3)))
+
+
+@pytest.mark.parametrize('text, message, position', [
+    ('1+', "Unexpected end of expression", 2),
+    ('2*)', "Unexpected ')'", 2),
+    ('(1+2', "Missing ')'", 0),
+    ('1 2', "Unexpected '2'", 2),
+    ('3 $ 4', "Unexpected character '$'", 2),
+    ('sin 3', "Missing '(' after 'sin'", 0),
+    ('2*foo(2)', "Unknown function 'foo'", 2),
+    ('1+bar', "Unknown name 'bar'", 2),
+])
+def test_malformed_input_reports_the_position(text, message, position):
+    with pytest.raises(ExpressionError) as error:
+        parse(text)
+    assert (error.value.message, error.value.position) == (message, position)
+
+
+def test_compiled_expressions_are_reused():
+    compiled = compile_expression('x*2+1', ('x',))
+    hits = compile_expression.cache_info().hits
+    assert compile_expression('x*2+1', ('x',)) is compiled
+    assert compile_expression.cache_info().hits == hits + 1
+    assert compiled({'x': 4}) == 9
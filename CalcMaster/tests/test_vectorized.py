@@ -0,0 +1,44 @@
+import math
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from CalculatorEngine import CalculatorEngine
+
+
+@pytest.mark.filterwarnings('error')
+@pytest.mark.parametrize('expression', ['1/0+x', 'x*(0%0)', 'ln(0)+x', 'sqrt(0-1)*x', '(0-1)!+x'])
+def test_failing_constant_subexpression_gives_nan_without_warnings(expression):
+    result = CalculatorEngine().evaluate_array(expression, x=np.arange(3.0))
+    assert result.shape == (3,)
+    assert np.isnan(result).all()
+
+
+@pytest.mark.filterwarnings('error')
+def test_failing_elements_are_masked():
+    result = CalculatorEngine().evaluate_array('1/x', masked=True, x=np.array([0.0, 2.0]))
+    assert result.mask.tolist() == [True, False]
+    assert result[1] == 0.5
+
+
+def test_matches_scalar_evaluation():
+    engine = CalculatorEngine()
+    xs = np.linspace(0.5, 10, 25)
+    expression = 'sin(x)^2+ln(x)*x!-sqrt(x)/3'
+    expected = [engine.evaluate(expression, x=float(x)) for x in xs]
+    result = engine.evaluate_array(expression, x=xs)
+    assert all(math.isclose(a, b, rel_tol=1e-9) for a, b in zip(result, expected))
+
+
+def test_factorial_uses_gamma_for_non_integers():
+    result = CalculatorEngine().evaluate_array('x!', x=np.array([2.5, 0.5, 5.0, -1.0]))
+    assert np.allclose(result[:3], [3.3233509704478426, 0.886226925452758, 120.0])
+    assert np.isnan(result[3])
+
+
+@pytest.mark.parametrize('expression, expected', [
+    ('(x+2)!', 120.0), ('x!+4!', 30.0), ('2^x!', 64.0), ('-x!', -6.0),
+])
+def test_factorial_binds_tighter_than_power_and_minus(expression, expected):
+    assert CalculatorEngine().evaluate_array(expression, x=np.array([3.0]))[0] == expected
@@ -0,0 +1,314 @@
+"""
+Versioned JSON API for todos.
+
+The collection endpoints accept arrays and apply every valid item in a
+single transaction, so importers can send thousands of changes in one
+request instead of one form POST (and one commit) per todo. Each response
+carries a per-item result in the same order as the request body.
+"""
+from datetime import date, datetime
+
+from flask import Blueprint, current_app, jsonify, request
+
+from cache import cache
+from database import read_session
+from models import (PRIORITIES, Todo, TodoList, current_owner_id, db, live_todos, next_todos,
+                    page_size, paginate_todos)
+from search import search_todos
+from tasks import tasks
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# SQLite caps the number of bound parameters per statement (999 on older
+# builds), so IN (...) lookups are issued in chunks of this size.
+IN_CHUNK = 500
+
+FIELD_LIMITS = {'title': 200, 'desc': 500}
+
+LIST_NAME_LIMIT = 100
+
+
+def error_response(message: str, status: int = 400):
+    return jsonify(error=message), status
+
+
+def _chunks(items, size=IN_CHUNK):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _existing_snos(snos) -> set:
+    """Return the subset of ``snos`` that are live (not deleted) todos."""
+    found = set()
+    for chunk in _chunks(list(snos)):
+        rows = live_todos().with_entities(Todo.sno).filter(Todo.sno.in_(chunk)).all()
+        found.update(row.sno for row in rows)
+    return found
+
+
+def _owned_list_ids(list_ids) -> set:
+    """Return the subset of ``list_ids`` that belong to the current user."""
+    found = set()
+    for chunk in _chunks([list_id for list_id in set(list_ids) if list_id is not None]):
+        rows = (TodoList.query.with_entities(TodoList.id)
+                .filter(TodoList.owner_id == current_owner_id(), TodoList.id.in_(chunk)).all())
+        found.update(row.id for row in rows)
+    return found
+
+
+def _batch_payload():
+    """
+    Read the request body as a list of items.
+
+    A single JSON object is accepted as a batch of one. Returns
+    ``(items, None)`` or ``(None, error_response)``.
+    """
+    payload = request.get_json(silent=True)
+    if isinstance(payload, dict):
+        payload = [payload]
+    if not isinstance(payload, list) or not payload:
+        return None, error_response("Request body must be a JSON object or a non-empty array")
+    limit = current_app.config['API_MAX_BATCH']
+    if len(payload) > limit:
+        return None, error_response(f"Batch too large: {len(payload)} items (max {limit})", 413)
+    return payload, None
+
+
+def clean_fields(item, partial: bool):
+    """
+    Validate the writable fields of one item.
+
+    Returns ``(fields, None)`` or ``(None, message)``.
+    """
+    if not isinstance(item, dict):
+        return None, "Item must be an object"
+    fields = {}
+    for name, limit in FIELD_LIMITS.items():
+        if name not in item:
+            if not partial:
+                return None, f"Missing field '{name}'"
+            continue
+        value = item[name]
+        if not isinstance(value, str):
+            return None, f"Field '{name}' must be a string"
+        if len(value) > limit:
+            return None, f"Field '{name}' exceeds {limit} characters"
+        fields[name] = value
+    if 'list_id' in item:
+        list_id = item['list_id']
+        if list_id is not None and (isinstance(list_id, bool) or not isinstance(list_id, int)):
+            return None, "Field 'list_id' must be an integer or null"
+        fields['list_id'] = list_id
+    if 'due_date' in item:
+        due_date = item['due_date']
+        if due_date is not None:
+            try:
+                due_date = date.fromisoformat(due_date)
+            except (TypeError, ValueError):
+                return None, "Field 'due_date' must be a YYYY-MM-DD date or null"
+        fields['due_date'] = due_date
+    if 'priority' in item:
+        priority = item['priority']
+        if isinstance(priority, bool) or not isinstance(priority, int) or priority not in PRIORITIES:
+            return None, f"Field 'priority' must be one of {', '.join(map(str, PRIORITIES))}"
+        fields['priority'] = priority
+    if 'completed' in item:
+        if not isinstance(item['completed'], bool):
+            return None, "Field 'completed' must be a boolean"
+        fields['completed_at'] = datetime.utcnow() if item['completed'] else None
+    if partial and not fields:
+        return None, "Nothing to update"
+    return fields, None
+
+
+def _jsonable(mapping) -> dict:
+    """Dates as ISO strings, like Todo.to_dict(), for outbox payloads."""
+    return {name: value.isoformat() if isinstance(value, date) else value
+            for name, value in mapping.items()}
+
+
+def _item_sno(item):
+    """Accept either a bare sno or an object with an integer 'sno'."""
+    sno = item.get('sno') if isinstance(item, dict) else item
+    if isinstance(sno, bool) or not isinstance(sno, int):
+        return None
+    return sno
+
+
+@api.route('/todos', methods=['GET'])
+def list_todos():
+    todos, prev_cursor, next_cursor = paginate_todos(
+        after=request.args.get('after', type=int),
+        before=request.args.get('before', type=int),
+        per_page=page_size(),
+        session=read_session(),
+        list_id=request.args.get('list_id', type=int),
+    )
+    return jsonify(
+        items=[todo.to_dict() for todo in todos],
+        prev_cursor=prev_cursor,
+        next_cursor=next_cursor,
+    )
+
+
+@api.route('/todos/search', methods=['GET'])
+def search_todos_api():
+    query = request.args.get('q', '').strip()
+    limit = current_app.config['SEARCH_MAX_RESULTS']
+    limit = max(1, min(request.args.get('limit', limit, type=int), limit))
+    todos = search_todos(query, limit=limit) if query else []
+    return jsonify(items=[todo.to_dict() for todo in todos])
+
+
+@api.route('/todos/next', methods=['GET'])
+def next_todos_api():
+    todos = next_todos(page_size(), session=read_session())
+    return jsonify(items=[todo.to_dict() for todo in todos])
+
+
+@api.route('/todos/<int:sno>', methods=['GET'])
+def get_todo(sno):
+    todo = live_todos(read_session()).filter_by(sno=sno).first()
+    if todo is None:
+        return error_response("Todo not found", 404)
+    return jsonify(todo.to_dict())
+
+
+@api.route('/todos', methods=['POST'])
+def create_todos():
+    items, error = _batch_payload()
+    if error:
+        return error
+
+    results = [None] * len(items)
+    valid = []
+    for index, item in enumerate(items):
+        fields, message = clean_fields(item, partial=False)
+        if message:
+            results[index] = {'index': index, 'status': 400, 'error': message}
+            continue
+        valid.append((index, fields))
+
+    owned = _owned_list_ids(fields.get('list_id') for _, fields in valid)
+    todos = []
+    for index, fields in valid:
+        if fields.get('list_id') is not None and fields['list_id'] not in owned:
+            results[index] = {'index': index, 'status': 404, 'error': "List not found"}
+            continue
+        todos.append((index, Todo(owner_id=current_owner_id(), **fields)))
+
+    if todos:
+        db.session.add_all(todo for _, todo in todos)
+        db.session.flush()
+        # Read the new snos before commit() expires the instances, which
+        # would otherwise reload each row with its own SELECT.
+        for index, todo in todos:
+            results[index] = {'index': index, 'status': 201, 'sno': todo.sno}
+        tasks.record('todo.created', [todo.to_dict() for _, todo in todos])
+        db.session.commit()
+        cache.invalidate()
+
+    return jsonify(results=results)
+
+
+@api.route('/todos', methods=['PATCH'])
+def update_todos():
+    items, error = _batch_payload()
+    if error:
+        return error
+
+    results = [None] * len(items)
+    updates = []
+    for index, item in enumerate(items):
+        sno = _item_sno(item)
+        if sno is None:
+            results[index] = {'index': index, 'status': 400, 'error': "Missing integer 'sno'"}
+            continue
+        fields, message = clean_fields(item, partial=True)
+        if message:
+            results[index] = {'index': index, 'status': 400, 'sno': sno, 'error': message}
+            continue
+        updates.append((index, dict(fields, sno=sno)))
+
+    existing = _existing_snos(mapping['sno'] for _, mapping in updates)
+    owned = _owned_list_ids(mapping.get('list_id') for _, mapping in updates)
+    mappings = []
+    for index, mapping in updates:
+        if mapping.get('list_id') is not None and mapping['list_id'] not in owned:
+            results[index] = {'index': index, 'status': 404, 'sno': mapping['sno'],
+                              'error': "List not found"}
+        elif mapping['sno'] in existing:
+            mappings.append(mapping)
+            results[index] = {'index': index, 'status': 200, 'sno': mapping['sno']}
+        else:
+            results[index] = {'index': index, 'status': 404, 'sno': mapping['sno'],
+                              'error': "Todo not found"}
+
+    if mappings:
+        db.session.bulk_update_mappings(Todo, mappings)
+        tasks.record('todo.updated', [_jsonable(mapping) for mapping in mappings])
+        db.session.commit()
+        cache.invalidate()
+
+    return jsonify(results=results)
+
+
+@api.route('/todos', methods=['DELETE'])
+def delete_todos():
+    items, error = _batch_payload()
+    if error:
+        return error
+
+    results = [None] * len(items)
+    snos = []
+    for index, item in enumerate(items):
+        sno = _item_sno(item)
+        if sno is None:
+            results[index] = {'index': index, 'status': 400, 'error': "Missing integer 'sno'"}
+            continue
+        snos.append((index, sno))
+
+    existing = _existing_snos(sno for _, sno in snos)
+    for index, sno in snos:
+        if sno in existing:
+            results[index] = {'index': index, 'status': 204, 'sno': sno}
+        else:
+            results[index] = {'index': index, 'status': 404, 'sno': sno, 'error': "Todo not found"}
+
+    if existing:
+        # Soft delete, like the form route; updated_at moves via onupdate.
+        now = datetime.utcnow()
+        for chunk in _chunks(sorted(existing)):
+            (Todo.query.filter(Todo.sno.in_(chunk))
+             .update({'deleted_at': now}, synchronize_session=False))
+        tasks.record('todo.deleted', [{'sno': sno} for sno in sorted(existing)])
+        db.session.commit()
+        cache.invalidate()
+
+    return jsonify(results=results)
+
+
+@api.route('/lists', methods=['GET'])
+def list_lists():
+    lists = (TodoList.query.filter(TodoList.owner_id == current_owner_id())
+             .order_by(TodoList.created_at, TodoList.id).all())
+    return jsonify(items=[todo_list.to_dict() for todo_list in lists])
+
+
+@api.route('/lists', methods=['POST'])
+def create_list():
+    payload = request.get_json(silent=True)
+    name = payload.get('name') if isinstance(payload, dict) else None
+    if not isinstance(name, str) or not name.strip():
+        return error_response("Field 'name' must be a non-empty string")
+    if len(name) > LIST_NAME_LIMIT:
+        return error_response(f"Field 'name' exceeds {LIST_NAME_LIMIT} characters")
+    todo_list = TodoList(owner_id=current_owner_id(), name=name.strip())
+    db.session.add(todo_list)
+    db.session.commit()
+    return jsonify(todo_list.to_dict()), 201
+
+
+@api.route('/queue', methods=['GET'])
+def queue_stats():
+    return jsonify(tasks.stats())
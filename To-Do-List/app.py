@@ -1,64 +1,255 @@
-from flask import Flask, render_template, request, redirect
-from flask_sqlalchemy import SQLAlchemy
+import os
+import threading
 from datetime import datetime
 
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:///todo.db"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
+import click
+from flask import Flask, abort, current_app, render_template, request, redirect
 
-class Todo(db.Model):
-    sno = db.Column(db.Integer, primary_key=True)
-    title = db.Column(db.String(200), nullable=False)
-    desc = db.Column(db.String(500), nullable=False)
-    date_created = db.Column(db.DateTime, default=datetime.utcnow)
+from api import api, clean_fields
+from archive import archiver
+from assets import assets, precompile_templates
+from cache import cache
+from conditional import conditional_response, make_etag
+from database import configure_database, init_read_engine, read_session
+from groupcommit import committer
+from live import live
+from metrics import metrics
+from migrations import migrator
+from models import (PRIORITIES, PRIORITY_NORMAL, current_owner_id, db, list_fingerprint,
+                    live_todos, next_todos, page_size, paginate_todos, snapshot)
+from ratelimit import limiter
+from search import init_search, search_todos
+from shards import shards
+from tasks import tasks
+from tenant import tenancy
+from transfer import transfer
 
-    def __repr__(self) -> str:
-        return f"{self.sno} - {self.title}"
+# Guards the one-time setup in prepare().
+_prepare_lock = threading.Lock()
 
-# Initialize database within application context
-with app.app_context():
-    db.create_all()
 
-@app.route('/', methods=['GET', 'POST'])
+def create_app(config=None) -> Flask:
+    """
+    Build the app from environment settings, with ``config`` applied on top.
+
+    Nothing here opens a database connection, so importing the app (gunicorn
+    workers, tests, CLI commands) stays cheap; the database is set up by
+    :func:`prepare` on the first request or by ``flask init-db``.
+    """
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['TODOS_PER_PAGE'] = int(os.environ.get('TODOS_PER_PAGE', 20))
+    app.config['TODOS_MAX_PER_PAGE'] = int(os.environ.get('TODOS_MAX_PER_PAGE', 100))
+    app.config['API_MAX_BATCH'] = int(os.environ.get('API_MAX_BATCH', 10000))
+    app.config['SEARCH_MAX_RESULTS'] = int(os.environ.get('SEARCH_MAX_RESULTS', 50))
+    app.config['TODO_CACHE_SIZE'] = int(os.environ.get('TODO_CACHE_SIZE', 512))
+    app.config['TODO_CACHE_BACKEND'] = os.environ.get('TODO_CACHE_BACKEND')
+    app.config['EXPORT_BATCH'] = int(os.environ.get('EXPORT_BATCH', 1000))
+    app.config['IMPORT_BATCH'] = int(os.environ.get('IMPORT_BATCH', 5000))
+    app.config['TASK_WORKERS'] = int(os.environ.get('TASK_WORKERS', 2))
+    app.config['TASK_QUEUE_SIZE'] = int(os.environ.get('TASK_QUEUE_SIZE', 1000))
+    app.config['SLOW_REQUEST_MS'] = int(os.environ.get('SLOW_REQUEST_MS', 500))
+    app.config['N_PLUS_ONE_THRESHOLD'] = int(os.environ.get('N_PLUS_ONE_THRESHOLD', 10))
+    app.config['ARCHIVE_INTERVAL'] = int(os.environ.get('ARCHIVE_INTERVAL', 3600))
+    app.config['ARCHIVE_BATCH'] = int(os.environ.get('ARCHIVE_BATCH', 1000))
+    app.config['ARCHIVE_DELETED_AFTER_DAYS'] = int(os.environ.get('ARCHIVE_DELETED_AFTER_DAYS', 7))
+    app.config['ARCHIVE_COMPLETED_AFTER_DAYS'] = int(os.environ.get('ARCHIVE_COMPLETED_AFTER_DAYS', 0))
+    app.config['ARCHIVE_CREATED_AFTER_DAYS'] = int(os.environ.get('ARCHIVE_CREATED_AFTER_DAYS', 0))
+    app.config['LIVE_UPDATES'] = os.environ.get('LIVE_UPDATES', '0') == '1'
+    app.config['LIVE_POLL_INTERVAL'] = float(os.environ.get('LIVE_POLL_INTERVAL', 1.0))
+    app.config['LIVE_MAX_STREAM_SECONDS'] = int(os.environ.get('LIVE_MAX_STREAM_SECONDS', 300))
+    app.config['GROUP_COMMIT'] = os.environ.get('GROUP_COMMIT', '0') == '1'
+    app.config['GROUP_COMMIT_WINDOW_MS'] = float(os.environ.get('GROUP_COMMIT_WINDOW_MS', 2))
+    app.config['TENANT_HEADER'] = os.environ.get('TENANT_HEADER', 'X-Todo-User')
+    app.config['TODO_SHARDS'] = os.environ.get('TODO_SHARDS', '')
+    app.config['MIGRATE_ON_STARTUP'] = os.environ.get('MIGRATE_ON_STARTUP', '1') == '1'
+    app.config['RATE_LIMIT_PER_MINUTE'] = int(os.environ.get('RATE_LIMIT_PER_MINUTE', 120))
+    app.config['RATE_LIMIT_BURST'] = int(os.environ.get('RATE_LIMIT_BURST', 30))
+    app.config['RATE_LIMIT_API_KEYS'] = os.environ.get('RATE_LIMIT_API_KEYS', '')
+    app.config['WRITE_CONCURRENCY'] = int(os.environ.get('WRITE_CONCURRENCY', 8))
+    app.config['WRITE_QUEUE_TIMEOUT'] = float(os.environ.get('WRITE_QUEUE_TIMEOUT', 0.5))
+    app.config.update(config or {})
+    configure_database(app)
+    # First, so the schema exists before any other hook queries it.
+    app.before_request(lambda: prepare(app))
+    db.init_app(app)
+    migrator.init_app(app)
+    cache.init_app(app)
+    tasks.init_app(app)
+    metrics.init_app(app)
+    # Before tenancy, which may already write (new users).
+    limiter.init_app(app)
+    archiver.init_app(app)
+    live.init_app(app)
+    committer.init_app(app)
+    # Tenancy resolves the user before shards routes the request to its file.
+    tenancy.init_app(app)
+    shards.init_app(app)
+    assets.init_app(app)
+    app.jinja_env.globals['priorities'] = PRIORITIES
+    app.register_blueprint(api)
+    app.register_blueprint(transfer)
+    app.cli.add_command(init_db_command)
+
+    app.add_url_rule('/', view_func=hello_world, methods=['GET', 'POST'])
+    app.add_url_rule('/search', view_func=search)
+    app.add_url_rule('/show', view_func=products)
+    app.add_url_rule('/update/<int:sno>', view_func=update, methods=['GET', 'POST'])
+    app.add_url_rule('/delete/<int:sno>', view_func=delete)
+    app.add_url_rule('/complete/<int:sno>', view_func=complete, methods=['POST'])
+    app.add_url_rule('/next', view_func=upcoming)
+    return app
+
+
+def prepare(app) -> None:
+    """
+    Migrate the schema and set up search, shards and the read engine.
+
+    Runs once per process: on the first request, from asgi.py's lifespan,
+    or from ``flask init-db``.
+    """
+    if app.extensions.get('todo_prepared'):
+        return
+    with _prepare_lock:
+        if app.extensions.get('todo_prepared'):
+            return
+        with app.app_context():
+            # With migrations pending (MIGRATE_ON_STARTUP off) the tables may
+            # not exist yet; search and shards are set up on the next start.
+            if migrator.startup():
+                init_search(app)
+                shards.init_shards()
+            else:
+                app.extensions['todo_search'] = 'like'
+            init_read_engine(app)
+            precompile_templates(app.jinja_env)
+        app.extensions['todo_prepared'] = True
+
+
+@click.command('init-db')
+def init_db_command():
+    """Create or upgrade the schema and set up search and shards."""
+    current_app.config['MIGRATE_ON_STARTUP'] = True
+    prepare(current_app._get_current_object())
+    click.echo("Database ready.")
+
+
+def planning_fields(form) -> dict:
+    """``due_date`` and ``priority`` from the add and update forms; 400 if invalid."""
+    fields, message = clean_fields({
+        'due_date': form.get('due_date') or None,
+        'priority': form.get('priority', PRIORITY_NORMAL, type=int),
+    }, partial=True)
+    if message:
+        abort(400, message)
+    return fields
+
 def hello_world():
     if request.method=='POST':
-        title = request.form['title']
-        desc = request.form['desc']
-        todo = Todo(title=title, desc=desc)
-        db.session.add(todo)
-        db.session.commit()
-        
-    allTodo = Todo.query.all() 
-    return render_template('index.html', allTodo=allTodo)
+        committer.create(request.form['title'], request.form['desc'],
+                         **planning_fields(request.form))
+
+    after = request.args.get('after', type=int)
+    before = request.args.get('before', type=int)
+    per_page = page_size()
+    owner = current_owner_id()
+
+    def load_page():
+        todos, prev_cursor, next_cursor = paginate_todos(
+            after=after, before=before, per_page=per_page, session=read_session(),
+        )
+        return snapshot(todos), prev_cursor, next_cursor
+
+    def render_page():
+        allTodo, prev_cursor, next_cursor = cache.get_or_set(
+            ('page', owner, after, before, per_page), load_page)
+        return render_template('index.html', allTodo=allTodo,
+                               prev_cursor=prev_cursor, next_cursor=next_cursor)
+
+    # The markup also echoes query arguments (pagination links, search box),
+    # so the rendered page is keyed on the full query string.
+    def cached_page():
+        return cache.get_or_set(('index', owner, request.query_string), render_page)
+
+    if request.method == 'POST':
+        return cached_page()
+
+    count, last_modified = cache.get_or_set(
+        ('fingerprint', owner), lambda: list_fingerprint(read_session()))
+    etag = make_etag('index', owner, count, last_modified, request.query_string)
+    return conditional_response(etag, last_modified, cached_page)
+
+def search():
+    query = request.args.get('q', '').strip()
+    allTodo = search_todos(query, limit=current_app.config['SEARCH_MAX_RESULTS']) if query else []
+    return render_template('search.html', allTodo=allTodo, query=query,
+                           empty_message="No matching todos.")
 
-@app.route('/show')
 def products():
-    allTodo = Todo.query.all()
-    print(allTodo)
+    allTodo = live_todos().all()
+    current_app.logger.debug("%d todos: %r", len(allTodo), allTodo)
     return 'this is products page'
 
-@app.route('/update/<int:sno>', methods=['GET', 'POST'])
 def update(sno):
     if request.method=='POST':
         title = request.form['title']
         desc = request.form['desc']
-        todo = Todo.query.filter_by(sno=sno).first()
+        todo = live_todos().filter_by(sno=sno).first()
+        if todo is None:
+            abort(404)
         todo.title = title
         todo.desc = desc
+        for name, value in planning_fields(request.form).items():
+            setattr(todo, name, value)
         db.session.add(todo)
+        db.session.flush()
+        tasks.record('todo.updated', [todo.to_dict()])
         db.session.commit()
+        cache.invalidate()
         return redirect("/")
         
-    todo = Todo.query.filter_by(sno=sno).first()
-    return render_template('update.html', todo=todo)
+    todo = live_todos(read_session()).filter_by(sno=sno).first()
+    if todo is None:
+        abort(404)
+    etag = make_etag('update', todo.sno, todo.updated_at)
+    return conditional_response(etag, todo.updated_at,
+                                lambda: render_template('update.html', todo=todo))
 
-@app.route('/delete/<int:sno>')
 def delete(sno):
-    todo = Todo.query.filter_by(sno=sno).first()
-    db.session.delete(todo)
+    todo = live_todos().filter_by(sno=sno).first()
+    if todo is None:
+        abort(404)
+    # Soft delete: the archiver moves the row out of the table later.
+    todo.deleted_at = datetime.utcnow()
+    tasks.record('todo.deleted', [{'sno': sno}])
     db.session.commit()
+    cache.invalidate()
     return redirect("/")
 
+def complete(sno):
+    """Mark a todo done, or open again if it already is."""
+    todo = live_todos().filter_by(sno=sno).first()
+    if todo is None:
+        abort(404)
+    todo.completed_at = None if todo.completed_at else datetime.utcnow()
+    db.session.flush()
+    tasks.record('todo.updated', [todo.to_dict()])
+    db.session.commit()
+    cache.invalidate()
+    # Back to the page the button was on, but never off this site.
+    target = request.form.get('next', '/')
+    return redirect(target if target.startswith('/') and not target.startswith('//') else '/')
+
+def upcoming():
+    per_page = page_size()
+    owner = current_owner_id()
+    allTodo = cache.get_or_set(('next', owner, per_page),
+                               lambda: snapshot(next_todos(per_page, session=read_session())))
+    return render_template('next.html', allTodo=allTodo,
+                           empty_message="Nothing left to do.")
+
+
+app = create_app()
+
 if __name__ == "__main__":
     app.run(debug=True, port=8000)
@@ -0,0 +1,170 @@
+"""
+Archival of deleted and old todos.
+
+Deleting a todo only sets ``deleted_at``; this module moves such rows,
+and optionally todos completed more than ``ARCHIVE_COMPLETED_AFTER_DAYS``
+ago or older than ``ARCHIVE_CREATED_AFTER_DAYS``, out of the live ``todo``
+table into ``todo_archive`` in small batches. The hot
+routes only ever see live rows, so the table and its indexes stay the
+size of the working set no matter how much history piles up.
+
+SQLite has no table partitioning; the archive table (optionally in its
+own database file via ``ARCHIVE_DATABASE_URL``) plays the part of the
+cold partition. Each batch is first written to the archive and committed,
+then removed from the live table, so a crash in between only means the
+batch is copied again on the next run.
+
+With ``TODO_SHARDS`` set, each shard file is archived in turn into the
+one archive database.
+
+Runs in a background thread every ``ARCHIVE_INTERVAL`` seconds (0
+disables it) and on demand with ``flask archive-todos``.
+"""
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import click
+
+from cache import cache
+from models import Todo, TodoArchive, db
+from shards import shards
+from tasks import tasks
+
+ARCHIVED_COLUMNS = ('sno', 'title', 'desc', 'date_created', 'updated_at', 'deleted_at',
+                    'owner_id', 'list_id', 'due_date', 'priority', 'completed_at')
+
+
+class Archiver:
+    """Moves rows from ``todo`` to ``todo_archive``; see :meth:`init_app`."""
+
+    def __init__(self):
+        self.app = None
+        self._started = False
+        self._start_lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def init_app(self, app) -> None:
+        """
+        Read settings, register the CLI command and the background job.
+
+        ``ARCHIVE_DELETED_AFTER_DAYS`` (default 7) is how long deleted todos
+        stay in the live table, ``ARCHIVE_COMPLETED_AFTER_DAYS`` (default 0,
+        off) archives todos that long after they were completed,
+        ``ARCHIVE_CREATED_AFTER_DAYS`` (default 0, off) archives live todos
+        by age, ``ARCHIVE_BATCH`` (default 1000)
+        is the number of rows per transaction and ``ARCHIVE_PAUSE`` the
+        seconds to wait between batches so request writes get the lock.
+        """
+        app.config.setdefault('ARCHIVE_INTERVAL', 3600)
+        app.config.setdefault('ARCHIVE_BATCH', 1000)
+        app.config.setdefault('ARCHIVE_PAUSE', 0.05)
+        app.config.setdefault('ARCHIVE_DELETED_AFTER_DAYS', 7)
+        app.config.setdefault('ARCHIVE_COMPLETED_AFTER_DAYS', 0)
+        app.config.setdefault('ARCHIVE_CREATED_AFTER_DAYS', 0)
+        self.app = app
+        app.extensions['todo_archiver'] = self
+        app.cli.add_command(archive_command)
+        if app.config['ARCHIVE_INTERVAL'] > 0:
+            app.before_request(self.start)
+
+    def start(self) -> None:
+        """Start the background thread once per process."""
+        if self._started:
+            return
+        with self._start_lock:
+            if self._started:
+                return
+            threading.Thread(target=self._loop, name='todo-archiver', daemon=True).start()
+            self._started = True
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    def _loop(self) -> None:
+        while not self._stopping.wait(self.app.config['ARCHIVE_INTERVAL']):
+            try:
+                with self.app.app_context():
+                    self.run()
+            except Exception:
+                self.app.logger.exception("Archiving todos failed")
+
+    def candidate_queries(self, now=None):
+        """
+        Queries for rows due for archiving, oldest first.
+
+        Each one is served by a partial index: deleted rows by
+        ``ix_todo_deleted_at``, completed rows by ``ix_todo_live_completed_at``
+        and old live rows by ``ix_todo_live_date_created_sno``.
+        """
+        now = now or datetime.utcnow()
+        config = self.app.config
+        deleted_cutoff = now - timedelta(days=config['ARCHIVE_DELETED_AFTER_DAYS'])
+        queries = [
+            Todo.query.filter(Todo.deleted_at.isnot(None), Todo.deleted_at < deleted_cutoff)
+                      .order_by(Todo.deleted_at),
+        ]
+        if config['ARCHIVE_COMPLETED_AFTER_DAYS'] > 0:
+            completed_cutoff = now - timedelta(days=config['ARCHIVE_COMPLETED_AFTER_DAYS'])
+            queries.append(
+                Todo.query.filter(Todo.deleted_at.is_(None), Todo.completed_at.isnot(None),
+                                  Todo.completed_at < completed_cutoff)
+                          .order_by(Todo.completed_at))
+        if config['ARCHIVE_CREATED_AFTER_DAYS'] > 0:
+            created_cutoff = now - timedelta(days=config['ARCHIVE_CREATED_AFTER_DAYS'])
+            queries.append(
+                Todo.query.filter(Todo.deleted_at.is_(None), Todo.date_created < created_cutoff)
+                          .order_by(Todo.date_created, Todo.sno))
+        return queries
+
+    def archive_batch(self, query) -> int:
+        """Move up to ARCHIVE_BATCH rows matched by ``query``. Needs an app context."""
+        rows = query.limit(self.app.config['ARCHIVE_BATCH']).all()
+        if not rows:
+            return 0
+        now = datetime.utcnow()
+        snos = [row.sno for row in rows]
+        mappings = [dict({name: getattr(row, name) for name in ARCHIVED_COLUMNS}, archived_at=now)
+                    for row in rows]
+
+        # Replace rather than insert, so re-running a half-finished batch works.
+        (TodoArchive.query.filter(TodoArchive.sno.in_(snos))
+         .delete(synchronize_session=False))
+        db.session.bulk_insert_mappings(TodoArchive, mappings)
+        db.session.commit()
+
+        Todo.query.filter(Todo.sno.in_(snos)).delete(synchronize_session=False)
+        # One event per tenant, so each live feed only sees its own rows.
+        by_owner = defaultdict(list)
+        for row in mappings:
+            by_owner[row['owner_id']].append(row['sno'])
+        for owner_id, owned in by_owner.items():
+            tasks.record('todo.archived', [{'snos': owned}], owner_id=owner_id)
+        db.session.commit()
+        cache.invalidate()
+        return len(snos)
+
+    def run(self, now=None) -> int:
+        """Archive everything that is due; returns the number of rows moved."""
+        total = 0
+        for location in shards.locations():
+            with shards.route(location):
+                for query in self.candidate_queries(now):
+                    while True:
+                        moved = self.archive_batch(query)
+                        total += moved
+                        if moved < self.app.config['ARCHIVE_BATCH']:
+                            break
+                        time.sleep(self.app.config['ARCHIVE_PAUSE'])
+        return total
+
+
+archiver = Archiver()
+
+
+@click.command('archive-todos')
+def archive_command():
+    """Move deleted, completed and old todos to the archive table."""
+    moved = archiver.run()
+    click.echo(f"Archived {moved} todos.")
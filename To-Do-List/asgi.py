@@ -0,0 +1,554 @@
+"""
+ASGI entry point for the todo app.
+
+Serves the same HTML routes and templates as ``app.py``, but on an event
+loop with aiosqlite instead of blocking SQLAlchemy calls, so one process
+holds thousands of keep-alive or slow connections while a sync gunicorn
+worker is tied up by each one. Run it with
+
+    uvicorn asgi:app --workers 4
+
+Configuration, schema creation, full-text search setup, the outbox task
+queue and the archiver all come from ``app.py``, so both entry points can
+serve the same database side by side, including the per-user lists of
+tenant.py. The JSON API and the export/import endpoints are only served
+by the WSGI app, and so is everything when ``TODO_SHARDS`` is set.
+"""
+import asyncio
+import functools
+import json
+import os
+import queue
+from contextlib import asynccontextmanager
+from datetime import datetime
+from types import SimpleNamespace
+from urllib.parse import parse_qsl, urlencode
+
+import aiosqlite
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.responses import (FileResponse, HTMLResponse, PlainTextResponse, RedirectResponse,
+                                 StreamingResponse)
+from starlette.routing import Mount, Route
+from starlette.staticfiles import StaticFiles
+
+from api import clean_fields
+from app import app as flask_app, prepare
+from archive import archiver
+from assets import assets, precompile_templates
+from cache import INCREMENT_VERSION_SQL, VERSION_KEY
+from database import SQLITE_PRAGMAS
+from live import STREAM_HEADERS, format_events, format_retry, live
+from models import OPEN_TODO, PRIORITIES, PRIORITY_NORMAL, db
+from ratelimit import WRITE_METHODS, limiter, retry_after_seconds
+from search import FTS_TABLE, TOKEN_RE, match_query
+from tasks import tasks
+from tenant import MAX_USERNAME, tenancy
+
+# The format SQLAlchemy stores DateTime columns in on SQLite, so rows
+# written here sort and parse exactly like rows written by the ORM.
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+TODO_COLUMNS = ('sno, title, "desc", date_created, updated_at, list_id, due_date, priority, '
+                'completed_at')
+
+URLS = {
+    'hello_world': '/',
+    'search': '/search',
+    'update': '/update/{sno}',
+    'delete': '/delete/{sno}',
+    'static': '/static/{filename}',
+}
+
+
+def url_for(endpoint: str, **values) -> str:
+    """Flask-compatible ``url_for`` for the templates; extra values become the query."""
+    path = URLS[endpoint]
+    for name in list(values):
+        if '{' + name + '}' in path:
+            path = path.replace('{' + name + '}', str(values.pop(name)))
+    query = urlencode([(name, value) for name, value in values.items() if value is not None])
+    return f"{path}?{query}" if query else path
+
+
+templates = Environment(
+    loader=FileSystemLoader(os.path.join(flask_app.root_path, flask_app.template_folder)),
+    autoescape=select_autoescape(['html']),
+    enable_async=True,
+)
+templates.globals['url_for'] = url_for
+# Streams are cheap here, so pages always get live updates (see live.py).
+templates.globals.update(assets=assets, asset_url=lambda name: assets.url(name, url_for),
+                         priorities=PRIORITIES, live_updates=True)
+
+
+async def render(request, name: str, **context) -> HTMLResponse:
+    # Templates only read request.args and request.path.
+    context['request'] = SimpleNamespace(args=request.query_params, path=request.url.path)
+    html = await templates.get_template(name).render_async(**context)
+    return HTMLResponse(html)
+
+
+class Database:
+    """
+    A small pool of aiosqlite connections.
+
+    Reads take any free connection; writes additionally hold an asyncio
+    lock, because SQLite allows one writer at a time and waiting on the
+    lock is cheaper than waiting in ``busy_timeout``.
+    """
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+        self.pool = asyncio.Queue()
+        self.write_lock = asyncio.Lock()
+        self.connections = []
+
+    async def open(self) -> None:
+        for _ in range(self.size):
+            # isolation_level=None: transactions are opened explicitly.
+            conn = await aiosqlite.connect(self.path, isolation_level=None)
+            conn.row_factory = aiosqlite.Row
+            for name, value in SQLITE_PRAGMAS.items():
+                await conn.execute(f"PRAGMA {name}={value}")
+            self.connections.append(conn)
+            self.pool.put_nowait(conn)
+
+    async def close(self) -> None:
+        for conn in self.connections:
+            await conn.close()
+        self.connections.clear()
+
+    @asynccontextmanager
+    async def connection(self):
+        conn = await self.pool.get()
+        try:
+            yield conn
+        finally:
+            self.pool.put_nowait(conn)
+
+    async def fetchall(self, sql: str, params=()):
+        async with self.connection() as conn:
+            async with conn.execute(sql, params) as cursor:
+                return await cursor.fetchall()
+
+    async def fetchone(self, sql: str, params=()):
+        rows = await self.fetchall(sql, params)
+        return rows[0] if rows else None
+
+    @asynccontextmanager
+    async def transaction(self):
+        """Yield a connection inside BEGIN IMMEDIATE ... COMMIT."""
+        async with self.write_lock, self.connection() as conn:
+            await conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                await conn.execute("ROLLBACK")
+                raise
+            await conn.execute("COMMIT")
+
+
+database = None
+
+# Cap on write requests in flight, like WRITE_CONCURRENCY in ratelimit.py.
+write_slots = None
+
+
+def _now() -> str:
+    return datetime.utcnow().strftime(DATETIME_FORMAT)
+
+
+def _todo_dict(row) -> dict:
+    """Same shape as Todo.to_dict() for outbox payloads."""
+    def iso(value):
+        return datetime.strptime(value, DATETIME_FORMAT).isoformat() if value else None
+    return {
+        'sno': row['sno'],
+        'title': row['title'],
+        'desc': row['desc'],
+        'date_created': iso(row['date_created']),
+        'updated_at': iso(row['updated_at']),
+        'list_id': row['list_id'],
+        'due_date': row['due_date'],
+        'priority': row['priority'],
+        'completed_at': iso(row['completed_at']),
+    }
+
+
+async def _owner(request):
+    """The user id for TENANT_HEADER, like tenant.py; None without the header."""
+    username = request.headers.get(flask_app.config['TENANT_HEADER'], '').strip()
+    if not username:
+        return None
+    if len(username) > MAX_USERNAME:
+        raise HTTPException(400, f"User name longer than {MAX_USERNAME} characters")
+
+    def get_or_create():
+        with flask_app.app_context():
+            user = tenancy.get_or_create(username)
+            return user.id, user.moving
+
+    owner_id, moving = await asyncio.get_running_loop().run_in_executor(None, get_or_create)
+    if moving:
+        raise TenantMoving()
+    return owner_id
+
+
+class TenantMoving(Exception):
+    """The user's rows are being moved between shards (see shards.py)."""
+
+
+async def tenant_moving(request, exc):
+    return PlainTextResponse("Your todos are being moved, please retry shortly", 503, headers={
+        'Retry-After': str(flask_app.config['TENANT_RETRY_AFTER'])})
+
+
+async def _record(conn, kind: str, payload: dict, owner_id) -> int:
+    """
+    Write an outbox event in the caller's transaction; see tasks.py.
+
+    Also bumps the page cache version of cache.py, so the WSGI workers
+    stop serving lists cached before this change.
+    """
+    cursor = await conn.execute(
+        "INSERT INTO outbox (kind, payload, owner_id, created_at, attempts) "
+        "VALUES (?, ?, ?, ?, 0)",
+        (kind, json.dumps(payload), owner_id, _now()))
+    await conn.execute(INCREMENT_VERSION_SQL, {'name': VERSION_KEY})
+    return cursor.lastrowid
+
+
+def _committed(event_ids) -> None:
+    tasks.enqueue(event_ids)
+    live.notify()
+
+
+async def _form(request) -> dict:
+    """Parse an urlencoded body; 400 if ``title`` or ``desc`` is missing."""
+    form = dict(parse_qsl((await request.body()).decode('utf-8'), keep_blank_values=True))
+    if 'title' not in form or 'desc' not in form:
+        raise HTTPException(400)
+    return form
+
+
+def _planning_fields(form) -> dict:
+    """``due_date`` (as stored) and ``priority`` from a form, like app.planning_fields."""
+    try:
+        priority = int(form.get('priority') or PRIORITY_NORMAL)
+    except ValueError:
+        priority = PRIORITY_NORMAL
+    fields, message = clean_fields({'due_date': form.get('due_date') or None,
+                                    'priority': priority}, partial=True)
+    if message:
+        raise HTTPException(400, message)
+    if fields['due_date'] is not None:
+        fields['due_date'] = fields['due_date'].isoformat()
+    return fields
+
+
+def _page_size(request) -> int:
+    try:
+        per_page = int(request.query_params.get('per_page') or 0)
+    except ValueError:
+        per_page = 0
+    per_page = per_page or flask_app.config['TODOS_PER_PAGE']
+    return max(1, min(per_page, flask_app.config['TODOS_MAX_PER_PAGE']))
+
+
+def _int_arg(request, name: str):
+    try:
+        return int(request.query_params[name])
+    except (KeyError, ValueError):
+        return None
+
+
+async def paginate(owner_id, after=None, before=None, per_page=20):
+    """Keyset pagination over live todos; same contract as models.paginate_todos."""
+    cursor = None
+    if after or before:
+        cursor = await database.fetchone(
+            "SELECT date_created, sno FROM todo WHERE sno = ?", (after or before,))
+    # "IS ?" also matches the NULL owner of the shared list.
+    base = f"SELECT {TODO_COLUMNS} FROM todo WHERE owner_id IS ? AND deleted_at IS NULL"
+
+    if before and cursor:
+        rows = await database.fetchall(
+            f"{base} AND (date_created, sno) < (?, ?) "
+            f"ORDER BY date_created DESC, sno DESC LIMIT ?",
+            (owner_id, cursor['date_created'], cursor['sno'], per_page + 1))
+        has_prev = len(rows) > per_page
+        todos = rows[:per_page][::-1]
+        has_next = True
+    else:
+        if after and cursor:
+            rows = await database.fetchall(
+                f"{base} AND (date_created, sno) > (?, ?) ORDER BY date_created, sno LIMIT ?",
+                (owner_id, cursor['date_created'], cursor['sno'], per_page + 1))
+        else:
+            rows = await database.fetchall(
+                f"{base} ORDER BY date_created, sno LIMIT ?", (owner_id, per_page + 1))
+        has_next = len(rows) > per_page
+        todos = rows[:per_page]
+        has_prev = cursor is not None
+
+    prev_cursor = todos[0]['sno'] if todos and has_prev else None
+    next_cursor = todos[-1]['sno'] if todos and has_next else None
+    return todos, prev_cursor, next_cursor
+
+
+def admitted(handler, writes_on_get=False):
+    """Run ratelimit.py's rate limit and concurrency cap before write requests."""
+    @functools.wraps(handler)
+    async def wrapper(request):
+        if request.method not in WRITE_METHODS and not writes_on_get:
+            return await handler(request)
+        remote_addr = request.client.host if request.client else None
+        wait = limiter.check_rate(limiter.client_key(request.headers, remote_addr))
+        if wait:
+            return _refusal(429, "Too many requests", wait)
+        if write_slots is None:
+            return await handler(request)
+        try:
+            await asyncio.wait_for(write_slots.acquire(), flask_app.config['WRITE_QUEUE_TIMEOUT'])
+        except asyncio.TimeoutError:
+            limiter.count('shed')
+            return _refusal(503, "Server busy", 1)
+        try:
+            return await handler(request)
+        finally:
+            write_slots.release()
+    return wrapper
+
+
+def _refusal(status: int, message: str, retry_after: float) -> PlainTextResponse:
+    return PlainTextResponse(message, status,
+                             headers={'Retry-After': str(retry_after_seconds(retry_after))})
+
+
+async def hello_world(request):
+    owner_id = await _owner(request)
+    if request.method == 'POST':
+        form = await _form(request)
+        planning = _planning_fields(form)
+        now = _now()
+        async with database.transaction() as conn:
+            cursor = await conn.execute(
+                'INSERT INTO todo (title, "desc", date_created, updated_at, owner_id, due_date, '
+                'priority) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (form['title'], form['desc'], now, now, owner_id, planning['due_date'],
+                 planning['priority']))
+            todo = dict(planning, sno=cursor.lastrowid, title=form['title'], desc=form['desc'],
+                        date_created=now, updated_at=now, list_id=None, completed_at=None)
+            event_id = await _record(conn, 'todo.created', _todo_dict(todo), owner_id)
+        _committed([event_id])
+
+    todos, prev_cursor, next_cursor = await paginate(
+        owner_id, after=_int_arg(request, 'after'), before=_int_arg(request, 'before'),
+        per_page=_page_size(request))
+    return await render(request, 'index.html', allTodo=todos,
+                        prev_cursor=prev_cursor, next_cursor=next_cursor)
+
+
+async def search(request):
+    owner_id = await _owner(request)
+    query = request.query_params.get('q', '').strip()
+    limit = flask_app.config['SEARCH_MAX_RESULTS']
+    todos = []
+    if query and flask_app.extensions.get('todo_search') == 'fts5':
+        expression = match_query(query)
+        if expression:
+            todos = await database.fetchall(
+                f"SELECT todo.* FROM {FTS_TABLE} JOIN todo ON todo.sno = {FTS_TABLE}.rowid "
+                f"WHERE {FTS_TABLE} MATCH ? AND todo.owner_id IS ? AND todo.deleted_at IS NULL "
+                f"ORDER BY rank LIMIT ?", (expression, owner_id, limit))
+    elif query:
+        tokens = TOKEN_RE.findall(query)
+        if tokens:
+            filters = ' AND '.join('(title LIKE ? OR "desc" LIKE ?)' for _ in tokens)
+            params = [f'%{token}%' for token in tokens for _ in range(2)]
+            todos = await database.fetchall(
+                f"SELECT {TODO_COLUMNS} FROM todo WHERE owner_id IS ? AND deleted_at IS NULL "
+                f"AND {filters} ORDER BY date_created DESC LIMIT ?", [owner_id] + params + [limit])
+    return await render(request, 'search.html', allTodo=todos, query=query,
+                        empty_message="No matching todos.")
+
+
+async def products(request):
+    return PlainTextResponse('this is products page')
+
+
+async def _live_todo(conn_or_db, sno: int, owner_id):
+    sql = f"SELECT {TODO_COLUMNS} FROM todo WHERE sno = ? AND owner_id IS ? AND deleted_at IS NULL"
+    if isinstance(conn_or_db, Database):
+        row = await conn_or_db.fetchone(sql, (sno, owner_id))
+    else:
+        async with conn_or_db.execute(sql, (sno, owner_id)) as cursor:
+            row = await cursor.fetchone()
+    if row is None:
+        raise HTTPException(404)
+    return row
+
+
+async def update(request):
+    sno = request.path_params['sno']
+    owner_id = await _owner(request)
+    if request.method == 'POST':
+        form = await _form(request)
+        planning = _planning_fields(form)
+        async with database.transaction() as conn:
+            await _live_todo(conn, sno, owner_id)
+            await conn.execute(
+                'UPDATE todo SET title = ?, "desc" = ?, due_date = ?, priority = ?, updated_at = ? '
+                'WHERE sno = ?',
+                (form['title'], form['desc'], planning['due_date'], planning['priority'], _now(),
+                 sno))
+            todo = await _live_todo(conn, sno, owner_id)
+            event_id = await _record(conn, 'todo.updated', _todo_dict(todo), owner_id)
+        _committed([event_id])
+        return RedirectResponse('/', status_code=302)
+
+    todo = await _live_todo(database, sno, owner_id)
+    return await render(request, 'update.html', todo=todo)
+
+
+async def delete(request):
+    sno = request.path_params['sno']
+    owner_id = await _owner(request)
+    async with database.transaction() as conn:
+        await _live_todo(conn, sno, owner_id)
+        now = _now()
+        # Soft delete, like app.py; the archiver moves the row out later.
+        await conn.execute("UPDATE todo SET deleted_at = ?, updated_at = ? WHERE sno = ?",
+                           (now, now, sno))
+        event_id = await _record(conn, 'todo.deleted', {'sno': sno}, owner_id)
+    _committed([event_id])
+    return RedirectResponse('/', status_code=302)
+
+
+async def complete(request):
+    sno = request.path_params['sno']
+    owner_id = await _owner(request)
+    form = dict(parse_qsl((await request.body()).decode('utf-8')))
+    async with database.transaction() as conn:
+        todo = await _live_todo(conn, sno, owner_id)
+        now = _now()
+        await conn.execute("UPDATE todo SET completed_at = ?, updated_at = ? WHERE sno = ?",
+                           (None if todo['completed_at'] else now, now, sno))
+        todo = await _live_todo(conn, sno, owner_id)
+        event_id = await _record(conn, 'todo.updated', _todo_dict(todo), owner_id)
+    _committed([event_id])
+    target = form.get('next', '/')
+    return RedirectResponse(target if target.startswith('/') and not target.startswith('//')
+                            else '/', status_code=302)
+
+
+async def upcoming(request):
+    """Same order and indexes as models.next_todos."""
+    owner_id = await _owner(request)
+    limit = _page_size(request)
+    base = f"SELECT {TODO_COLUMNS} FROM todo WHERE owner_id IS ? AND {OPEN_TODO}"
+    todos = await database.fetchall(
+        f"{base} AND due_date IS NOT NULL ORDER BY due_date, priority, sno LIMIT ?",
+        (owner_id, limit))
+    if len(todos) < limit:
+        todos += await database.fetchall(
+            f"{base} AND due_date IS NULL ORDER BY priority, sno LIMIT ?",
+            (owner_id, limit - len(todos)))
+    return await render(request, 'next.html', allTodo=todos, empty_message="Nothing left to do.")
+
+
+async def send_asset(request):
+    """Hashed files from build_assets.py; see assets.py."""
+    resolved = assets.resolve(request.path_params['filename'],
+                              request.headers.get('accept-encoding', ''))
+    if resolved is None:
+        raise HTTPException(404)
+    path, headers, mimetype = resolved
+    return FileResponse(path, headers=headers, media_type=mimetype)
+
+
+async def events(request):
+    """The live feed of live.py; an idle stream costs no thread here."""
+    loop = asyncio.get_running_loop()
+    batches = asyncio.Queue()
+    limit = flask_app.config['LIVE_QUEUE_SIZE']
+
+    def send(rows):
+        # Called from the poller thread.
+        if batches.qsize() >= limit:
+            raise queue.Full
+        loop.call_soon_threadsafe(batches.put_nowait, rows)
+
+    last_id = request.headers.get('last-event-id') or request.query_params.get('last_event_id')
+    last_id = int(last_id) if last_id and last_id.isdigit() else None
+    owner_id = await _owner(request)
+
+    def subscribe():
+        with flask_app.app_context():
+            return live.subscribe(send, last_id, owner_id)
+
+    subscriber = await loop.run_in_executor(None, subscribe)
+    keepalive = flask_app.config['LIVE_KEEPALIVE']
+
+    async def generate():
+        try:
+            yield format_retry(flask_app.config['LIVE_POLL_INTERVAL'])
+            while not subscriber.overflowed:
+                try:
+                    rows = await asyncio.wait_for(batches.get(), keepalive)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_events(rows)
+        finally:
+            live.unsubscribe(subscriber)
+
+    return StreamingResponse(generate(), media_type='text/event-stream', headers=STREAM_HEADERS)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global database, write_slots
+    # The schema setup app.py does on its first request.
+    prepare(flask_app)
+    precompile_templates(templates)
+    with flask_app.app_context():
+        url = db.engine.url
+    if url.get_backend_name() != 'sqlite':
+        raise RuntimeError("The ASGI app needs an SQLite DATABASE_URL")
+    if flask_app.config['TODO_SHARDS']:
+        # Routing tenants to shard files is only implemented for the ORM.
+        raise RuntimeError("The ASGI app does not support TODO_SHARDS")
+    database = Database(url.database, int(os.environ.get('ASYNC_DB_POOL_SIZE', 8)))
+    await database.open()
+    if flask_app.config['WRITE_CONCURRENCY'] > 0:
+        write_slots = asyncio.Semaphore(flask_app.config['WRITE_CONCURRENCY'])
+    # Same background threads the WSGI app starts on its first request.
+    tasks.start()
+    if flask_app.config['ARCHIVE_INTERVAL'] > 0:
+        archiver.start()
+    try:
+        yield
+    finally:
+        await database.close()
+
+
+app = Starlette(
+    routes=[
+        Route('/', admitted(hello_world), methods=['GET', 'POST']),
+        Route('/search', search),
+        Route('/show', products),
+        Route('/update/{sno:int}', admitted(update), methods=['GET', 'POST']),
+        Route('/delete/{sno:int}', admitted(delete, writes_on_get=True)),
+        Route('/complete/{sno:int}', admitted(complete), methods=['POST']),
+        Route('/next', upcoming),
+        Route('/events', events),
+        Route(flask_app.config['ASSETS_URL_PATH'] + '/{filename:path}', send_asset),
+        Mount('/static', StaticFiles(directory=flask_app.static_folder), name='static'),
+    ],
+    exception_handlers={TenantMoving: tenant_moving},
+    lifespan=lifespan,
+)
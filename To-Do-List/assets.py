@@ -0,0 +1,129 @@
+"""
+Versioned static assets.
+
+``build_assets.py`` bundles and minifies the CSS and JavaScript (including
+local copies of Bootstrap) into ``static/dist`` under content-hashed names,
+with ``.gz`` and ``.br`` siblings, and records them in ``manifest.json``.
+This module reads that manifest, gives templates ``asset_url()`` and
+serves ``/assets/<name>``. A hashed name never changes content, so those
+responses carry a year-long ``immutable`` Cache-Control and repeat page
+loads only fetch the HTML.
+
+Without a build, templates fall back to the CDN and the plain files under
+``static/``, so development needs no build step. The manifest is read at
+startup; restart the app after rebuilding.
+"""
+import json
+import mimetypes
+import os
+
+from flask import abort, request, send_from_directory, url_for
+
+MANIFEST = 'manifest.json'
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+# Precompressed variants in order of preference.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def load_manifest(directory: str) -> dict:
+    """Bundle name -> hashed file name; empty if nothing has been built."""
+    try:
+        with open(os.path.join(directory, MANIFEST), encoding='utf-8') as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return {}
+
+
+def negotiate(directory: str, filename: str, accept_encoding: str):
+    """
+    Pick the variant of ``filename`` to send.
+
+    Returns ``(filename, content_encoding)``; the encoding is None for the
+    uncompressed file.
+    """
+    accepted = {part.split(';')[0].strip() for part in accept_encoding.lower().split(',')}
+    for encoding, suffix in ENCODINGS:
+        if encoding in accepted and os.path.isfile(os.path.join(directory, filename + suffix)):
+            return filename + suffix, encoding
+    return filename, None
+
+
+def asset_headers(encoding) -> dict:
+    headers = {'Cache-Control': IMMUTABLE, 'Vary': 'Accept-Encoding'}
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    return headers
+
+
+def precompile_templates(env) -> int:
+    """
+    Compile every template into the environment's cache.
+
+    Jinja otherwise compiles a template on its first render, so the first
+    request to each page in every worker pays for it.
+    """
+    names = env.list_templates(extensions=('html',))
+    for name in names:
+        env.get_template(name)
+    return len(names)
+
+
+class Assets:
+    """Hashed asset URLs and their long-lived responses; see :meth:`init_app`."""
+
+    def __init__(self):
+        self.app = None
+        self.directory = None
+        self.manifest = {}
+        self.files = frozenset()
+
+    def init_app(self, app) -> None:
+        """
+        Load the manifest and register ``/assets``.
+
+        ``ASSETS_URL_PATH`` (default ``/assets``) is where hashed files are
+        served from and ``ASSETS_DIR`` (default ``static/dist``) where
+        build_assets.py wrote them.
+        """
+        app.config.setdefault('ASSETS_URL_PATH', '/assets')
+        app.config.setdefault('ASSETS_DIR', os.path.join(app.static_folder, 'dist'))
+        self.app = app
+        self.directory = app.config['ASSETS_DIR']
+        self.manifest = load_manifest(self.directory)
+        self.files = frozenset(self.manifest.values())
+        app.extensions['todo_assets'] = self
+        app.add_url_rule(f"{app.config['ASSETS_URL_PATH']}/<path:filename>", 'assets', self.send)
+        app.jinja_env.globals.update(assets=self, asset_url=self.url)
+
+    @property
+    def built(self) -> bool:
+        return bool(self.manifest)
+
+    def url(self, name: str, url_for=url_for) -> str:
+        """URL of bundle ``name``; the plain static file if it was not built."""
+        if name in self.manifest:
+            return f"{self.app.config['ASSETS_URL_PATH']}/{self.manifest[name]}"
+        return url_for('static', filename=name)
+
+    def resolve(self, filename: str, accept_encoding: str):
+        """``(path, headers, mimetype)`` for a hashed file; None if unknown."""
+        if filename not in self.files:
+            return None
+        variant, encoding = negotiate(self.directory, filename, accept_encoding)
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        return os.path.join(self.directory, variant), asset_headers(encoding), mimetype
+
+    def send(self, filename):
+        """``GET /assets/<filename>``."""
+        resolved = self.resolve(filename, request.headers.get('Accept-Encoding', ''))
+        if resolved is None:
+            abort(404)
+        path, headers, mimetype = resolved
+        response = send_from_directory(self.directory, os.path.basename(path), mimetype=mimetype)
+        response.headers.update(headers)
+        return response
+
+
+assets = Assets()
@@ -0,0 +1,227 @@
+"""
+Concurrent keep-alive connection test: sync gunicorn vs. the ASGI app.
+
+Opens ``--connections`` client connections at once. Every client sends
+``--requests`` GETs of the list page over one keep-alive connection,
+trickles each request in ``--chunks`` pieces ``--trickle-ms`` apart (a
+slow client) and idles ``--think-ms`` between requests. On top of that
+``--idle`` connections are opened and left idle for the whole run, the
+way browsers preconnect and park sockets. A sync gunicorn worker is tied
+up by each such connection until it sends a complete request or times
+out, while the event loop behind ``uvicorn asgi:app`` keeps serving
+everyone else.
+
+Both servers run the same number of worker processes on the same seeded
+database; the report has throughput, latency percentiles, errors and
+reconnects (servers that close the connection after each response) per
+target as JSON.
+
+    python benchmarks/bench_connections.py --connections 500 --workers 2
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench_routes import APP_DIR, percentile, seed
+
+TARGETS = {
+    'wsgi': lambda port, args: [
+        sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}',
+        '--workers', str(args.workers), '--threads', str(args.threads),
+        '--backlog', '4096', 'app:app'],
+    'asgi': lambda port, args: [
+        sys.executable, '-m', 'uvicorn', 'asgi:app', '--port', str(port),
+        '--workers', str(args.workers), '--backlog', '4096', '--log-level', 'warning'],
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--targets', default='wsgi,asgi',
+                        help="servers to test (default: %(default)s)")
+    parser.add_argument('--connections', type=int, default=500, help="concurrent clients")
+    parser.add_argument('--requests', type=int, default=5, help="requests per client")
+    parser.add_argument('--idle', type=int, default=50,
+                        help="extra connections that stay open without sending anything")
+    parser.add_argument('--chunks', type=int, default=4,
+                        help="pieces each request is sent in")
+    parser.add_argument('--trickle-ms', type=int, default=100,
+                        help="pause between the pieces of a request")
+    parser.add_argument('--think-ms', type=int, default=100,
+                        help="idle time on the open connection between requests")
+    parser.add_argument('--seed', type=int, default=1234, help="random seed for start times")
+    parser.add_argument('--size', type=int, default=1000, help="todos in the database")
+    parser.add_argument('--workers', type=int, default=2, help="server worker processes")
+    parser.add_argument('--threads', type=int, default=1, help="gunicorn threads per worker")
+    parser.add_argument('--timeout', type=float, default=60, help="per-target time limit")
+    parser.add_argument('--output', help="write JSON results here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(target, env, args):
+    port = free_port()
+    process = subprocess.Popen(TARGETS[target](port, args), cwd=APP_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return process, port
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{target} server did not start")
+
+
+async def read_response(reader):
+    """Read one HTTP/1.1 response; returns (status, keep_alive)."""
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip().lower()
+    await reader.readexactly(int(headers.get('content-length', 0)))
+    return status, headers.get('connection') != 'close'
+
+
+async def client(port, args, stats, start_delay):
+    request = (b"GET / HTTP/1.1\r\nHost: 127.0.0.1\r\n"
+               b"Connection: keep-alive\r\nUser-Agent: bench\r\n\r\n")
+    step = -(-len(request) // args.chunks)
+    pieces = [request[i:i + step] for i in range(0, len(request), step)]
+    reader = writer = None
+    # Spread the clients out so their requests are not all complete in the
+    # kernel's buffers by the time a worker gets to them.
+    await asyncio.sleep(start_delay)
+    for _ in range(args.requests):
+        started = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                stats['connects'] += 1
+            for number, piece in enumerate(pieces):
+                if number:
+                    await asyncio.sleep(args.trickle_ms / 1000)
+                writer.write(piece)
+                await writer.drain()
+            status, keep_alive = await read_response(reader)
+            stats['latencies'].append(time.perf_counter() - started)
+            if status >= 400:
+                stats['errors'] += 1
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            stats['errors'] += 1
+            keep_alive = False
+        if not keep_alive and writer is not None:
+            writer.close()
+            writer = None
+        await asyncio.sleep(args.think_ms / 1000)
+    if writer is not None:
+        writer.close()
+
+
+async def drive(port, args):
+    stats = {'latencies': [], 'errors': 0, 'connects': 0}
+    idle = []
+    for _ in range(args.idle):
+        idle.append((await asyncio.open_connection('127.0.0.1', port))[1])
+    rng = random.Random(args.seed)
+    spread = ((args.chunks - 1) * args.trickle_ms + args.think_ms) / 1000
+    clients = [client(port, args, stats, rng.uniform(0, spread))
+               for _ in range(args.connections)]
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(asyncio.gather(*clients), args.timeout)
+        timed_out = False
+    except asyncio.TimeoutError:
+        timed_out = True
+    for writer in idle:
+        writer.close()
+    return stats, time.perf_counter() - started, timed_out
+
+
+def summarize(target, stats, wall, timed_out, args):
+    def ms(value):
+        return round(value * 1000, 3) if value is not None else None
+    latencies = sorted(stats['latencies'])
+    return {
+        'target': target,
+        'completed': len(latencies),
+        'expected': args.connections * args.requests,
+        'errors': stats['errors'],
+        'connects': stats['connects'],
+        'timed_out': timed_out,
+        'wall_s': round(wall, 2),
+        'throughput_rps': round(len(latencies) / wall, 1) if wall else None,
+        'p50_ms': ms(percentile(latencies, 50)),
+        'p95_ms': ms(percentile(latencies, 95)),
+        'p99_ms': ms(percentile(latencies, 99)),
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix='todo-bench-')
+    db_path = os.path.join(workdir, 'todo.db')
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{db_path}", SLOW_REQUEST_MS='60000',
+               GUNICORN_THREADS=str(args.threads), WEB_CONCURRENCY=str(args.workers))
+    os.environ.update(env)
+    sys.path.insert(0, APP_DIR)
+    from app import app, prepare  # noqa: E402  (import after the environment is set)
+    prepare(app)  # creates the schema that seed() fills
+    seed(db_path, 0, args.size)
+
+    results = []
+    for target in args.targets.split(','):
+        process, port = start_server(target, env, args)
+        try:
+            stats, wall, timed_out = asyncio.run(drive(port, args))
+        finally:
+            process.terminate()
+            process.wait()
+        results.append(summarize(target, stats, wall, timed_out, args))
+        print(json.dumps(results[-1]), file=sys.stderr)
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'connections': args.connections,
+            'idle': args.idle,
+            'requests': args.requests,
+            'chunks': args.chunks,
+            'trickle_ms': args.trickle_ms,
+            'think_ms': args.think_ms,
+            'size': args.size,
+            'seed': args.seed,
+            'workers': args.workers,
+            'threads': args.threads,
+        },
+        'results': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            fh.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Throughput of todo creation with and without group commit.
+
+Starts ``--threads`` threads that each create ``--todos`` todos through
+the same code path as ``POST /`` (``committer.create``), once with
+``GROUP_COMMIT=0`` and once with ``GROUP_COMMIT=1``, each on a fresh
+database in its own process. Reports todos per second, latency
+percentiles and the number of transactions as JSON.
+
+    python benchmarks/bench_group_commit.py --threads 16 --synchronous FULL
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from bench_routes import APP_DIR, percentile
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--threads', type=int, default=16, help="concurrent writers")
+    parser.add_argument('--todos', type=int, default=200, help="todos per writer")
+    parser.add_argument('--window-ms', type=float, default=2, help="GROUP_COMMIT_WINDOW_MS")
+    parser.add_argument('--synchronous', default='NORMAL',
+                        help="SQLITE_SYNCHRONOUS for both runs (FULL syncs every commit)")
+    parser.add_argument('--output', help="write JSON results here instead of stdout")
+    parser.add_argument('--run', choices=('0', '1'), help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def run(args):
+    """Measure one mode in this process; the environment is already set."""
+    sys.path.insert(0, APP_DIR)
+    from app import app, prepare  # noqa: E402  (import after the environment is set)
+    from groupcommit import committer  # noqa: E402
+    prepare(app)
+
+    latencies = []
+    lock = threading.Lock()
+
+    def writer(number):
+        mine = []
+        with app.app_context():
+            for i in range(args.todos):
+                started = time.perf_counter()
+                committer.create(f"Todo {number}-{i}", "created by benchmark")
+                mine.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(mine)
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    total = args.threads * args.todos
+    transactions = committer.counters['batches'] if args.run == '1' else total
+    return {
+        'group_commit': args.run == '1',
+        'todos': total,
+        'transactions': transactions,
+        'wall_s': round(wall, 3),
+        'todos_per_s': round(total / wall, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.run:
+        print(json.dumps(run(args)))
+        return
+
+    results = []
+    for mode in ('0', '1'):
+        workdir = tempfile.mkdtemp(prefix='todo-bench-')
+        env = dict(os.environ,
+                   DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'todo.db')}",
+                   GROUP_COMMIT=mode, GROUP_COMMIT_WINDOW_MS=str(args.window_ms),
+                   SQLITE_SYNCHRONOUS=args.synchronous, DB_POOL_SIZE=str(args.threads + 2),
+                   ARCHIVE_INTERVAL='0')
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--run', mode,
+             '--threads', str(args.threads), '--todos', str(args.todos)],
+            env=env, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+        print(json.dumps(results[-1]), file=sys.stderr)
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'threads': args.threads,
+            'todos_per_thread': args.todos,
+            'window_ms': args.window_ms,
+            'synchronous': args.synchronous,
+        },
+        'results': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            fh.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""
+Latency of the "what's next" query as the todo table grows.
+
+Seeds a fresh database to each size in ``--sizes`` with a realistic mix
+(most todos done, some deleted, a share without a due date) and times
+``GET /api/v1/todos/next`` through the Flask test client. For comparison
+the same SQL is also run with ``NOT INDEXED``, which makes SQLite scan and
+sort the table the way it would without the partial indexes. Reports the
+query plans and p50/p99 latency per size as JSON.
+
+    python benchmarks/bench_next.py --sizes 10000,100000,1000000 --limit 20
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+from bench_routes import APP_DIR, SEED_CHUNK, percentile
+
+OPEN_SQL = ("SELECT sno FROM todo {hint} WHERE owner_id IS NULL AND deleted_at IS NULL "
+            "AND completed_at IS NULL AND due_date IS NOT NULL "
+            "ORDER BY due_date, priority, sno LIMIT ?")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', default='10000,100000,1000000',
+                        help="comma-separated table sizes (default: %(default)s)")
+    parser.add_argument('--limit', type=int, default=20, help="todos per request")
+    parser.add_argument('--requests', type=int, default=200, help="measured requests per size")
+    parser.add_argument('--scans', type=int, default=5,
+                        help="measured NOT INDEXED queries per size (each scans the table)")
+    parser.add_argument('--done', type=float, default=0.6, help="share of completed todos")
+    parser.add_argument('--seed', type=int, default=1234, help="random seed")
+    parser.add_argument('--output', help="write JSON results here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def seed(db_path, start, stop, rng, done_share):
+    """Insert ``stop - start`` todos with due dates, priorities and completions."""
+    conn = sqlite3.connect(db_path)
+    base = datetime(2024, 1, 1)
+    today = date(2024, 6, 1)
+    try:
+        for chunk_start in range(start, stop, SEED_CHUNK):
+            rows = []
+            for n in range(chunk_start + 1, min(chunk_start + SEED_CHUNK, stop) + 1):
+                created = base + timedelta(seconds=n)
+                due = (today + timedelta(days=rng.randrange(-365, 365))).isoformat() \
+                    if rng.random() < 0.7 else None
+                completed = created if rng.random() < done_share else None
+                deleted = created if rng.random() < 0.05 else None
+                rows.append((f"Todo {n}", f"Description for todo number {n}", created, created,
+                             due, rng.randint(1, 3), completed, deleted))
+            conn.executemany(
+                'INSERT INTO todo (title, "desc", date_created, updated_at, due_date, priority, '
+                'completed_at, deleted_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            conn.commit()
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+
+
+def time_calls(func, count):
+    durations = []
+    for _ in range(count):
+        started = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - started)
+    durations.sort()
+    return {
+        'p50_ms': round(percentile(durations, 50) * 1000, 3),
+        'p99_ms': round(percentile(durations, 99) * 1000, 3),
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sizes = [int(size) for size in args.sizes.split(',')]
+    workdir = tempfile.mkdtemp(prefix='todo-bench-')
+    db_path = os.path.join(workdir, 'todo.db')
+    os.environ.update(DATABASE_URL=f"sqlite:///{db_path}", RATE_LIMIT_PER_MINUTE='0',
+                      TODO_CACHE_SIZE='0', ARCHIVE_INTERVAL='0', SLOW_REQUEST_MS='60000')
+    sys.path.insert(0, APP_DIR)
+    from app import app, prepare  # noqa: E402  (import after the environment is set)
+    prepare(app)  # creates the schema that seed() fills
+
+    client = app.test_client()
+    url = f'/api/v1/todos/next?per_page={args.limit}'
+    rng = random.Random(args.seed)
+    conn = sqlite3.connect(db_path)
+    results = []
+    seeded = 0
+    for size in sizes:
+        seed(db_path, seeded, size, rng, args.done)
+        seeded = size
+        assert len(client.get(url).get_json()['items']) == args.limit
+        plans = {}
+        for name, hint in (('indexed', ''), ('not_indexed', 'NOT INDEXED')):
+            sql = OPEN_SQL.format(hint=hint)
+            plans[name] = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}",
+                                                          (args.limit,))]
+        results.append({
+            'size': size,
+            'limit': args.limit,
+            'api': time_calls(lambda: client.get(url), args.requests),
+            'sql_indexed': time_calls(
+                lambda: conn.execute(OPEN_SQL.format(hint=''), (args.limit,)).fetchall(),
+                args.requests),
+            'sql_not_indexed': time_calls(
+                lambda: conn.execute(OPEN_SQL.format(hint='NOT INDEXED'),
+                                     (args.limit,)).fetchall(),
+                args.scans),
+            'plans': plans,
+        })
+        print(json.dumps(results[-1]), file=sys.stderr)
+    conn.close()
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'seed': args.seed,
+            'done_share': args.done,
+        },
+        'results': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            fh.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,297 @@
+"""
+Load test for the todo web app.
+
+Seeds the database to each size in ``--sizes`` (growing the same file, so
+1k -> 10k only inserts 9k rows), then drives the main routes with
+``--clients`` concurrent clients and reports p50/p95/p99 latency and
+throughput per route and table size as JSON.
+
+Runs against the Flask test client by default. ``--gunicorn`` starts a
+local gunicorn on the same database file and drives it over HTTP with
+keep-alive connections instead.
+
+Runs are reproducible: the random choice of rows is seeded, every size
+gets the same warm-up, and each run starts from a fresh database file.
+
+    python benchmarks/bench_routes.py --sizes 1000,10000,100000 --output results.json
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SEED_CHUNK = 10000
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', default='1000,10000,100000,1000000',
+                        help="comma-separated table sizes (default: %(default)s)")
+    parser.add_argument('--clients', type=int, default=8, help="concurrent clients")
+    parser.add_argument('--requests', type=int, default=400,
+                        help="measured requests per route and size")
+    parser.add_argument('--warmup', type=int, default=50, help="unmeasured requests per route")
+    parser.add_argument('--seed', type=int, default=1234, help="random seed")
+    parser.add_argument('--routes', default='list,list_deep,create,edit_page,edit,delete',
+                        help="routes to drive (default: %(default)s)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="disable the page cache so every read hits SQLite")
+    parser.add_argument('--gunicorn', action='store_true',
+                        help="drive a local gunicorn over HTTP instead of the test client")
+    parser.add_argument('--workers', type=int, default=4, help="gunicorn workers")
+    parser.add_argument('--threads', type=int, default=1, help="gunicorn threads per worker")
+    parser.add_argument('--output', help="write JSON results here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(pct / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def seed(db_path, start, stop):
+    """Insert ``stop - start`` todos with deterministic content."""
+    conn = sqlite3.connect(db_path)
+    base = datetime(2024, 1, 1)
+    try:
+        for chunk_start in range(start, stop, SEED_CHUNK):
+            rows = []
+            for n in range(chunk_start + 1, min(chunk_start + SEED_CHUNK, stop) + 1):
+                created = base + timedelta(seconds=n)
+                rows.append((f"Todo {n}", f"Description for todo number {n}", created, created))
+            conn.executemany(
+                'INSERT INTO todo (title, "desc", date_created, updated_at) '
+                'VALUES (?, ?, ?, ?)', rows)
+            conn.commit()
+        return [sno for (sno,) in conn.execute("SELECT sno FROM todo ORDER BY sno")]
+    finally:
+        conn.close()
+
+
+class TestClientDriver:
+    """Sends requests through Flask's test client, one client per thread."""
+
+    def __init__(self, app):
+        self.app = app
+        self.local = threading.local()
+
+    def request(self, method, path, form=None):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        response = client.open(path, method=method, data=form)
+        return response.status_code
+
+    def close(self):
+        pass
+
+
+class HTTPDriver:
+    """Sends requests over keep-alive HTTP connections, one per thread."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.local = threading.local()
+
+    def request(self, method, path, form=None):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self.local.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        body = urlencode(form) if form else None
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'} if form else {}
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+        except (http.client.HTTPException, OSError):
+            conn.close()
+            self.local.conn = None
+            raise
+        return response.status
+
+    def close(self):
+        pass
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_gunicorn(env, workers, threads):
+    port = free_port()
+    env = dict(env, GUNICORN_THREADS=str(threads), WEB_CONCURRENCY=str(workers))
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}', 'app:app'],
+        cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return process, port
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("gunicorn did not start")
+
+
+def route_requests(route, rng, snos, count, delete_pool):
+    """Build ``count`` (method, path, form) tuples for one route."""
+    requests = []
+    for i in range(count):
+        sno = rng.choice(snos)
+        if route == 'list':
+            requests.append(('GET', '/', None))
+        elif route == 'list_deep':
+            requests.append(('GET', f'/?after={sno}', None))
+        elif route == 'create':
+            requests.append(('POST', '/', {'title': f"Bench {i}", 'desc': "created by benchmark"}))
+        elif route == 'edit_page':
+            requests.append(('GET', f'/update/{sno}', None))
+        elif route == 'edit':
+            requests.append(('POST', f'/update/{sno}', {'title': f"Edited {i}", 'desc': "edited"}))
+        elif route == 'delete':
+            requests.append(('GET', f'/delete/{delete_pool.pop()}', None))
+        else:
+            raise ValueError(f"Unknown route {route!r}")
+    return requests
+
+
+def run_route(driver, requests, clients):
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def send(item):
+        nonlocal errors
+        method, path, form = item
+        started = time.perf_counter()
+        try:
+            status = driver.request(method, path, form)
+            failed = status >= 400
+        except Exception:
+            failed = True
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            errors += failed
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(send, requests))
+    wall = time.perf_counter() - started
+    return sorted(latencies), errors, wall
+
+
+def summarize(size, route, latencies, errors, wall):
+    def ms(value):
+        return round(value * 1000, 3) if value is not None else None
+    return {
+        'size': size,
+        'route': route,
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': ms(percentile(latencies, 50)),
+        'p95_ms': ms(percentile(latencies, 95)),
+        'p99_ms': ms(percentile(latencies, 99)),
+        'mean_ms': ms(sum(latencies) / len(latencies)) if latencies else None,
+        'throughput_rps': round(len(latencies) / wall, 1) if wall else None,
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sizes = [int(size) for size in args.sizes.split(',')]
+    routes = args.routes.split(',')
+    workdir = tempfile.mkdtemp(prefix='todo-bench-')
+    db_path = os.path.join(workdir, 'todo.db')
+
+    # One client sends every request, so the per-client rate limit is off.
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{db_path}", SLOW_REQUEST_MS='60000',
+               RATE_LIMIT_PER_MINUTE='0')
+    if args.no_cache:
+        env['TODO_CACHE_SIZE'] = '0'
+    os.environ.update(env)
+    sys.path.insert(0, APP_DIR)
+    from app import app, prepare  # noqa: E402  (import after the environment is set)
+    prepare(app)  # creates the schema that seed() fills
+
+    process = None
+    if args.gunicorn:
+        process, port = start_gunicorn(env, args.workers, args.threads)
+        driver = HTTPDriver('127.0.0.1', port)
+    else:
+        driver = TestClientDriver(app)
+
+    rng = random.Random(args.seed)
+    results = []
+    seeded = 0
+    try:
+        for size in sizes:
+            snos = seed(db_path, seeded, size)
+            seeded = size
+            # Deletes remove rows, so they get their own pool of snos that
+            # the other routes never pick.
+            per_delete = args.warmup + args.requests
+            delete_pool = rng.sample(snos, min(len(snos) // 2, per_delete))
+            reserved = set(delete_pool)
+            snos = [sno for sno in snos if sno not in reserved]
+            for route in routes:
+                if route == 'delete' and len(delete_pool) < per_delete:
+                    continue
+                warmup = route_requests(route, rng, snos, args.warmup, delete_pool)
+                run_route(driver, warmup, args.clients)
+                measured = route_requests(route, rng, snos, args.requests, delete_pool)
+                latencies, errors, wall = run_route(driver, measured, args.clients)
+                results.append(summarize(size, route, latencies, errors, wall))
+                print(json.dumps(results[-1]), file=sys.stderr)
+    finally:
+        driver.close()
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'target': 'gunicorn' if args.gunicorn else 'test-client',
+            'workers': args.workers if args.gunicorn else 1,
+            'threads': args.threads if args.gunicorn else None,
+            'clients': args.clients,
+            'requests': args.requests,
+            'warmup': args.warmup,
+            'seed': args.seed,
+            'cache': not args.no_cache,
+        },
+        'results': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            fh.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
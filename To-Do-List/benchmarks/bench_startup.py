@@ -0,0 +1,125 @@
+"""
+Cold start of the todo app.
+
+Each sample is a fresh Python process that imports ``app`` (what a
+gunicorn worker or a CLI command does), then serves its first request
+(which runs the one-time database setup), then a second one. Samples are
+taken against an existing, migrated database of ``--size`` todos and,
+with ``--fresh``, against a new database file each time. Reports the
+median and p95 of each phase, and whether the import alone touched the
+database file, as JSON.
+
+    python benchmarks/bench_startup.py --samples 20 --size 100000
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench_routes import APP_DIR, percentile, seed
+
+PHASES = ('import_s', 'first_request_s', 'second_request_s')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--samples', type=int, default=20, help="processes per scenario")
+    parser.add_argument('--size', type=int, default=10000, help="todos in the existing database")
+    parser.add_argument('--fresh', action='store_true',
+                        help="also start against a new, empty database each time")
+    parser.add_argument('--output', help="write JSON results here instead of stdout")
+    parser.add_argument('--run', action='store_true', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def file_state(db_path):
+    """Modification times of the database and its WAL; None where missing."""
+    return [os.stat(path).st_mtime_ns if os.path.exists(path) else None
+            for path in (db_path, db_path + '-wal', db_path + '-shm')]
+
+
+def run():
+    """Time one cold start in this process; the environment is already set."""
+    db_path = os.environ['DATABASE_URL'][len('sqlite:///'):]
+    before = file_state(db_path)
+    sys.path.insert(0, APP_DIR)
+
+    started = time.perf_counter()
+    from app import app  # noqa: E402  (the import is what is measured)
+    imported = time.perf_counter()
+    after = file_state(db_path)
+
+    client = app.test_client()
+    client.get('/')
+    first = time.perf_counter()
+    client.get('/')
+    second = time.perf_counter()
+    return {
+        'import_s': imported - started,
+        'first_request_s': first - imported,
+        'second_request_s': second - first,
+        'import_touched_db': before != after,
+    }
+
+
+def sample(db_path):
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{db_path}", ARCHIVE_INTERVAL='0',
+               TASK_WORKERS='1')
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--run'],
+                            env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(scenario, samples):
+    summary = {'scenario': scenario, 'samples': len(samples),
+               'import_touched_db': any(s['import_touched_db'] for s in samples)}
+    for phase in PHASES:
+        values = sorted(s[phase] for s in samples)
+        summary[phase.replace('_s', '_median_ms')] = round(statistics.median(values) * 1000, 2)
+        summary[phase.replace('_s', '_p95_ms')] = round(percentile(values, 95) * 1000, 2)
+    return summary
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.run:
+        print(json.dumps(run()))
+        return
+
+    workdir = tempfile.mkdtemp(prefix='todo-bench-')
+    existing = os.path.join(workdir, 'todo.db')
+    # The first start migrates the new file; every later one finds it current.
+    sample(existing)
+    seed(existing, 0, args.size)
+
+    results = [summarize('existing', [sample(existing) for _ in range(args.samples)])]
+    print(json.dumps(results[-1]), file=sys.stderr)
+    if args.fresh:
+        fresh = [sample(os.path.join(workdir, f'fresh-{n}.db')) for n in range(args.samples)]
+        results.append(summarize('fresh', fresh))
+        print(json.dumps(results[-1]), file=sys.stderr)
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'samples': args.samples,
+            'size': args.size,
+        },
+        'results': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            fh.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
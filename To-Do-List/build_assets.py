@@ -0,0 +1,169 @@
+"""
+Build the versioned static assets served by assets.py.
+
+Bundles the files in ``BUNDLES`` (paths relative to ``static/``), strips
+comments and indentation, and writes each bundle to ``static/dist`` as
+``<name>.<hash>.<ext>`` together with ``.gz`` and, when the ``brotli``
+package is installed, ``.br`` variants. ``manifest.json`` maps bundle
+names to the hashed files; the previous build's files are kept so pages
+rendered before a deploy still load.
+
+Bootstrap is downloaded once into ``static/vendor`` from the pinned CDN
+URLs and checked against the same SRI hashes the templates used.
+
+    python build_assets.py
+"""
+import argparse
+import base64
+import gzip
+import hashlib
+import json
+import os
+import re
+import sys
+import urllib.request
+
+from assets import MANIFEST, load_manifest
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+
+BUNDLES = {
+    'app.css': ['vendor/bootstrap.min.css', 'css/style.css'],
+    'app.js': ['vendor/bootstrap.bundle.min.js', 'js/test.js'],
+    'js/live.js': ['js/live.js'],
+}
+
+VENDOR = {
+    'vendor/bootstrap.min.css': (
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.0.0-beta2/dist/css/bootstrap.min.css',
+        'sha384-BmbxuPwQa2lc/FVzBcNJ7UAyJxM6wuqIj61tLrc4wSX0szH/Ev+nYRRuWlolflfl'),
+    'vendor/bootstrap.bundle.min.js': (
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.0.0-beta2/dist/js/bootstrap.bundle.min.js',
+        'sha384-b5kHyXgcpbZJO/tY9Ul7kGkf1S0CWuKcCD38l8YkeH8z8QjE0GmW1gYU5S9FOnJ0'),
+}
+
+# Source maps are not shipped, so their references would only 404.
+SOURCE_MAP_RE = re.compile(r'^\s*(//[#@] sourceMappingURL=.*|/\*# sourceMappingURL=.*\*/)\s*$',
+                           re.MULTILINE)
+CSS_COMMENT_RE = re.compile(r'/\*.*?\*/', re.DOTALL)
+CSS_SPACE_RE = re.compile(r'\s*([{};,>])\s*')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--output', default=os.path.join(STATIC_DIR, 'dist'),
+                        help="directory for the built files and manifest")
+    return parser.parse_args(argv)
+
+
+def sri(content: bytes) -> str:
+    return 'sha384-' + base64.b64encode(hashlib.sha384(content).digest()).decode('ascii')
+
+
+def fetch_vendor() -> None:
+    """Download missing vendor files and verify them against their SRI hash."""
+    for path, (url, integrity) in VENDOR.items():
+        target = os.path.join(STATIC_DIR, path)
+        if os.path.exists(target):
+            with open(target, 'rb') as fh:
+                content = fh.read()
+        else:
+            print(f"Fetching {url}", file=sys.stderr)
+            with urllib.request.urlopen(url, timeout=30) as response:
+                content = response.read()
+        if sri(content) != integrity:
+            raise SystemExit(f"{path} does not match {integrity}; delete it and rebuild")
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as fh:
+            fh.write(content)
+
+
+def minify_css(source: str) -> str:
+    source = CSS_COMMENT_RE.sub('', source)
+    source = CSS_SPACE_RE.sub(r'\1', source)
+    return re.sub(r'\s+', ' ', source).replace(';}', '}').strip()
+
+
+def minify_js(source: str) -> str:
+    """
+    Drop comment-only lines, indentation and blank lines.
+
+    Line breaks are kept, so automatic semicolon insertion behaves exactly
+    as in the source.
+    """
+    lines = (line.strip() for line in source.splitlines())
+    return '\n'.join(line for line in lines if line and not line.startswith('//'))
+
+
+def build_bundle(files) -> bytes:
+    parts = []
+    for path in files:
+        with open(os.path.join(STATIC_DIR, path), encoding='utf-8') as fh:
+            source = SOURCE_MAP_RE.sub('', fh.read())
+        if '.min.' not in path:
+            source = minify_css(source) if path.endswith('.css') else minify_js(source)
+        parts.append(source.strip())
+    # ';' keeps one JS file's last statement from running into the next.
+    separator = '\n' if files[0].endswith('.css') else '\n;\n'
+    return (separator.join(parts) + '\n').encode('utf-8')
+
+
+def hashed_name(name: str, content: bytes) -> str:
+    stem, ext = os.path.splitext(os.path.basename(name))
+    return f"{stem}.{hashlib.sha256(content).hexdigest()[:12]}{ext}"
+
+
+def write_variants(directory: str, filename: str, content: bytes) -> list:
+    """Write the file and the compressed variants that are smaller; returns the names."""
+    variants = {filename: content}
+    # mtime=0 makes the gzip output reproducible.
+    compressed = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        compressed['.br'] = brotli.compress(content, quality=11)
+    for suffix, data in compressed.items():
+        if len(data) < len(content):
+            variants[filename + suffix] = data
+    for name, data in variants.items():
+        with open(os.path.join(directory, name), 'wb') as fh:
+            fh.write(data)
+    return list(variants)
+
+
+def prune(directory: str, keep) -> None:
+    """Remove built files that belong to neither this build nor the previous one."""
+    for name in os.listdir(directory):
+        base = re.sub(r'\.(gz|br)$', '', name)
+        if name != MANIFEST and base not in keep:
+            os.remove(os.path.join(directory, name))
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    fetch_vendor()
+    os.makedirs(args.output, exist_ok=True)
+    previous = load_manifest(args.output)
+
+    manifest = {}
+    for name, files in BUNDLES.items():
+        content = build_bundle(files)
+        manifest[name] = hashed_name(name, content)
+        written = write_variants(args.output, manifest[name], content)
+        sizes = ', '.join(f"{os.path.getsize(os.path.join(args.output, w))} B" for w in written)
+        print(f"{name} -> {manifest[name]} ({sizes})")
+
+    prune(args.output, set(manifest.values()) | set(previous.values()))
+    # Written last and atomically, so a running build never exposes a
+    # manifest that points at missing files.
+    tmp = os.path.join(args.output, MANIFEST + '.tmp')
+    with open(tmp, 'w', encoding='utf-8') as fh:
+        json.dump(manifest, fh, indent=2, sort_keys=True)
+    os.replace(tmp, os.path.join(args.output, MANIFEST))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""
+Read-through cache for the todo list page.
+
+Todos are read far more often than they change, so GET ``/`` keeps both
+the page query result and the rendered HTML in a cache. Every key embeds
+a version number; write handlers call :meth:`TodoCache.invalidate`, which
+bumps the version so stale entries are simply never looked up again and
+age out of the LRU.
+
+Entries are kept in an in-process LRU, but the version lives in the
+``cache_version`` table of the main database. Every gunicorn worker, the
+ASGI app and CLI commands such as ``flask archive-todos`` read and bump
+the same row, so a write in one of them invalidates all the others. Set
+``TODO_CACHE_BACKEND`` to a shared backend (anything with ``get``, ``set``
+and ``incr``, e.g. a thin Redis wrapper) to share the entries as well.
+"""
+import threading
+from collections import OrderedDict
+
+from flask import g, has_request_context
+from sqlalchemy import text
+from werkzeug.utils import import_string
+
+from models import db
+
+VERSION_KEY = 'todos:version'
+
+# Bumps a counter, creating it on first use. Plain SQL with named
+# parameters, so asgi.py can run it on its aiosqlite connections too.
+INCREMENT_VERSION_SQL = ("INSERT INTO cache_version (name, version) VALUES (:name, 1) "
+                         "ON CONFLICT (name) DO UPDATE SET version = cache_version.version + 1")
+SELECT_VERSION_SQL = "SELECT version FROM cache_version WHERE name = :name"
+
+
+class LRUBackend:
+    """Thread-safe in-process LRU store with an integer counter."""
+
+    def __init__(self, maxsize: int = 512):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return None
+            return self._data[key]
+
+    def set(self, key, value) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def incr(self, key) -> int:
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def get_counter(self, key) -> int:
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class DatabaseLRUBackend(LRUBackend):
+    """
+    In-process LRU whose counters live in the ``cache_version`` table.
+
+    The version is read on every lookup (a primary key read), which is
+    what makes invalidation reach every process. Needs an app context.
+    """
+
+    def incr(self, key) -> int:
+        with db.engine.begin() as conn:
+            conn.execute(text(INCREMENT_VERSION_SQL), {'name': key})
+            return conn.execute(text(SELECT_VERSION_SQL), {'name': key}).scalar()
+
+    def get_counter(self, key) -> int:
+        with db.engine.connect() as conn:
+            return conn.execute(text(SELECT_VERSION_SQL), {'name': key}).scalar() or 0
+
+
+class TodoCache:
+    """Versioned cache; configure with :meth:`init_app`."""
+
+    def __init__(self):
+        self.backend = None
+
+    def init_app(self, app) -> None:
+        """
+        Pick the backend from app config.
+
+        ``TODO_CACHE_SIZE`` (default 512, 0 disables caching) sizes the
+        in-process LRU, whose version is kept in the database.
+        ``TODO_CACHE_BACKEND`` is an import path to a factory that is
+        called with the app and returns a backend.
+        """
+        factory = app.config.get('TODO_CACHE_BACKEND')
+        size = app.config.get('TODO_CACHE_SIZE', 512)
+        if factory:
+            self.backend = import_string(factory)(app)
+        elif size > 0:
+            self.backend = DatabaseLRUBackend(size)
+        else:
+            self.backend = None
+        app.extensions['todo_cache'] = self
+
+    def version(self) -> int:
+        """The current version; read once per request, as it may be a query."""
+        if not has_request_context():
+            return self._read_version()
+        if 'todo_cache_version' not in g:
+            g.todo_cache_version = self._read_version()
+        return g.todo_cache_version
+
+    def _read_version(self) -> int:
+        if isinstance(self.backend, LRUBackend):
+            return self.backend.get_counter(VERSION_KEY)
+        return int(self.backend.get(VERSION_KEY) or 0)
+
+    def invalidate(self) -> None:
+        """Drop every cached entry by moving to a new version; call after the commit."""
+        if self.backend is not None:
+            self.backend.incr(VERSION_KEY)
+            if has_request_context():
+                g.pop('todo_cache_version', None)
+
+    def get_or_set(self, key, factory):
+        """
+        Return the cached value for ``key`` or store ``factory()``.
+
+        ``key`` is any value with a stable ``repr`` (a tuple of the inputs
+        the result depends on); the current version is prepended to it.
+        """
+        if self.backend is None:
+            return factory()
+        full_key = f"todos:{self.version()}:{key!r}"
+        value = self.backend.get(full_key)
+        if value is None:
+            value = factory()
+            self.backend.set(full_key, value)
+        return value
+
+
+cache = TodoCache()
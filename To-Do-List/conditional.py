@@ -0,0 +1,35 @@
+"""
+Conditional GET helpers.
+
+Pages are rendered only when the client's copy is stale: the ETag and
+Last-Modified validators are computed first from cheap queries, and a
+matching If-None-Match / If-Modified-Since request gets an empty 304.
+"""
+import hashlib
+
+from flask import make_response, request
+from werkzeug.http import is_resource_modified
+
+
+def make_etag(*parts) -> str:
+    """Hash the values a response depends on into an ETag."""
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def conditional_response(etag: str, last_modified, render):
+    """
+    Return a 304 if the client is up to date, otherwise ``render()``.
+
+    ``render`` is only called when a full response is needed. Responses
+    carry ``Cache-Control: no-cache`` so browsers revalidate every time
+    instead of showing a stale list.
+    """
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = make_response('', 304)
+    else:
+        response = make_response(render())
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
@@ -0,0 +1,162 @@
+"""
+Database engine configuration.
+
+SQLite defaults (rollback journal, FULL sync, no busy timeout) make
+concurrent gunicorn workers fail with "database is locked" and block
+readers behind every commit. This module
+
+* applies WAL, synchronous=NORMAL, busy_timeout and mmap_size to every
+  new SQLite connection,
+* sizes the connection pool per worker from the gunicorn thread count,
+* optionally opens a separate read-only engine for GET routes
+  (``DATABASE_READ_URL``), exposed through :func:`read_session`,
+* points the ``archive`` bind at ``ARCHIVE_DATABASE_URL`` (defaults to
+  the main database).
+
+All settings come from environment variables so they can differ per
+deployment without code changes.
+"""
+import os
+import sqlite3
+
+from flask import current_app
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.pool import QueuePool
+
+from models import db
+
+# Values applied by the connect listener below; filled in by
+# configure_database() so the listener does not need an app context.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    'foreign_keys': 'ON',
+}
+
+# Special DATABASE_READ_URL value: open the primary SQLite file read-only.
+READ_ONLY_PRIMARY = 'readonly'
+
+_read_sessions = scoped_session(sessionmaker())
+
+
+@event.listens_for(Engine, 'connect')
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            try:
+                cursor.execute(f"PRAGMA {name}={value}")
+            except sqlite3.OperationalError:
+                # e.g. journal_mode on a read-only connection before the
+                # writer has switched the file to WAL.
+                pass
+    finally:
+        cursor.close()
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, default))
+
+
+def pool_size() -> int:
+    """
+    Connections per worker process.
+
+    Each gunicorn worker owns its own pool, so the pool only has to cover
+    that worker's threads (GUNICORN_THREADS, default 1 for sync workers)
+    plus a little headroom for background work.
+    """
+    threads = _env_int('GUNICORN_THREADS', 1)
+    return _env_int('DB_POOL_SIZE', threads + 1)
+
+
+def engine_options(uri: str) -> dict:
+    """SQLAlchemy create_engine() keyword arguments for ``uri``."""
+    url = make_url(uri)
+    if url.get_backend_name() != 'sqlite':
+        return {
+            'pool_size': pool_size(),
+            'max_overflow': _env_int('DB_MAX_OVERFLOW', pool_size()),
+            'pool_pre_ping': True,
+        }
+    if not url.database or url.database == ':memory:':
+        # In-memory databases live and die with a single connection.
+        return {}
+    return {
+        'poolclass': QueuePool,
+        'pool_size': pool_size(),
+        'max_overflow': _env_int('DB_MAX_OVERFLOW', pool_size()),
+        'pool_timeout': _env_int('DB_POOL_TIMEOUT', 30),
+        'connect_args': {
+            # Pooled connections are handed between threads; the pool
+            # guarantees only one thread uses a connection at a time.
+            'check_same_thread': False,
+            'timeout': SQLITE_PRAGMAS['busy_timeout'] / 1000,
+        },
+    }
+
+
+def configure_database(app) -> None:
+    """Fill in database settings on ``app.config`` before db.init_app()."""
+    SQLITE_PRAGMAS['busy_timeout'] = _env_int('SQLITE_BUSY_TIMEOUT_MS', SQLITE_PRAGMAS['busy_timeout'])
+    SQLITE_PRAGMAS['mmap_size'] = _env_int('SQLITE_MMAP_SIZE', SQLITE_PRAGMAS['mmap_size'])
+    SQLITE_PRAGMAS['synchronous'] = os.environ.get('SQLITE_SYNCHRONOUS', SQLITE_PRAGMAS['synchronous'])
+
+    uri = app.config.get('SQLALCHEMY_DATABASE_URI') or os.environ.get('DATABASE_URL', "sqlite:///todo.db")
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(uri))
+    app.config.setdefault('SQLALCHEMY_READ_DATABASE_URI', os.environ.get('DATABASE_READ_URL'))
+    # Archived todos go to their own file when ARCHIVE_DATABASE_URL is set.
+    binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+    binds.setdefault('archive', os.environ.get('ARCHIVE_DATABASE_URL', uri))
+
+    @app.teardown_appcontext
+    def _remove_read_session(exc):
+        _read_sessions.remove()
+
+
+def init_read_engine(app) -> None:
+    """
+    Create the read-only engine, if one is configured.
+
+    Needs an application context, because the ``readonly`` shortcut
+    resolves the primary SQLite file from the already created engine.
+    """
+    uri = app.config.get('SQLALCHEMY_READ_DATABASE_URI')
+    if not uri:
+        return
+    shards = app.extensions.get('todo_shards')
+    if shards is not None and shards.enabled:
+        # A replica of the main file would not see the tenants' shard files.
+        app.logger.warning("DATABASE_READ_URL is ignored when TODO_SHARDS is set")
+        return
+    if uri == READ_ONLY_PRIMARY:
+        path = db.engine.url.database
+        uri = f"sqlite:///file:{path}?mode=ro&uri=true"
+
+    engine = create_engine(uri, **engine_options(uri))
+    if engine.dialect.name == 'sqlite':
+        @event.listens_for(engine, 'connect')
+        def _query_only(dbapi_connection, connection_record):
+            dbapi_connection.execute("PRAGMA query_only=ON")
+
+    app.extensions['todo_read_engine'] = engine
+    _read_sessions.configure(bind=engine)
+
+
+def read_session():
+    """
+    Session for read-only queries.
+
+    Uses the read-only engine when DATABASE_READ_URL is set and the
+    regular read-write session otherwise, so callers do not need to care.
+    """
+    if 'todo_read_engine' in current_app.extensions:
+        return _read_sessions
+    return db.session
@@ -0,0 +1,173 @@
+"""
+Group commit for todo creation.
+
+Every form POST to ``/`` normally runs its own transaction, so a burst of
+submissions becomes a queue of single-row commits behind SQLite's one
+writer lock, each paying for its own journal sync. With
+``GROUP_COMMIT`` enabled, request threads hand their new todo to a
+committer thread instead and wait. The committer takes whatever arrived
+within ``GROUP_COMMIT_WINDOW_MS`` (up to ``GROUP_COMMIT_MAX_BATCH`` todos),
+inserts them in one transaction together with their outbox events and
+then wakes every waiting request with its ``sno``. A request only returns
+after the transaction holding its todo has committed.
+
+Todos of different tenants (or shards) are never mixed in one batch.
+
+Batching only happens between requests served concurrently by one
+process, so it pays off with threaded workers (``GUNICORN_THREADS`` > 1).
+"""
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+
+from cache import cache
+from models import Todo, current_owner_id, db, shard_engine
+from tasks import tasks
+
+
+class GroupCommitter:
+    """Batches todo inserts from concurrent requests; see :meth:`init_app`."""
+
+    def __init__(self):
+        self.app = None
+        self.queue = queue.Queue()
+        self.counters = {'batches': 0, 'todos': 0}
+        self._counter_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._started = False
+        self._stopping = threading.Event()
+
+    def init_app(self, app) -> None:
+        """
+        Read settings.
+
+        ``GROUP_COMMIT`` (default off) turns batching on,
+        ``GROUP_COMMIT_WINDOW_MS`` (default 2) is how long the committer
+        waits for more todos after the first one, ``GROUP_COMMIT_MAX_BATCH``
+        (default 200) caps a transaction and ``GROUP_COMMIT_TIMEOUT``
+        (seconds, default 10) is how long a request waits for its commit.
+        """
+        app.config.setdefault('GROUP_COMMIT', False)
+        app.config.setdefault('GROUP_COMMIT_WINDOW_MS', 2)
+        app.config.setdefault('GROUP_COMMIT_MAX_BATCH', 200)
+        app.config.setdefault('GROUP_COMMIT_TIMEOUT', 10)
+        self.app = app
+        app.extensions['todo_group_commit'] = self
+
+    def create(self, title: str, desc: str, **fields) -> dict:
+        """
+        Insert one todo and return its ``to_dict()`` once it is committed.
+
+        ``fields`` sets further columns (``due_date``, ``priority``). Runs
+        in the caller's transaction when group commit is off.
+        """
+        owner_id = current_owner_id()
+        if not self.app.config['GROUP_COMMIT']:
+            todo = Todo(title=title, desc=desc, owner_id=owner_id, **fields)
+            db.session.add(todo)
+            db.session.flush()
+            created = todo.to_dict()
+            tasks.record('todo.created', [created])
+            db.session.commit()
+            cache.invalidate()
+            return created
+
+        self.start()
+        future = Future()
+        # The committer thread does not see this request's tenant or shard.
+        self.queue.put((dict(fields, title=title, desc=desc, owner_id=owner_id),
+                        shard_engine.get(), future))
+        return future.result(timeout=self.app.config['GROUP_COMMIT_TIMEOUT'])
+
+    def start(self) -> None:
+        """Start the committer thread once per process."""
+        if self._started:
+            return
+        with self._start_lock:
+            if self._started:
+                return
+            threading.Thread(target=self._run, name='todo-group-commit', daemon=True).start()
+            self._started = True
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    def _collect(self) -> list:
+        """Block for one item, then take what arrives within the window."""
+        try:
+            batch = [self.queue.get(timeout=1)]
+        except queue.Empty:
+            return []
+        limit = self.app.config['GROUP_COMMIT_MAX_BATCH']
+        deadline = time.monotonic() + self.app.config['GROUP_COMMIT_WINDOW_MS'] / 1000
+        while len(batch) < limit:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self.queue.get(timeout=remaining) if remaining > 0
+                             else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            batch = self._collect()
+            if not batch:
+                continue
+            groups = defaultdict(list)
+            for fields, engine, future in batch:
+                groups[fields['owner_id'], engine].append((fields, future))
+            with self.app.app_context():
+                for (owner_id, engine), group in groups.items():
+                    token = shard_engine.set(engine)
+                    try:
+                        self._commit_group(owner_id, group)
+                    finally:
+                        shard_engine.reset(token)
+
+    def _commit_group(self, owner_id, group) -> None:
+        try:
+            committed = [(group, self._commit(owner_id, group))]
+        except Exception:
+            db.session.rollback()
+            # One bad row must not fail its neighbours: retry alone.
+            committed = []
+            for item in group:
+                try:
+                    committed.append(([item], self._commit(owner_id, [item])))
+                except Exception as exc:
+                    db.session.rollback()
+                    item[1].set_exception(exc)
+        if not committed:
+            return
+        for items, created in committed:
+            self._count('batches')
+            self._count('todos', len(items))
+            for (_, future), todo in zip(items, created):
+                future.set_result(todo)
+        # The rows are saved whatever happens here; a failed invalidation
+        # must not send them through the retry above a second time.
+        try:
+            cache.invalidate()
+        except Exception:
+            db.session.rollback()
+            self.app.logger.exception("Invalidating the page cache after a group commit failed")
+
+    def _commit(self, owner_id, group) -> list:
+        """Insert ``group`` in one transaction and return the new todos' dicts."""
+        todos = [Todo(**fields) for fields, _ in group]
+        db.session.add_all(todos)
+        db.session.flush()
+        created = [todo.to_dict() for todo in todos]
+        tasks.record('todo.created', created, owner_id=owner_id)
+        db.session.commit()
+        return created
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._counter_lock:
+            self.counters[name] += amount
+
+
+committer = GroupCommitter()
@@ -0,0 +1,9 @@
+# Loaded automatically by `gunicorn app:app` from this directory.
+# database.py sizes each worker's connection pool from GUNICORN_THREADS,
+# so keep the two in sync by configuring threads here rather than on the
+# command line.
+import multiprocessing
+import os
+
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
@@ -0,0 +1,233 @@
+"""
+Live updates for open todo pages over server-sent events.
+
+Every write path already records an ``outbox`` event in the same
+transaction as the change (see tasks.py), so the outbox doubles as the
+change feed: one poller thread per process reads new rows by id and fans
+them out to the connected ``/events`` streams. Commits made in this
+process wake the poller at once; changes from other workers or processes
+arrive within ``LIVE_POLL_INTERVAL``. The poller only queries while
+someone is listening.
+
+Under gunicorn's sync workers every open stream holds a worker for up to
+``LIVE_MAX_STREAM_SECONDS``, so a few open tabs would take the whole site
+down. The WSGI app therefore only serves the feed with ``LIVE_UPDATES``
+on, which needs threaded workers (``GUNICORN_THREADS``); asgi.py serves it
+always, as an idle stream costs it no thread.
+
+Each stream only carries the events of its own tenant (see tenant.py).
+The outbox id is the SSE event id, so a reconnecting browser sends
+``Last-Event-ID`` and gets exactly the events it missed. A client whose
+backlog has already been purged from the outbox gets a ``reset`` event
+and should reload.
+"""
+import json
+import queue
+import threading
+import time
+
+from flask import Response, request, stream_with_context
+from sqlalchemy import event
+
+from models import OutboxEvent, current_owner_id, db
+
+
+class Subscriber:
+    """One open stream; ``send(events)`` hands it a batch of outbox rows."""
+
+    def __init__(self, send, owner_id=None):
+        self.send = send
+        self.owner_id = owner_id
+        self.overflowed = False
+
+    def mine(self, rows) -> list:
+        """The rows of this subscriber's tenant."""
+        return [row for row in rows if row.owner_id == self.owner_id]
+
+
+class LiveFeed:
+    """Outbox-backed event feed; configure with :meth:`init_app`."""
+
+    def __init__(self):
+        self.app = None
+        self.subscribers = set()
+        self.last_id = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._started = False
+        self._stopping = threading.Event()
+
+    def init_app(self, app) -> None:
+        """
+        Register ``/events`` and hook into session commits.
+
+        ``LIVE_UPDATES`` (default False) turns the feed on; when it is off
+        pages do not load live.js and ``/events`` answers 204, which tells
+        browsers not to reconnect. ``LIVE_POLL_INTERVAL`` (seconds, default 1) is how often the outbox
+        is checked for changes made by other processes, ``LIVE_KEEPALIVE``
+        (default 15) how often idle streams get a comment line,
+        ``LIVE_QUEUE_SIZE`` (default 100) how many undelivered batches a slow
+        client may fall behind before it is disconnected, and
+        ``LIVE_MAX_STREAM_SECONDS`` (default 300) when a stream is closed
+        so the browser reconnects and hands the worker back.
+        """
+        app.config.setdefault('LIVE_UPDATES', False)
+        app.config.setdefault('LIVE_POLL_INTERVAL', 1.0)
+        app.config.setdefault('LIVE_KEEPALIVE', 15)
+        app.config.setdefault('LIVE_QUEUE_SIZE', 100)
+        app.config.setdefault('LIVE_MAX_STREAM_SECONDS', 300)
+        app.config.setdefault('LIVE_BATCH', 500)
+        self.app = app
+        app.extensions['todo_live'] = self
+        app.jinja_env.globals['live_updates'] = app.config['LIVE_UPDATES']
+        app.add_url_rule('/events', 'events', self.stream)
+        event.listen(db.session, 'after_commit', self._after_commit)
+
+    def _after_commit(self, session) -> None:
+        self.notify()
+
+    def notify(self) -> None:
+        """Poll now; for commits made outside ``db.session`` (see asgi.py)."""
+        if self.subscribers:
+            self._wake.set()
+
+    def start(self) -> None:
+        """Start the poller thread once per process."""
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            threading.Thread(target=self._poll, name='todo-live', daemon=True).start()
+            self._started = True
+
+    def stop(self) -> None:
+        self._stopping.set()
+        self._wake.set()
+
+    def _latest_id(self) -> int:
+        return db.session.query(db.func.max(OutboxEvent.id)).scalar() or 0
+
+    def _events_after(self, last_id: int, up_to=None) -> list:
+        query = (db.session.query(OutboxEvent.id, OutboxEvent.kind, OutboxEvent.payload,
+                                  OutboxEvent.owner_id)
+                 .filter(OutboxEvent.id > last_id))
+        if up_to is not None:
+            query = query.filter(OutboxEvent.id <= up_to)
+        return query.order_by(OutboxEvent.id).limit(self.app.config['LIVE_BATCH']).all()
+
+    def subscribe(self, send, last_id=None, owner_id=None) -> Subscriber:
+        """
+        Register ``send`` for new events of ``owner_id``. Needs an app context.
+
+        With ``last_id`` (the client's Last-Event-ID) the events since then
+        are sent first; ``[None]`` is sent if they are no longer available.
+        ``send`` must not block and raises ``queue.Full`` when the client
+        cannot keep up.
+        """
+        subscriber = Subscriber(send, owner_id)
+        with self._lock:
+            if self.last_id is None:
+                self.last_id = self._latest_id()
+            if last_id is not None and last_id < self.last_id:
+                oldest = db.session.query(db.func.min(OutboxEvent.id)).scalar()
+                backlog = self._events_after(last_id, up_to=self.last_id)
+                # Purged, or more than one batch behind: start over.
+                if (oldest is None or oldest > last_id + 1
+                        or len(backlog) == self.app.config['LIVE_BATCH']):
+                    send([None])
+                else:
+                    backlog = subscriber.mine(backlog)
+                    if backlog:
+                        send(backlog)
+            self.subscribers.add(subscriber)
+        self.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber) -> None:
+        with self._lock:
+            self.subscribers.discard(subscriber)
+
+    def _poll(self) -> None:
+        while not self._stopping.is_set():
+            self._wake.wait(self.app.config['LIVE_POLL_INTERVAL'])
+            self._wake.clear()
+            if not self.subscribers:
+                continue
+            try:
+                with self.app.app_context():
+                    self.publish_new()
+            except Exception:
+                self.app.logger.exception("Live feed poll failed")
+
+    def publish_new(self) -> int:
+        """Send outbox rows newer than the last poll to every subscriber."""
+        rows = self._events_after(self.last_id)
+        if not rows:
+            return 0
+        with self._lock:
+            for subscriber in list(self.subscribers):
+                mine = subscriber.mine(rows)
+                if not mine:
+                    continue
+                try:
+                    subscriber.send(mine)
+                except queue.Full:
+                    # The client reconnects and catches up by Last-Event-ID.
+                    subscriber.overflowed = True
+                    self.subscribers.discard(subscriber)
+            self.last_id = rows[-1].id
+        return len(rows)
+
+    def stream(self):
+        """``GET /events``: the feed as ``text/event-stream``."""
+        if not self.app.config['LIVE_UPDATES']:
+            return Response(status=204)
+        last_id = request.headers.get('Last-Event-ID', type=int)
+        if last_id is None:
+            last_id = request.args.get('last_event_id', type=int)
+        batches = queue.Queue(maxsize=self.app.config['LIVE_QUEUE_SIZE'])
+        subscriber = self.subscribe(batches.put_nowait, last_id, current_owner_id())
+        keepalive = self.app.config['LIVE_KEEPALIVE']
+        deadline = time.monotonic() + self.app.config['LIVE_MAX_STREAM_SECONDS']
+
+        def generate():
+            try:
+                yield format_retry(self.app.config['LIVE_POLL_INTERVAL'])
+                while not subscriber.overflowed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        rows = batches.get(timeout=min(keepalive, remaining))
+                    except queue.Empty:
+                        yield ": keep-alive\n\n"
+                        continue
+                    yield format_events(rows)
+            finally:
+                self.unsubscribe(subscriber)
+
+        return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                        headers=STREAM_HEADERS)
+
+
+# Proxies such as nginx would otherwise buffer the stream.
+STREAM_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+
+def format_retry(poll_interval: float) -> str:
+    return f"retry: {int(poll_interval * 1000) + 1000}\n\n"
+
+
+def format_events(rows) -> str:
+    """Serialize a batch of outbox rows as SSE messages."""
+    messages = []
+    for row in rows:
+        if row is None:
+            messages.append(f"event: reset\ndata: {json.dumps({})}\n\n")
+        else:
+            messages.append(f"id: {row.id}\nevent: {row.kind}\ndata: {row.payload}\n\n")
+    return ''.join(messages)
+
+
+live = LiveFeed()
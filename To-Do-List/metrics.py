@@ -0,0 +1,187 @@
+"""
+Request timing and SQL instrumentation.
+
+For every request this records the latency per route, how many SQL
+statements ran and how long they took (via SQLAlchemy cursor events),
+and flags likely N+1 patterns: the same statement executed many times
+within one request. Requests slower than ``SLOW_REQUEST_MS`` are logged
+with their SQL breakdown. Everything is exposed at ``/metrics`` in the
+Prometheus text format.
+
+Numbers are kept per process; with several gunicorn workers Prometheus
+should scrape each worker or aggregate the series.
+"""
+import threading
+import time
+from collections import Counter, defaultdict
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+
+
+class Histogram:
+    """Cumulative Prometheus-style histogram, one series per label set."""
+
+    def __init__(self, name: str, help_text: str, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.series = defaultdict(lambda: [[0] * len(buckets), 0.0, 0])
+
+    def observe(self, labels: tuple, value: float) -> None:
+        counts, _, _ = series = self.series[labels]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self, label_names) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(self.series.items()):
+            base = _labels(label_names, labels)
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{base},le="{bound}"}} {bucket_count}')
+            lines.append(f'{self.name}_bucket{{{base},le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{base}}} {total}")
+            lines.append(f"{self.name}_count{{{base}}} {count}")
+        return lines
+
+
+def _labels(names, values) -> str:
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return ','.join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+
+
+class Metrics:
+    """Collects request and SQL metrics; configure with :meth:`init_app`."""
+
+    ROUTE_LABELS = ('route', 'method')
+
+    def __init__(self):
+        self.app = None
+        self.lock = threading.Lock()
+        self.latency = Histogram('todo_request_duration_seconds',
+                                 'Request latency by route.', LATENCY_BUCKETS)
+        self.sql_time = Histogram('todo_request_sql_seconds',
+                                  'Time spent in SQL per request, by route.', LATENCY_BUCKETS)
+        self.sql_statements = Histogram('todo_request_sql_statements',
+                                        'SQL statements per request, by route.', STATEMENT_BUCKETS)
+        self.responses = Counter()
+        self.n_plus_one = Counter()
+        self.slow_requests = Counter()
+
+    def init_app(self, app) -> None:
+        """
+        Hook into the request cycle and register ``/metrics``.
+
+        ``SLOW_REQUEST_MS`` (default 500) is the slow-request log
+        threshold; ``N_PLUS_ONE_THRESHOLD`` (default 10) is how often one
+        statement may repeat within a request before it is reported.
+        """
+        app.config.setdefault('SLOW_REQUEST_MS', 500)
+        app.config.setdefault('N_PLUS_ONE_THRESHOLD', 10)
+        self.app = app
+        app.extensions['todo_metrics'] = self
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.add_url_rule('/metrics', 'metrics', self.render)
+
+    def _start_request(self) -> None:
+        g.metrics_started = time.perf_counter()
+        g.sql_count = 0
+        g.sql_seconds = 0.0
+        g.sql_shapes = Counter()
+
+    def _finish_request(self, response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        labels = (route, request.method)
+        repeated = [(sql, count) for sql, count in g.sql_shapes.items()
+                    if count >= self.app.config['N_PLUS_ONE_THRESHOLD']]
+
+        with self.lock:
+            self.latency.observe(labels, elapsed)
+            self.sql_time.observe(labels, g.sql_seconds)
+            self.sql_statements.observe(labels, g.sql_count)
+            self.responses[labels + (response.status_code,)] += 1
+            if repeated:
+                self.n_plus_one[labels] += 1
+            if elapsed * 1000 >= self.app.config['SLOW_REQUEST_MS']:
+                self.slow_requests[labels] += 1
+
+        for sql, count in repeated:
+            self.app.logger.warning("Possible N+1 on %s %s: %d x %s",
+                                    request.method, route, count, sql)
+        if elapsed * 1000 >= self.app.config['SLOW_REQUEST_MS']:
+            self.app.logger.warning(
+                "Slow request %s %s: %.1f ms (%d SQL statements, %.1f ms in SQL)",
+                request.method, request.full_path, elapsed * 1000,
+                g.sql_count, g.sql_seconds * 1000)
+        return response
+
+    def render(self):
+        with self.lock:
+            lines = []
+            for histogram in (self.latency, self.sql_time, self.sql_statements):
+                lines.extend(histogram.render(self.ROUTE_LABELS))
+            for name, help_text, counter, label_names in (
+                ('todo_responses_total', 'Responses by route and status.',
+                 self.responses, self.ROUTE_LABELS + ('status',)),
+                ('todo_n_plus_one_total', 'Requests that repeated one SQL statement too often.',
+                 self.n_plus_one, self.ROUTE_LABELS),
+                ('todo_slow_requests_total', 'Requests over SLOW_REQUEST_MS.',
+                 self.slow_requests, self.ROUTE_LABELS),
+            ):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} counter")
+                for labels, value in sorted(counter.items()):
+                    lines.append(f"{name}{{{_labels(label_names, labels)}}} {value}")
+
+        tasks = self.app.extensions.get('todo_tasks')
+        if tasks is not None:
+            for key, value in sorted(tasks.stats().items()):
+                if key in tasks.counters:
+                    lines.append(f"# TYPE todo_tasks_{key}_total counter")
+                    lines.append(f"todo_tasks_{key}_total {value}")
+                else:
+                    lines.append(f"# TYPE todo_tasks_{key} gauge")
+                    lines.append(f"todo_tasks_{key} {value}")
+
+        limiter = self.app.extensions.get('todo_rate_limit')
+        if limiter is not None:
+            for key, value in sorted(limiter.counters.items()):
+                lines.append(f"# TYPE todo_writes_{key}_total counter")
+                lines.append(f"todo_writes_{key}_total {value}")
+
+        return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context() or not conn.info.get('query_started'):
+        return
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    if 'sql_count' not in g:
+        return
+    g.sql_count += 1
+    g.sql_seconds += elapsed
+    # Parameters are bound separately, so the text is the statement's shape.
+    g.sql_shapes[statement] += 1
+
+
+metrics = Metrics()
@@ -0,0 +1,341 @@
+"""
+Versioned schema migrations.
+
+Each database records the migrations it has run in ``schema_migrations``.
+Migrations are numbered functions in ``MIGRATIONS`` and only ever added
+at the end; every step is written to be safe to re-run, so databases
+created by older versions of the app (which only had ``create_all()``)
+are brought up to date by the same list.
+
+Changes are made so the app can keep serving while they run:
+
+* new columns are nullable, which is a metadata-only ``ALTER TABLE``,
+* backfills update ``MIGRATION_BATCH`` rows per transaction and pause
+  ``MIGRATION_PAUSE`` seconds in between, so request writes get the lock,
+* each index is built in a transaction of its own (``CONCURRENTLY`` on
+  PostgreSQL; SQLite has no concurrent build and holds the write lock for
+  the length of one index build).
+
+Databases are migrated separately: the main one, the archive database if
+``ARCHIVE_DATABASE_URL`` points elsewhere, and every shard of shards.py,
+each for the tables it holds.
+
+    flask db status    # applied and pending migrations per database
+    flask db upgrade   # run pending migrations
+    flask db verify    # check the schema against the models; exit 1 on drift
+
+With ``MIGRATE_ON_STARTUP`` (default on) the app upgrades when it starts;
+turn it off for large databases and run ``flask db upgrade`` before
+deploying instead.
+"""
+import time
+from collections import namedtuple
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, text
+from sqlalchemy.schema import CreateIndex
+
+from models import (SHARDED_TABLES, CacheVersion, IdSequence, OutboxEvent, Todo, TodoArchive,
+                    TodoList, User, bind_engine, db)
+
+# Creation order: todo references todo_list.
+MODELS = (User, TodoList, Todo, TodoArchive, OutboxEvent, IdSequence, CacheVersion)
+TABLES = {model.__table__.name: model.__table__ for model in MODELS}
+
+version_table = Table(
+    'schema_migrations', MetaData(),
+    Column('version', Integer, primary_key=True, autoincrement=False),
+    Column('name', String(100), nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+Migration = namedtuple('Migration', 'version name tables func')
+Location = namedtuple('Location', 'name engine tables')
+
+MIGRATIONS = []
+
+
+def migration(version: int, name: str, tables):
+    """Register ``func(location)`` as migration ``version`` touching ``tables``."""
+    def decorator(func):
+        assert not MIGRATIONS or MIGRATIONS[-1].version < version, "append migrations in order"
+        MIGRATIONS.append(Migration(version, name, frozenset(tables), func))
+        return func
+    return decorator
+
+
+def locations() -> list:
+    """Every database and the tables it holds. Needs an app context."""
+    archive = bind_engine('archive')
+    separate_archive = str(archive.url) != str(db.engine.url)
+    main_tables = set(TABLES) - ({'todo_archive'} if separate_archive else set())
+    found = [Location('main', db.engine, frozenset(main_tables))]
+    if separate_archive:
+        found.append(Location('archive', archive, frozenset({'todo_archive'})))
+    shards = current_app.extensions.get('todo_shards')
+    for name, engine in (shards.engines.items() if shards is not None else ()):
+        found.append(Location(f'shard {name}', engine, SHARDED_TABLES))
+    return found
+
+
+def applied_versions(engine) -> set:
+    version_table.create(bind=engine, checkfirst=True)
+    with engine.connect() as conn:
+        return {row[0] for row in conn.execute(version_table.select())}
+
+
+def pending(location) -> list:
+    done = applied_versions(location.engine)
+    return [m for m in MIGRATIONS if m.version not in done]
+
+
+def upgrade(logger) -> list:
+    """Run pending migrations everywhere; returns ``(location, migration)`` pairs."""
+    ran = []
+    for location in locations():
+        for step in pending(location):
+            if step.tables & location.tables:
+                started = time.perf_counter()
+                step.func(location)
+                logger.info("Migration %d (%s) on %s took %.1f s", step.version, step.name,
+                            location.name, time.perf_counter() - started)
+            with location.engine.begin() as conn:
+                # A worker starting at the same time may have just done it.
+                if not conn.execute(version_table.select().where(
+                        version_table.c.version == step.version)).first():
+                    conn.execute(version_table.insert().values(
+                        version=step.version, name=step.name, applied_at=datetime.utcnow()))
+            ran.append((location, step))
+    return ran
+
+
+def verify() -> list:
+    """Differences between the databases and the models, as messages."""
+    problems = []
+    for location in locations():
+        for step in pending(location):
+            problems.append(f"{location.name}: migration {step.version} ({step.name}) not applied")
+        inspector = inspect(location.engine)
+        existing_tables = set(inspector.get_table_names())
+        for name in sorted(location.tables):
+            if name not in existing_tables:
+                problems.append(f"{location.name}: table {name} is missing")
+                continue
+            columns = {column['name'] for column in inspector.get_columns(name)}
+            for column in TABLES[name].columns:
+                if column.name not in columns:
+                    problems.append(f"{location.name}: column {name}.{column.name} is missing")
+            indexes = {index['name'] for index in inspector.get_indexes(name)}
+            for index in TABLES[name].indexes:
+                if index.name not in indexes:
+                    problems.append(f"{location.name}: index {index.name} is missing")
+    return problems
+
+
+def add_column(location, table_name: str, column_name: str) -> bool:
+    """Add a model column the table does not have yet; False if it exists."""
+    engine = location.engine
+    if column_name in {c['name'] for c in inspect(engine).get_columns(table_name)}:
+        return False
+    column = TABLES[table_name].columns[column_name]
+    column_type = column.type.compile(dialect=engine.dialect)
+    ddl = f'ALTER TABLE {table_name} ADD COLUMN "{column_name}" {column_type}'
+    if column.server_default is not None:
+        # A constant default fills existing rows without rewriting them
+        # (SQLite, PostgreSQL 11+), so such a column may be NOT NULL.
+        ddl += f" DEFAULT {column.server_default.arg.text}"
+        if not column.nullable:
+            ddl += " NOT NULL"
+    with engine.begin() as conn:
+        conn.execute(text(ddl))
+    return True
+
+
+def create_index(location, index) -> bool:
+    """Build one model index in its own transaction; False if it exists."""
+    engine = location.engine
+    if index.name in {i['name'] for i in inspect(engine).get_indexes(index.table.name)}:
+        return False
+    sql = str(CreateIndex(index).compile(dialect=engine.dialect))
+    if engine.dialect.name == 'postgresql':
+        # Builds without blocking writes; cannot run inside a transaction.
+        sql = sql.replace('CREATE INDEX', 'CREATE INDEX CONCURRENTLY', 1)
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.execute(text(sql))
+    else:
+        with engine.begin() as conn:
+            conn.execute(text(sql))
+    return True
+
+
+def create_indexes(location, table_name: str, names) -> None:
+    """Build the named model indexes of ``table_name``, one at a time."""
+    indexes = {index.name: index for index in TABLES[table_name].indexes}
+    for name in names:
+        create_index(location, indexes[name])
+
+
+def drop_index(location, name: str) -> None:
+    with location.engine.begin() as conn:
+        conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+
+def backfill(location, table_name: str, assignment: str, condition: str) -> int:
+    """
+    ``UPDATE table SET assignment WHERE condition`` in small transactions.
+
+    ``condition`` must stop matching a row once it has been updated.
+    Returns the number of rows updated.
+    """
+    key = TABLES[table_name].primary_key.columns.values()[0].name
+    batch = current_app.config['MIGRATION_BATCH']
+    sql = text(f"UPDATE {table_name} SET {assignment} WHERE {key} IN "
+               f"(SELECT {key} FROM {table_name} WHERE {condition} LIMIT :batch)")
+    total = 0
+    while True:
+        with location.engine.begin() as conn:
+            updated = conn.execute(sql, {'batch': batch}).rowcount
+        total += updated
+        if updated < batch:
+            return total
+        time.sleep(current_app.config['MIGRATION_PAUSE'])
+
+
+def _hosted(location, models):
+    return [model.__table__ for model in models if model.__table__.name in location.tables]
+
+
+@migration(1, 'create tables', TABLES)
+def create_tables(location):
+    for table in _hosted(location, MODELS):
+        table.create(bind=location.engine, checkfirst=True)
+
+
+@migration(2, 'todo.updated_at', {'todo'})
+def add_updated_at(location):
+    if add_column(location, 'todo', 'updated_at'):
+        backfill(location, 'todo', 'updated_at = date_created', 'updated_at IS NULL')
+
+
+@migration(3, 'todo.deleted_at', {'todo'})
+def add_deleted_at(location):
+    add_column(location, 'todo', 'deleted_at')
+
+
+@migration(4, 'tenant columns', {'todo', 'todo_archive', 'outbox'})
+def add_tenant_columns(location):
+    for table, columns in (('todo', ('owner_id', 'list_id')),
+                           ('todo_archive', ('owner_id', 'list_id')),
+                           ('outbox', ('owner_id',))):
+        if table in location.tables:
+            for column in columns:
+                add_column(location, table, column)
+
+
+@migration(5, 'todo indexes', {'todo'})
+def todo_indexes(location):
+    # Replaced by the partial, owner-leading keyset index.
+    drop_index(location, 'ix_todo_date_created_sno')
+    # Named, because later migrations add indexes on columns that do not
+    # exist yet at this step.
+    create_indexes(location, 'todo', ('ix_todo_deleted_at', 'ix_todo_live_date_created_sno',
+                                      'ix_todo_owner_live_date_created_sno', 'ix_todo_updated_at'))
+
+
+@migration(6, 'todo due dates and priorities', {'todo', 'todo_archive'})
+def add_planning_columns(location):
+    for table in ('todo', 'todo_archive'):
+        if table in location.tables:
+            for column in ('due_date', 'priority', 'completed_at'):
+                add_column(location, table, column)
+    if 'todo' in location.tables:
+        create_indexes(location, 'todo', ('ix_todo_owner_open_due_priority',
+                                          'ix_todo_owner_open_undated_priority'))
+
+
+@migration(7, 'cache versions', {'cache_version'})
+def create_cache_version(location):
+    for table in _hosted(location, (CacheVersion,)):
+        table.create(bind=location.engine, checkfirst=True)
+
+
+@migration(8, 'todo completed index', {'todo'})
+def completed_index(location):
+    create_indexes(location, 'todo', ('ix_todo_live_completed_at',))
+
+
+class Migrator:
+    """Runs migrations at startup and from the CLI; see :meth:`init_app`."""
+
+    def __init__(self):
+        self.app = None
+
+    def init_app(self, app) -> None:
+        """
+        ``MIGRATE_ON_STARTUP`` (default True), ``MIGRATION_BATCH`` (rows
+        per backfill transaction, default 5000) and ``MIGRATION_PAUSE``
+        (seconds between batches, default 0.05).
+        """
+        app.config.setdefault('MIGRATE_ON_STARTUP', True)
+        app.config.setdefault('MIGRATION_BATCH', 5000)
+        app.config.setdefault('MIGRATION_PAUSE', 0.05)
+        self.app = app
+        app.extensions['todo_migrations'] = self
+        app.cli.add_command(db_cli)
+
+    def startup(self) -> bool:
+        """
+        Upgrade, or warn about pending migrations. Needs an app context.
+
+        Returns True if the schema is up to date.
+        """
+        if self.app.config['MIGRATE_ON_STARTUP']:
+            upgrade(self.app.logger)
+            return True
+        current = True
+        for location in locations():
+            for step in pending(location):
+                self.app.logger.warning("Migration %d (%s) pending on %s; run 'flask db upgrade'",
+                                        step.version, step.name, location.name)
+                current = False
+        return current
+
+
+migrator = Migrator()
+
+db_cli = AppGroup('db', help="Schema migrations.")
+
+
+@db_cli.command('upgrade')
+def upgrade_command():
+    """Run pending migrations."""
+    ran = upgrade(current_app.logger)
+    for location, step in ran:
+        click.echo(f"{location.name}: applied {step.version} {step.name}")
+    click.echo(f"{len(ran)} migrations applied.")
+
+
+@db_cli.command('status')
+def status_command():
+    """Show the schema version of each database."""
+    for location in locations():
+        done = applied_versions(location.engine)
+        todo = [step for step in MIGRATIONS if step.version not in done]
+        current = max(done) if done else 0
+        click.echo(f"{location.name}: version {current}, {len(todo)} pending")
+        for step in todo:
+            click.echo(f"  {step.version} {step.name}")
+
+
+@db_cli.command('verify')
+def verify_command():
+    """Check every database against the models."""
+    problems = verify()
+    for problem in problems:
+        click.echo(problem, err=True)
+    if problems:
+        raise SystemExit(1)
+    click.echo("Schema is up to date.")
@@ -0,0 +1,353 @@
+from contextvars import ContextVar
+from datetime import datetime
+from types import SimpleNamespace
+
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func, orm, text, tuple_
+from sqlalchemy.sql.util import find_tables
+
+try:  # Flask-SQLAlchemy 3
+    from flask_sqlalchemy.session import Session as _FlaskSession
+except ImportError:  # Flask-SQLAlchemy 2
+    from flask_sqlalchemy import SignallingSession as _FlaskSession
+
+# Tables that live in the tenant's shard file when TODO_SHARDS is set
+# (see shards.py); everything else stays in the main database.
+SHARDED_TABLES = frozenset({'todo', 'todo_list'})
+
+# The shard engine for the current request or job, set by shards.py.
+shard_engine = ContextVar('shard_engine', default=None)
+
+# Todo priorities, most urgent first; "what's next" orders by the number.
+PRIORITIES = {1: 'High', 2: 'Normal', 3: 'Low'}
+PRIORITY_NORMAL = 2
+
+# Both "what's next" indexes only cover open todos.
+OPEN_TODO = 'deleted_at IS NULL AND completed_at IS NULL'
+
+
+class RoutingSession(_FlaskSession):
+    """Session that sends statements on sharded tables to ``shard_engine``."""
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        engine = shard_engine.get()
+        if engine is not None:
+            if mapper is not None:
+                tables = {orm.class_mapper(mapper.class_).local_table}
+            elif clause is not None:
+                tables = find_tables(clause, include_crud=True)
+            else:
+                tables = ()
+            if any(table.name in SHARDED_TABLES for table in tables):
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, **kwargs)
+
+
+class _SQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        # Flask-SQLAlchemy 2 has no session class option.
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+db = _SQLAlchemy(session_options={'class_': RoutingSession}
+                 if _FlaskSession.__module__ == 'flask_sqlalchemy.session' else {})
+
+
+def bind_engine(bind_key=None):
+    """Engine for a bind key on either Flask-SQLAlchemy version."""
+    engines = getattr(db, 'engines', None)
+    return engines[bind_key] if engines is not None else db.get_engine(bind=bind_key)
+
+
+def current_owner_id():
+    """Id of the user the current request acts for; None for the shared list."""
+    return g.get('owner_id') if has_request_context() else None
+
+
+class User(db.Model):
+    """
+    A tenant. Requests act for the user named in TENANT_HEADER (tenant.py).
+
+    Lives in the main database, where it doubles as the shard directory.
+    """
+    __tablename__ = 'users'
+
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(80), nullable=False, unique=True)
+    shard = db.Column(db.String(50))
+    # Set while rebalancing copies the user's rows to another shard.
+    moving = db.Column(db.Boolean, default=False, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self) -> str:
+        return f"{self.id} - {self.username}"
+
+
+class TodoList(db.Model):
+    """A named list of todos owned by one user."""
+    __tablename__ = 'todo_list'
+
+    id = db.Column(db.Integer, primary_key=True)
+    # Not a foreign key: the list may live in a shard file without users.
+    owner_id = db.Column(db.Integer)
+    name = db.Column(db.String(100), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_todo_list_owner_created_at', 'owner_id', 'created_at'),
+    )
+
+    def to_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'name': self.name,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+        }
+
+
+class Todo(db.Model):
+    sno = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(200), nullable=False)
+    desc = db.Column(db.String(500), nullable=False)
+    date_created = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow,
+                           onupdate=datetime.utcnow, index=True)
+    # Set by delete; the row stays until the archiver moves it out.
+    deleted_at = db.Column(db.DateTime)
+    # NULL is the shared list of requests without a tenant.
+    owner_id = db.Column(db.Integer)
+    list_id = db.Column(db.Integer, db.ForeignKey('todo_list.id'))
+    due_date = db.Column(db.Date)
+    # The server default lets the column be added to a full table without
+    # rewriting or backfilling it.
+    priority = db.Column(db.SmallInteger, nullable=False, default=PRIORITY_NORMAL,
+                         server_default=text(str(PRIORITY_NORMAL)))
+    completed_at = db.Column(db.DateTime)
+
+    # Keyset pagination walks one owner's (date_created, sno), so all three
+    # columns live in one index and every page is a range scan instead of a
+    # full table sort. The index only covers live rows, so deleted and old
+    # rows waiting for the archiver do not make it any bigger.
+    __table_args__ = (
+        db.Index('ix_todo_owner_live_date_created_sno', 'owner_id', 'date_created', 'sno',
+                 sqlite_where=text('deleted_at IS NULL'),
+                 postgresql_where=text('deleted_at IS NULL')),
+        # Age-based archiving (archive.py) scans live rows of every tenant
+        # by date_created.
+        db.Index('ix_todo_live_date_created_sno', 'date_created', 'sno',
+                 sqlite_where=text('deleted_at IS NULL'),
+                 postgresql_where=text('deleted_at IS NULL')),
+        db.Index('ix_todo_deleted_at', 'deleted_at',
+                 sqlite_where=text('deleted_at IS NOT NULL'),
+                 postgresql_where=text('deleted_at IS NOT NULL')),
+        db.Index('ix_todo_live_completed_at', 'completed_at',
+                 sqlite_where=text('deleted_at IS NULL AND completed_at IS NOT NULL'),
+                 postgresql_where=text('deleted_at IS NULL AND completed_at IS NOT NULL')),
+        # "What's next" (next_todos) reads open todos with a due date in
+        # (due_date, priority, sno) order, then those without one in
+        # (priority, sno) order; each is a range scan of its own index.
+        db.Index('ix_todo_owner_open_due_priority', 'owner_id', 'due_date', 'priority', 'sno',
+                 sqlite_where=text(f'{OPEN_TODO} AND due_date IS NOT NULL'),
+                 postgresql_where=text(f'{OPEN_TODO} AND due_date IS NOT NULL')),
+        db.Index('ix_todo_owner_open_undated_priority', 'owner_id', 'priority', 'sno',
+                 sqlite_where=text(f'{OPEN_TODO} AND due_date IS NULL'),
+                 postgresql_where=text(f'{OPEN_TODO} AND due_date IS NULL')),
+    )
+
+    def __repr__(self) -> str:
+        return f"{self.sno} - {self.title}"
+
+    def to_dict(self) -> dict:
+        return {
+            'sno': self.sno,
+            'title': self.title,
+            'desc': self.desc,
+            'date_created': self.date_created.isoformat() if self.date_created else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'list_id': self.list_id,
+            'due_date': self.due_date.isoformat() if self.due_date else None,
+            'priority': self.priority,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None,
+        }
+
+
+class TodoArchive(db.Model):
+    """
+    Cold storage for todos moved out of the live table (see archive.py).
+
+    Lives on the ``archive`` bind, which is a separate database file when
+    ARCHIVE_DATABASE_URL is set and the main database otherwise.
+    """
+    __bind_key__ = 'archive'
+    __tablename__ = 'todo_archive'
+
+    sno = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    title = db.Column(db.String(200), nullable=False)
+    desc = db.Column(db.String(500), nullable=False)
+    date_created = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    deleted_at = db.Column(db.DateTime)
+    owner_id = db.Column(db.Integer)
+    list_id = db.Column(db.Integer)
+    due_date = db.Column(db.Date)
+    priority = db.Column(db.SmallInteger)
+    completed_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def __repr__(self) -> str:
+        return f"{self.sno} - {self.title}"
+
+
+class OutboxEvent(db.Model):
+    """
+    A change to be processed off the request path (see tasks.py).
+
+    Rows are written in the same transaction as the change itself, so an
+    event exists if and only if the change was committed.
+    """
+    __tablename__ = 'outbox'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    # Tenant of the change, so the live feed only shows users their own.
+    owner_id = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    claimed_at = db.Column(db.DateTime)
+    processed_at = db.Column(db.DateTime, index=True)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    last_error = db.Column(db.Text)
+
+    def __repr__(self) -> str:
+        return f"{self.id} - {self.kind}"
+
+
+class IdSequence(db.Model):
+    """
+    Next free id of a sharded table, handed out in blocks (see shards.py).
+
+    With shard files every database would otherwise number its rows from
+    1, and ids must stay unique when a tenant moves between shards.
+    """
+    __tablename__ = 'id_sequence'
+
+    name = db.Column(db.String(50), primary_key=True)
+    next_value = db.Column(db.Integer, nullable=False)
+
+
+class CacheVersion(db.Model):
+    """
+    Version counters of cache.py's page cache.
+
+    Kept in the main database so a write in one worker or process
+    invalidates what every other one has cached.
+    """
+    __tablename__ = 'cache_version'
+
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False)
+
+
+def snapshot(todos) -> list:
+    """
+    Copy column values out of ORM instances.
+
+    The copies are plain objects that can be cached and shared between
+    requests without being tied to (or expired by) a session.
+    """
+    columns = Todo.__table__.columns.keys()
+    return [SimpleNamespace(**{name: getattr(todo, name) for name in columns})
+            for todo in todos]
+
+
+def live_todos(session=None):
+    """Query for the current tenant's todos that have not been deleted."""
+    return (session or db.session).query(Todo).filter(
+        Todo.owner_id == current_owner_id(), Todo.deleted_at.is_(None))
+
+
+def list_fingerprint(session=None):
+    """
+    Return ``(live_count, last_modified)`` for the todo table.
+
+    Every insert, update and (soft) delete moves ``max(updated_at)`` (an
+    index lookup), and archiving changes the live count, so together they
+    identify the state of the list well enough for HTTP validators.
+    """
+    session = session or db.session
+    count = live_todos(session).with_entities(func.count(Todo.sno)).scalar()
+    last_modified = session.query(func.max(Todo.updated_at)).scalar()
+    return count, last_modified
+
+
+def page_size() -> int:
+    """Page size from ?per_page=, falling back to TODOS_PER_PAGE."""
+    per_page = request.args.get('per_page', type=int) or current_app.config['TODOS_PER_PAGE']
+    return max(1, min(per_page, current_app.config['TODOS_MAX_PER_PAGE']))
+
+
+def paginate_todos(after=None, before=None, per_page=20, session=None, list_id=None):
+    """
+    Return one page of todos using keyset pagination.
+
+    ``after``/``before`` are the ``sno`` of the last/first row of the
+    neighbouring page. Only ``per_page + 1`` rows are read, so the cost of a
+    page does not depend on the size of the table. ``session`` defaults to
+    ``db.session``; GET routes pass the read-only session instead. With
+    ``list_id`` only the todos of that list are returned.
+
+    Returns:
+        (todos, prev_cursor, next_cursor); a cursor is None when there is
+        no page in that direction.
+    """
+    key = tuple_(Todo.date_created, Todo.sno)
+    session = session or db.session
+    query = live_todos(session)
+    if list_id is not None:
+        query = query.filter(Todo.list_id == list_id)
+    # The cursor row may have been deleted since; its position still holds.
+    cursor = session.get(Todo, after or before) if (after or before) else None
+
+    if before and cursor:
+        rows = (query.filter(key < tuple_(cursor.date_created, cursor.sno))
+                .order_by(Todo.date_created.desc(), Todo.sno.desc())
+                .limit(per_page + 1).all())
+        has_prev = len(rows) > per_page
+        todos = rows[:per_page][::-1]
+        has_next = True
+    else:
+        if after and cursor:
+            query = query.filter(key > tuple_(cursor.date_created, cursor.sno))
+        rows = (query.order_by(Todo.date_created, Todo.sno)
+                .limit(per_page + 1).all())
+        has_next = len(rows) > per_page
+        todos = rows[:per_page]
+        has_prev = cursor is not None
+
+    prev_cursor = todos[0].sno if todos and has_prev else None
+    next_cursor = todos[-1].sno if todos and has_next else None
+    return todos, prev_cursor, next_cursor
+
+
+def next_todos(limit: int, session=None) -> list:
+    """
+    The current tenant's next ``limit`` open todos.
+
+    Todos with a due date come first, soonest first, then by priority;
+    todos without one follow by priority. Each part is an ordered range
+    scan of a partial index that holds open todos only, so the cost is
+    O(log n + limit) however many todos are done, deleted or far off.
+    """
+    session = session or db.session
+    # The filters repeat the index predicates word for word, which is
+    # what lets SQLite pick a partial index.
+    query = live_todos(session).filter(Todo.completed_at.is_(None))
+    todos = (query.filter(Todo.due_date.isnot(None))
+             .order_by(Todo.due_date, Todo.priority, Todo.sno)
+             .limit(limit).all())
+    if len(todos) < limit:
+        todos += (query.filter(Todo.due_date.is_(None))
+                  .order_by(Todo.priority, Todo.sno)
+                  .limit(limit - len(todos)).all())
+    return todos
@@ -0,0 +1,168 @@
+"""
+Rate limiting and admission control for write routes.
+
+SQLite has a single writer, so a script hammering ``POST /`` or
+``/delete/<sno>`` makes every other client queue behind it. Two guards
+run before any write route:
+
+* a token bucket per client (the ``X-API-Key`` header if it is one of
+  ``RATE_LIMIT_API_KEYS``, the remote address otherwise) refilling at
+  ``RATE_LIMIT_PER_MINUTE`` with room for ``RATE_LIMIT_BURST`` requests;
+  over the limit the client gets ``429``,
+* a process-wide cap of ``WRITE_CONCURRENCY`` writes in flight; a write
+  that cannot get a slot within ``WRITE_QUEUE_TIMEOUT`` seconds gets
+  ``503``, so load beyond what the writer can absorb is shed instead of
+  piling up as latency.
+
+Both answers carry ``Retry-After``. Buckets live in memory, per process;
+behind a proxy make sure the remote address is the client's (e.g. with
+werkzeug's ``ProxyFix``).
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g, jsonify, request
+
+WRITE_METHODS = frozenset({'POST', 'PUT', 'PATCH', 'DELETE'})
+
+# Routes that change data on GET.
+WRITE_ENDPOINTS = frozenset({'delete'})
+
+# Blueprints whose clients expect JSON errors.
+JSON_BLUEPRINTS = frozenset({'api', 'transfer'})
+
+
+class TokenBuckets:
+    """
+    Token buckets keyed by client, least recently seen dropped first.
+
+    A client that has been idle long enough to refill its bucket is
+    indistinguishable from a new one, so dropping old keys loses nothing.
+    """
+
+    def __init__(self, per_minute: float, burst: int, max_clients: int = 10000):
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, now=None) -> float:
+        """Take one token; returns 0 if allowed, else seconds until the next one."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / self.rate if self.rate else math.inf
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+            return wait
+
+
+class RateLimiter:
+    """Guards write routes; configure with :meth:`init_app`."""
+
+    def __init__(self):
+        self.app = None
+        self.buckets = None
+        self.slots = None
+        self.api_keys = frozenset()
+        self.counters = {'limited': 0, 'shed': 0}
+        self._counter_lock = threading.Lock()
+
+    def init_app(self, app) -> None:
+        """
+        Read settings and hook into the request cycle.
+
+        ``RATE_LIMIT_PER_MINUTE`` (default 120, 0 disables the buckets),
+        ``RATE_LIMIT_BURST`` (default 30), ``RATE_LIMIT_MAX_CLIENTS``
+        (default 10000 tracked clients), ``RATE_LIMIT_API_KEYS`` (comma
+        separated keys that get a bucket of their own), ``WRITE_CONCURRENCY``
+        (default 8, 0 disables the cap) and ``WRITE_QUEUE_TIMEOUT``
+        (seconds, default 0.5).
+        """
+        app.config.setdefault('RATE_LIMIT_PER_MINUTE', 120)
+        app.config.setdefault('RATE_LIMIT_BURST', 30)
+        app.config.setdefault('RATE_LIMIT_MAX_CLIENTS', 10000)
+        app.config.setdefault('RATE_LIMIT_KEY_HEADER', 'X-API-Key')
+        app.config.setdefault('RATE_LIMIT_API_KEYS', '')
+        app.config.setdefault('WRITE_CONCURRENCY', 8)
+        app.config.setdefault('WRITE_QUEUE_TIMEOUT', 0.5)
+        self.app = app
+        self.buckets = self.slots = None
+        if app.config['RATE_LIMIT_PER_MINUTE'] > 0:
+            self.buckets = TokenBuckets(app.config['RATE_LIMIT_PER_MINUTE'],
+                                        app.config['RATE_LIMIT_BURST'],
+                                        app.config['RATE_LIMIT_MAX_CLIENTS'])
+        if app.config['WRITE_CONCURRENCY'] > 0:
+            self.slots = threading.BoundedSemaphore(app.config['WRITE_CONCURRENCY'])
+        self.api_keys = frozenset(filter(None, (
+            key.strip() for key in app.config['RATE_LIMIT_API_KEYS'].split(','))))
+        app.extensions['todo_rate_limit'] = self
+        app.before_request(self._admit)
+        app.teardown_request(self._release)
+
+    def client_key(self, headers, remote_addr) -> str:
+        """
+        The bucket of a request: its API key if it is a configured one,
+        else its address.
+
+        Any other key is ignored; a client could otherwise send a new one
+        with every request and get a full bucket each time.
+        """
+        api_key = headers.get(self.app.config['RATE_LIMIT_KEY_HEADER'])
+        if api_key and api_key in self.api_keys:
+            return f"key:{api_key}"
+        return f"ip:{remote_addr}"
+
+    def count(self, name: str) -> None:
+        """Add one to the ``limited`` or ``shed`` counter; threads share them."""
+        with self._counter_lock:
+            self.counters[name] += 1
+
+    def check_rate(self, key) -> float:
+        """0 if ``key`` may write now, else the seconds to wait; counts refusals."""
+        if self.buckets is None:
+            return 0.0
+        wait = self.buckets.take(key)
+        if wait:
+            self.count('limited')
+        return wait
+
+    def _admit(self):
+        if request.method not in WRITE_METHODS and request.endpoint not in WRITE_ENDPOINTS:
+            return None
+        wait = self.check_rate(self.client_key(request.headers, request.remote_addr))
+        if wait:
+            return self._refuse(429, "Too many requests", wait)
+        if self.slots is not None:
+            if not self.slots.acquire(timeout=self.app.config['WRITE_QUEUE_TIMEOUT']):
+                self.count('shed')
+                return self._refuse(503, "Server busy", 1)
+            g.write_slot = True
+        return None
+
+    def _release(self, exc) -> None:
+        if g.pop('write_slot', False):
+            self.slots.release()
+
+    def _refuse(self, status: int, message: str, retry_after: float):
+        headers = {'Retry-After': str(retry_after_seconds(retry_after))}
+        if request.blueprint in JSON_BLUEPRINTS:
+            return jsonify(error=message), status, headers
+        return message, status, headers
+
+
+def retry_after_seconds(wait: float) -> int:
+    """Retry-After takes whole seconds; never tell a client to retry at once."""
+    return max(1, math.ceil(min(wait, 3600)))
+
+
+limiter = RateLimiter()
@@ -0,0 +1,121 @@
+"""
+Full-text search over todo titles and descriptions.
+
+On SQLite the text lives in an FTS5 external-content table that mirrors
+``todo``; triggers keep it in sync on insert, update and delete, so every
+write path (form routes, the JSON API, raw SQL) is covered. Soft-deleted
+rows stay indexed until the archiver removes them and are filtered out
+at query time. When FTS5 is not compiled into the SQLite library, or the
+database is not SQLite, search falls back to LIKE filters.
+"""
+import re
+
+from flask import current_app
+from sqlalchemy import or_, text
+from sqlalchemy.exc import OperationalError
+
+from database import read_session
+from models import Todo, current_owner_id, db, live_todos
+
+FTS_TABLE = 'todo_fts'
+
+# "desc" is an SQL keyword, hence the quoting. prefix='2 3' builds prefix
+# indexes so short "abc*" queries do not have to scan the whole vocabulary.
+FTS_SCHEMA = (
+    f"""CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        title, "desc",
+        content='todo', content_rowid='sno',
+        prefix='2 3', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS todo_fts_ai AFTER INSERT ON todo BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, "desc")
+        VALUES (new.sno, new.title, new."desc");
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS todo_fts_ad AFTER DELETE ON todo BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, "desc")
+        VALUES ('delete', old.sno, old.title, old."desc");
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS todo_fts_au AFTER UPDATE OF title, "desc" ON todo BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, "desc")
+        VALUES ('delete', old.sno, old.title, old."desc");
+        INSERT INTO {FTS_TABLE}(rowid, title, "desc")
+        VALUES (new.sno, new.title, new."desc");
+    END""",
+)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def init_search(app) -> None:
+    """
+    Create the FTS5 index and its triggers if they are missing.
+
+    Needs an application context. Records the backend in use under
+    ``app.extensions['todo_search']``.
+    """
+    app.extensions['todo_search'] = 'fts5' if create_fts_index(db.engine, app.logger) else 'like'
+
+
+def create_fts_index(engine, logger) -> bool:
+    """Set up FTS5 on ``engine``'s database; False if it is not available."""
+    if engine.dialect.name != 'sqlite':
+        return False
+
+    with engine.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': FTS_TABLE},
+        ).first()
+        try:
+            if not exists:
+                conn.execute(text(FTS_SCHEMA[0]))
+            for statement in FTS_SCHEMA[1:]:
+                conn.execute(text(statement))
+            if not exists:
+                # Index the rows written before search existed.
+                conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+        except OperationalError as exc:
+            # SQLite built without FTS5 ("no such module: fts5").
+            logger.warning("Full-text search unavailable, using LIKE: %s", exc)
+            return False
+    return True
+
+
+def match_query(query: str) -> str:
+    """
+    Turn free text into an FTS5 MATCH expression.
+
+    Every word must match; the last one is treated as a prefix so results
+    show up while the user is still typing. Words are quoted, which keeps
+    FTS5 operators and punctuation in user input from being interpreted.
+    """
+    tokens = TOKEN_RE.findall(query)
+    if not tokens:
+        return ''
+    terms = [f'"{token}"' for token in tokens]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def search_todos(query: str, limit: int = 50):
+    """Return up to ``limit`` todos matching ``query``, best match first."""
+    if current_app.extensions.get('todo_search') == 'fts5':
+        expression = match_query(query)
+        if not expression:
+            return []
+        statement = text(
+            f"SELECT todo.* FROM {FTS_TABLE} "
+            f"JOIN todo ON todo.sno = {FTS_TABLE}.rowid "
+            f"WHERE {FTS_TABLE} MATCH :query AND todo.deleted_at IS NULL "
+            f"AND todo.owner_id IS :owner ORDER BY rank LIMIT :limit"
+        )
+        return (read_session().query(Todo).from_statement(statement)
+                .params(query=expression, owner=current_owner_id(), limit=limit).all())
+
+    tokens = TOKEN_RE.findall(query)
+    if not tokens:
+        return []
+    filters = [or_(Todo.title.ilike(f'%{token}%'), Todo.desc.ilike(f'%{token}%'))
+               for token in tokens]
+    return (live_todos(read_session()).filter(*filters)
+            .order_by(Todo.date_created.desc()).limit(limit).all())
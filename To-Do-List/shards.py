@@ -0,0 +1,279 @@
+"""
+Sharding tenants across SQLite files.
+
+SQLite allows one writer per file, so with many users every write queues
+behind the same lock and the file grows without bound. Setting
+
+    TODO_SHARDS="a=sqlite:////data/todo-a.db,b=sqlite:////data/todo-b.db"
+
+keeps each user's todos and lists (``models.SHARDED_TABLES``) in one of
+the shard files instead. Users, the outbox and the archive stay in the
+main database, which acts as the shard directory: ``users.shard`` says
+where a user's rows live, and a request is routed there as soon as
+tenant.py has identified the user. Requests without a user keep using the
+main database.
+
+New users are placed by rendezvous (highest random weight) hashing of the
+user name over the shard names, so adding a shard only changes the
+placement of about 1/n of the users. ``flask shards rebalance`` moves the
+users whose placement changed; ``flask shards status`` shows the spread.
+Todo and list ids are handed out from ``IdSequence`` blocks in the main
+database, which keeps them unique across shards and lets moved rows keep
+their id.
+"""
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+
+import click
+from flask import g
+from flask.cli import AppGroup
+from sqlalchemy import create_engine, event, text
+
+from database import engine_options
+from models import IdSequence, Todo, TodoList, User, db, shard_engine
+from search import create_fts_index
+
+MOVE_BATCH = 1000
+
+
+def parse_shards(spec: str) -> dict:
+    """``"a=url,b=url"`` -> ``{'a': 'url', 'b': 'url'}``, in order."""
+    shards = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, sep, url = item.partition('=')
+        if not sep or not name.strip() or not url.strip():
+            raise ValueError(f"TODO_SHARDS entries look like name=url, got {item!r}")
+        shards[name.strip()] = url.strip()
+    return shards
+
+
+def rendezvous(key: str, names) -> str:
+    """The name with the highest hash for ``key``; stable as names come and go."""
+    def weight(name):
+        return hashlib.sha1(f"{name}:{key}".encode('utf-8')).digest()
+    return max(names, key=weight)
+
+
+class ShardRouter:
+    """Routes tenant tables to shard engines; configure with :meth:`init_app`."""
+
+    def __init__(self):
+        self.app = None
+        self.engines = {}
+        self._id_lock = threading.Lock()
+        # Sequence name -> [next id, end of the reserved block].
+        self._blocks = {}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.engines)
+
+    def init_app(self, app) -> None:
+        """
+        Open the shard engines and install the routing hooks.
+
+        ``TODO_SHARDS`` lists the shards (empty: no sharding) and
+        ``TODO_ID_BLOCK`` (default 100) is how many ids a process reserves
+        at a time.
+        """
+        app.config.setdefault('TODO_SHARDS', '')
+        app.config.setdefault('TODO_ID_BLOCK', 100)
+        self.app = app
+        app.extensions['todo_shards'] = self
+        app.cli.add_command(shards_cli)
+        self.engines = {name: create_engine(url, **engine_options(url))
+                        for name, url in parse_shards(app.config['TODO_SHARDS']).items()}
+        self._blocks = {}
+        # The listeners are global, so they are replaced on every init_app.
+        for model, listener in ((User, self._place_user), (Todo, self._assign_id),
+                                (TodoList, self._assign_id)):
+            if event.contains(model, 'before_insert', listener):
+                event.remove(model, 'before_insert', listener)
+            if self.enabled:
+                event.listen(model, 'before_insert', listener)
+        if not self.enabled:
+            return
+        app.before_request(self._route_request)
+        app.teardown_request(self._unroute)
+
+    def init_shards(self) -> None:
+        """
+        Set up search in every shard and seed the id sequences.
+
+        Needs an app context; the tables come from migrations.py.
+        """
+        for engine in self.engines.values():
+            create_fts_index(engine, self.app.logger)
+        # Ids must start above every id already handed out anywhere.
+        for model in (Todo, TodoList):
+            table = model.__table__
+            key = table.primary_key.columns.values()[0].name
+            sql = text(f"SELECT max({key}) FROM {table.name}")
+            highest = db.session.execute(sql).scalar() or 0
+            for engine in self.engines.values():
+                with engine.connect() as conn:
+                    highest = max(highest, conn.execute(sql).scalar() or 0)
+            sequence = db.session.get(IdSequence, table.name)
+            if sequence is None:
+                db.session.add(IdSequence(name=table.name, next_value=highest + 1))
+            elif sequence.next_value <= highest:
+                sequence.next_value = highest + 1
+        db.session.commit()
+
+    def locations(self) -> list:
+        """Every database holding todos: the main one (None) and each shard."""
+        return [None] + list(self.engines)
+
+    def shard_for(self, username: str) -> str:
+        return rendezvous(username, list(self.engines))
+
+    @contextmanager
+    def route(self, shard):
+        """Send tenant tables to ``shard`` (None: the main database) inside the block."""
+        token = shard_engine.set(self.engines[shard] if shard else None)
+        try:
+            yield
+        finally:
+            shard_engine.reset(token)
+
+    def _route_request(self) -> None:
+        shard = g.get('owner_shard')
+        if shard in self.engines:
+            shard_engine.set(self.engines[shard])
+
+    def _unroute(self, exc) -> None:
+        shard_engine.set(None)
+
+    def _place_user(self, mapper, connection, user) -> None:
+        if user.shard is None:
+            user.shard = self.shard_for(user.username)
+
+    def _assign_id(self, mapper, connection, row) -> None:
+        key = mapper.primary_key[0]
+        if getattr(row, key.key) is None:
+            setattr(row, key.key, self.next_id(mapper.local_table.name))
+
+    def next_id(self, table: str) -> int:
+        """
+        Reserve one id for a row of the sharded ``table``.
+
+        Blocks are taken on a connection of their own, so the caller's
+        transaction (on a shard) never waits on the main database lock.
+        """
+        with self._id_lock:
+            block = self._blocks.setdefault(table, [0, 0])
+            if block[0] >= block[1]:
+                size = self.app.config['TODO_ID_BLOCK']
+                with db.engine.begin() as conn:
+                    conn.execute(text("UPDATE id_sequence SET next_value = next_value + :size "
+                                      "WHERE name = :name"), {'size': size, 'name': table})
+                    end = conn.execute(text("SELECT next_value FROM id_sequence WHERE name = :name"),
+                                       {'name': table}).scalar()
+                block[:] = [end - size, end]
+            block[0] += 1
+            return block[0] - 1
+
+    def _copy_rows(self, model, user_id, source, target) -> int:
+        """Copy one user's rows of ``model`` in keyset batches; ids are kept."""
+        key = model.__table__.primary_key.columns.values()[0]
+        columns = [column.key for column in model.__table__.columns]
+        copied, last = 0, None
+        while True:
+            with self.route(source):
+                query = db.session.query(model).filter(model.owner_id == user_id)
+                if last is not None:
+                    query = query.filter(key > last)
+                rows = query.order_by(key).limit(MOVE_BATCH).all()
+                mappings = [{name: getattr(row, name) for name in columns} for row in rows]
+            if not mappings:
+                return copied
+            with self.route(target):
+                db.session.bulk_insert_mappings(model, mappings)
+                db.session.commit()
+            copied += len(mappings)
+            last = mappings[-1][key.key]
+
+    def _delete_rows(self, user_id, shard) -> None:
+        with self.route(shard):
+            # Todos first: they reference their list.
+            Todo.query.filter(Todo.owner_id == user_id).delete(synchronize_session=False)
+            TodoList.query.filter(TodoList.owner_id == user_id).delete(synchronize_session=False)
+            db.session.commit()
+
+    def move_user(self, user, target: str, grace: float = 2.0) -> int:
+        """
+        Move all of ``user``'s rows to shard ``target``; returns the todo count.
+
+        The user gets 503s while the move runs. Rows are copied first and
+        the source is cleared only after ``users.shard`` points at the
+        target, so an interrupted move can simply be run again.
+        """
+        source = user.shard
+        user.moving = True
+        db.session.commit()
+        # Let requests that started before the flag was set finish.
+        time.sleep(grace)
+        try:
+            self._delete_rows(user.id, target)
+            self._copy_rows(TodoList, user.id, source, target)
+            moved = self._copy_rows(Todo, user.id, source, target)
+            user.shard = target
+            db.session.commit()
+            self._delete_rows(user.id, source)
+        finally:
+            user.moving = False
+            db.session.commit()
+        return moved
+
+    def misplaced_users(self):
+        """Users whose rendezvous placement differs from where their rows are."""
+        for user in User.query.order_by(User.id):
+            target = self.shard_for(user.username)
+            if user.shard != target:
+                yield user, target
+
+    def status(self) -> list:
+        """Users and live todos per shard. Needs an app context."""
+        users = dict(db.session.query(User.shard, db.func.count(User.id)).group_by(User.shard).all())
+        report = []
+        for name in self.engines:
+            with self.route(name):
+                todos = (db.session.query(db.func.count(Todo.sno))
+                         .filter(Todo.deleted_at.is_(None)).scalar())
+            report.append({'shard': name, 'users': users.get(name, 0), 'todos': todos})
+        return report
+
+
+shards = ShardRouter()
+
+shards_cli = AppGroup('shards', help="Inspect and rebalance tenant shards.")
+
+
+@shards_cli.command('status')
+def status_command():
+    """Show users and todos per shard."""
+    if not shards.enabled:
+        raise click.ClickException("TODO_SHARDS is not set")
+    for row in shards.status():
+        click.echo(f"{row['shard']}: {row['users']} users, {row['todos']} todos")
+    misplaced = sum(1 for _ in shards.misplaced_users())
+    click.echo(f"{misplaced} users to move")
+
+
+@shards_cli.command('rebalance')
+@click.option('--dry-run', is_flag=True, help="Only list the moves.")
+@click.option('--grace', default=2.0, show_default=True,
+              help="Seconds to wait for in-flight requests of a user before moving it.")
+def rebalance_command(dry_run, grace):
+    """Move users to the shard rendezvous hashing assigns them."""
+    if not shards.enabled:
+        raise click.ClickException("TODO_SHARDS is not set")
+    for user, target in list(shards.misplaced_users()):
+        if dry_run:
+            click.echo(f"{user.username}: {user.shard} -> {target}")
+            continue
+        source = user.shard
+        moved = shards.move_user(user, target, grace=grace)
+        click.echo(f"{user.username}: moved {moved} todos from {source} to {target}")
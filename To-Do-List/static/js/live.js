@@ -0,0 +1,177 @@
+// Keeps the todo table on the home page up to date without reloading.
+// Listens to the server-sent events at /events (see live.py) and patches
+// the rows in place; the browser resumes from the last event id by itself
+// after a dropped connection.
+(function () {
+  'use strict';
+
+  var list = document.getElementById('todo-list');
+  if (!list || !window.EventSource) {
+    return;
+  }
+
+  // Same labels as models.PRIORITIES.
+  var PRIORITIES = {1: 'High', 2: 'Normal', 3: 'Low'};
+
+  function tbody() {
+    return list.querySelector('tbody');
+  }
+
+  function findRow(sno) {
+    return list.querySelector('tr[data-sno="' + sno + '"]');
+  }
+
+  function renumber() {
+    var rows = list.querySelectorAll('tbody tr');
+    for (var i = 0; i < rows.length; i++) {
+      rows[i].querySelector('th').textContent = i + 1;
+    }
+  }
+
+  function showReloadNotice(message) {
+    if (document.getElementById('todo-live-notice')) {
+      return;
+    }
+    var notice = document.createElement('div');
+    notice.id = 'todo-live-notice';
+    notice.className = 'alert alert-secondary';
+    notice.setAttribute('role', 'alert');
+    notice.textContent = message + ' ';
+    var link = document.createElement('a');
+    link.href = window.location.href;
+    link.textContent = 'Reload';
+    notice.appendChild(link);
+    list.parentNode.insertBefore(notice, list);
+  }
+
+  function actionLink(href, label) {
+    var link = document.createElement('a');
+    link.href = href;
+    link.type = 'button';
+    link.className = 'btn btn-outline-dark btn-sm mx-1';
+    link.textContent = label;
+    return link;
+  }
+
+  function completeForm(sno) {
+    var form = document.createElement('form');
+    form.action = '/complete/' + sno;
+    form.method = 'POST';
+    form.className = 'd-inline';
+    var next = document.createElement('input');
+    next.type = 'hidden';
+    next.name = 'next';
+    next.value = window.location.pathname;
+    form.appendChild(next);
+    var button = document.createElement('button');
+    button.type = 'submit';
+    button.className = 'btn btn-outline-dark btn-sm mx-1';
+    form.appendChild(button);
+    return form;
+  }
+
+  // Writes the fields present in ``todo`` into the row's cells.
+  function fillRow(row, todo) {
+    if ('completed_at' in todo) {
+      row.className = todo.completed_at ? 'text-muted' : '';
+      row.querySelector('form button').textContent = todo.completed_at ? 'Reopen' : 'Done';
+    }
+    if ('title' in todo || 'completed_at' in todo) {
+      // Done todos have their title struck through.
+      var title = row.querySelector('[data-field="title"]');
+      var content = document.createTextNode('title' in todo ? todo.title : title.textContent);
+      if (row.className === 'text-muted') {
+        var strike = document.createElement('s');
+        strike.appendChild(content);
+        content = strike;
+      }
+      title.textContent = '';
+      title.appendChild(content);
+    }
+    if ('desc' in todo) {
+      row.querySelector('[data-field="desc"]').textContent = todo.desc;
+    }
+    if ('due_date' in todo) {
+      row.querySelector('[data-field="due_date"]').textContent = todo.due_date || '';
+    }
+    if ('priority' in todo) {
+      row.querySelector('[data-field="priority"]').textContent = PRIORITIES[todo.priority] || '';
+    }
+  }
+
+  function buildRow(todo) {
+    var row = document.createElement('tr');
+    row.setAttribute('data-sno', todo.sno);
+    var number = document.createElement('th');
+    number.scope = 'row';
+    row.appendChild(number);
+    ['title', 'desc'].forEach(function (field) {
+      var cell = document.createElement('td');
+      cell.setAttribute('data-field', field);
+      row.appendChild(cell);
+    });
+    var created = document.createElement('td');
+    created.textContent = (todo.date_created || '').replace('T', ' ');
+    row.appendChild(created);
+    ['due_date', 'priority'].forEach(function (field) {
+      var cell = document.createElement('td');
+      cell.setAttribute('data-field', field);
+      row.appendChild(cell);
+    });
+    var actions = document.createElement('td');
+    actions.appendChild(completeForm(todo.sno));
+    actions.appendChild(actionLink('/update/' + todo.sno, 'Update'));
+    actions.appendChild(actionLink('/delete/' + todo.sno, 'Delete'));
+    row.appendChild(actions);
+    fillRow(row, todo);
+    return row;
+  }
+
+  function removeRow(sno) {
+    var row = findRow(sno);
+    if (row) {
+      row.parentNode.removeChild(row);
+    }
+  }
+
+  var handlers = {
+    'todo.created': function (todo) {
+      // New todos sort last, so only the last page shows them.
+      if (list.getAttribute('data-last-page') !== 'true' || findRow(todo.sno)) {
+        return;
+      }
+      if (!tbody()) {
+        showReloadNotice('New todos were added.');
+        return;
+      }
+      tbody().appendChild(buildRow(todo));
+    },
+    'todo.updated': function (todo) {
+      var row = findRow(todo.sno);
+      if (!row) {
+        return;
+      }
+      fillRow(row, todo);
+    },
+    'todo.deleted': function (todo) {
+      removeRow(todo.sno);
+    },
+    'todo.archived': function (batch) {
+      batch.snos.forEach(removeRow);
+    },
+    'todo.imported': function () {
+      showReloadNotice('Todos were imported.');
+    },
+    'reset': function () {
+      showReloadNotice('This list may be out of date.');
+    }
+  };
+
+  var source = new EventSource('/events');
+  Object.keys(handlers).forEach(function (kind) {
+    source.addEventListener(kind, function (event) {
+      handlers[kind](JSON.parse(event.data));
+      renumber();
+    });
+  });
+})();
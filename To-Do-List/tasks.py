@@ -0,0 +1,264 @@
+"""
+Background processing of todo side effects.
+
+Request handlers call :meth:`TaskQueue.record` before committing. That
+writes an ``outbox`` row in the same transaction as the change and, once
+the transaction commits, puts the event id on a bounded in-process queue
+served by worker threads. Handlers registered with
+:meth:`TaskQueue.handler` (audit logging, notifications, ...) therefore
+run after the response has been sent.
+
+The outbox makes this durable: events are claimed with an atomic UPDATE
+before processing and marked processed afterwards. A sweeper thread
+re-queues anything left pending, whether the queue was full, a handler
+failed, or the process died mid-way, so nothing is lost on restart.
+Delivery is at least once; handlers should be idempotent.
+"""
+import json
+import logging
+import queue
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from models import OutboxEvent, current_owner_id, db
+
+audit_log = logging.getLogger('todo.audit')
+
+SESSION_KEY = 'outbox_ids'
+
+
+class TaskQueue:
+    """Outbox-backed work queue; configure with :meth:`init_app`."""
+
+    def __init__(self):
+        self.app = None
+        self.queue = None
+        self.handlers = defaultdict(list)
+        self.counters = {'enqueued': 0, 'processed': 0, 'failed': 0, 'overflowed': 0}
+        self._counter_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._started = False
+        self._stopping = threading.Event()
+
+    def init_app(self, app) -> None:
+        """
+        Read settings and hook into session commits.
+
+        ``TASK_QUEUE_SIZE`` bounds the in-memory queue, ``TASK_WORKERS`` is
+        the number of worker threads, ``TASK_MAX_ATTEMPTS`` how often a
+        failing event is retried, ``TASK_SWEEP_INTERVAL`` (seconds) how
+        often the outbox is scanned, and ``OUTBOX_RETENTION_DAYS`` how long
+        processed events are kept.
+        """
+        app.config.setdefault('TASK_QUEUE_SIZE', 1000)
+        app.config.setdefault('TASK_WORKERS', 2)
+        app.config.setdefault('TASK_MAX_ATTEMPTS', 5)
+        app.config.setdefault('TASK_SWEEP_INTERVAL', 5)
+        app.config.setdefault('OUTBOX_RETENTION_DAYS', 7)
+        self.app = app
+        self.queue = queue.Queue(maxsize=app.config['TASK_QUEUE_SIZE'])
+        app.extensions['todo_tasks'] = self
+
+        event.listen(db.session, 'after_commit', self._after_commit)
+        event.listen(db.session, 'after_rollback', self._after_rollback)
+
+        # Threads do not survive a fork, so start them in the process that
+        # serves requests rather than at import time.
+        app.before_request(self.start)
+
+    def handler(self, kind: str):
+        """Register ``func(kind, payload)`` to run for events of ``kind``."""
+        def decorator(func):
+            self.handlers[kind].append(func)
+            return func
+        return decorator
+
+    def record(self, kind: str, payloads, owner_id=None) -> None:
+        """
+        Add one outbox event per payload to the current transaction.
+
+        Must be called before ``db.session.commit()``; the events are only
+        dispatched if that commit succeeds. Events belong to ``owner_id``,
+        by default the user of the current request.
+        """
+        if owner_id is None:
+            owner_id = current_owner_id()
+        events = [OutboxEvent(kind=kind, payload=json.dumps(payload), owner_id=owner_id)
+                  for payload in payloads]
+        if not events:
+            return
+        db.session.add_all(events)
+        db.session.flush()
+        db.session.info.setdefault(SESSION_KEY, []).extend(event.id for event in events)
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._counter_lock:
+            self.counters[name] += amount
+
+    def _after_commit(self, session) -> None:
+        self.enqueue(session.info.pop(SESSION_KEY, ()))
+
+    def enqueue(self, event_ids) -> None:
+        """
+        Queue outbox events that were committed outside ``db.session``.
+
+        For writers with their own connection (see asgi.py); events that do
+        not fit are left to the sweeper as usual.
+        """
+        for event_id in event_ids:
+            self._enqueue(event_id)
+
+    def _after_rollback(self, session) -> None:
+        session.info.pop(SESSION_KEY, None)
+
+    def _enqueue(self, event_id: int) -> bool:
+        try:
+            self.queue.put_nowait(event_id)
+        except queue.Full:
+            # Still safe in the outbox; the sweeper will pick it up.
+            self._count('overflowed')
+            return False
+        self._count('enqueued')
+        return True
+
+    def start(self) -> None:
+        """Start the worker and sweeper threads once per process."""
+        if self._started:
+            return
+        with self._start_lock:
+            if self._started:
+                return
+            for number in range(self.app.config['TASK_WORKERS']):
+                threading.Thread(target=self._work, name=f'todo-task-{number}',
+                                 daemon=True).start()
+            threading.Thread(target=self._sweep, name='todo-task-sweeper',
+                             daemon=True).start()
+            self._started = True
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    def _work(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                event_id = self.queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            try:
+                with self.app.app_context():
+                    self.process(event_id)
+            except Exception:
+                self.app.logger.exception("Task worker failed on outbox event %s", event_id)
+            finally:
+                self.queue.task_done()
+
+    def _claim(self, event_id: int) -> bool:
+        """Atomically mark an event as taken; False if someone else has it."""
+        stale = datetime.utcnow() - timedelta(seconds=self._claim_timeout())
+        claimed = (OutboxEvent.query
+                   .filter(OutboxEvent.id == event_id,
+                           OutboxEvent.processed_at.is_(None),
+                           db.or_(OutboxEvent.claimed_at.is_(None),
+                                  OutboxEvent.claimed_at < stale))
+                   .update({'claimed_at': datetime.utcnow()}, synchronize_session=False))
+        db.session.commit()
+        return claimed == 1
+
+    def _claim_timeout(self) -> int:
+        # A claim older than this belongs to a worker that died.
+        return self.app.config['TASK_SWEEP_INTERVAL'] * 12
+
+    def process(self, event_id: int) -> None:
+        """Run the handlers for one outbox event. Needs an app context."""
+        if not self._claim(event_id):
+            return
+        outbox_event = db.session.get(OutboxEvent, event_id)
+        payload = json.loads(outbox_event.payload)
+        try:
+            for func in self.handlers.get(outbox_event.kind, ()):
+                func(outbox_event.kind, payload)
+        except Exception as exc:
+            db.session.rollback()
+            outbox_event.attempts += 1
+            outbox_event.last_error = repr(exc)
+            outbox_event.claimed_at = None
+            if outbox_event.attempts >= self.app.config['TASK_MAX_ATTEMPTS']:
+                # Give up, but keep the row and its error for inspection.
+                outbox_event.processed_at = datetime.utcnow()
+            db.session.commit()
+            self._count('failed')
+            self.app.logger.warning("Outbox event %s (%s) failed: %r",
+                                    event_id, outbox_event.kind, exc)
+            return
+        outbox_event.processed_at = datetime.utcnow()
+        db.session.commit()
+        self._count('processed')
+
+    def _sweep(self) -> None:
+        while not self._stopping.wait(self.app.config['TASK_SWEEP_INTERVAL']):
+            try:
+                with self.app.app_context():
+                    self.requeue_pending()
+                    self.purge_processed()
+            except Exception:
+                self.app.logger.exception("Outbox sweep failed")
+
+    def requeue_pending(self) -> int:
+        """
+        Queue events that are still pending after one sweep interval.
+
+        Younger events are most likely still on their way through the
+        queue of the worker that committed them. Needs an app context.
+        """
+        free = self.queue.maxsize - self.queue.qsize()
+        if free <= 0:
+            return 0
+        cutoff = datetime.utcnow() - timedelta(seconds=self.app.config['TASK_SWEEP_INTERVAL'])
+        stale = datetime.utcnow() - timedelta(seconds=self._claim_timeout())
+        rows = (db.session.query(OutboxEvent.id)
+                .filter(OutboxEvent.processed_at.is_(None),
+                        OutboxEvent.created_at < cutoff,
+                        db.or_(OutboxEvent.claimed_at.is_(None),
+                               OutboxEvent.claimed_at < stale))
+                .order_by(OutboxEvent.id)
+                .limit(free).all())
+        return sum(self._enqueue(row.id) for row in rows)
+
+    def purge_processed(self) -> int:
+        """Delete processed events past the retention period."""
+        cutoff = datetime.utcnow() - timedelta(days=self.app.config['OUTBOX_RETENTION_DAYS'])
+        deleted = (OutboxEvent.query
+                   .filter(OutboxEvent.processed_at < cutoff)
+                   .delete(synchronize_session=False))
+        db.session.commit()
+        return deleted
+
+    def stats(self) -> dict:
+        """Queue depth and counters for this process. Needs an app context."""
+        with self._counter_lock:
+            counters = dict(self.counters)
+        pending = (db.session.query(db.func.count(OutboxEvent.id))
+                   .filter(OutboxEvent.processed_at.is_(None)).scalar())
+        return dict(
+            counters,
+            queue_depth=self.queue.qsize(),
+            queue_capacity=self.queue.maxsize,
+            workers=self.app.config['TASK_WORKERS'],
+            outbox_pending=pending,
+        )
+
+
+tasks = TaskQueue()
+
+
+@tasks.handler('todo.created')
+@tasks.handler('todo.updated')
+@tasks.handler('todo.deleted')
+@tasks.handler('todo.imported')
+@tasks.handler('todo.archived')
+def log_change(kind, payload) -> None:
+    """Audit trail of every change, written off the request path."""
+    audit_log.info("%s %s", kind, json.dumps(payload, sort_keys=True))
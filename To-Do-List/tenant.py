@@ -0,0 +1,61 @@
+"""
+Per-user todo lists.
+
+The app has no login of its own: an authenticating reverse proxy or API
+gateway names the user in ``TENANT_HEADER`` (default ``X-Todo-User``) and
+every query and write of the request is scoped to that user's todos (see
+``models.live_todos``). Users are created the first time they are seen.
+Requests without the header keep using the shared list the app always
+had, so single-user setups need no configuration.
+"""
+from flask import g, request
+from sqlalchemy.exc import IntegrityError
+
+from models import User, db
+
+MAX_USERNAME = 80
+
+
+class Tenancy:
+    """Resolves the tenant of each request; configure with :meth:`init_app`."""
+
+    def __init__(self):
+        self.app = None
+
+    def init_app(self, app) -> None:
+        app.config.setdefault('TENANT_HEADER', 'X-Todo-User')
+        app.config.setdefault('TENANT_RETRY_AFTER', 5)
+        self.app = app
+        app.extensions['todo_tenancy'] = self
+        app.before_request(self._resolve)
+
+    def _resolve(self):
+        username = request.headers.get(self.app.config['TENANT_HEADER'], '').strip()
+        if not username:
+            return None
+        if len(username) > MAX_USERNAME:
+            return f"User name longer than {MAX_USERNAME} characters", 400
+        user = self.get_or_create(username)
+        if user.moving:
+            # shards.py is copying this user's rows; writes now would be lost.
+            return ("Your todos are being moved, please retry shortly", 503,
+                    {'Retry-After': str(self.app.config['TENANT_RETRY_AFTER'])})
+        g.owner_id = user.id
+        g.owner_shard = user.shard
+        return None
+
+    def get_or_create(self, username: str) -> User:
+        """Return the user called ``username``, creating it if needed."""
+        user = User.query.filter_by(username=username).first()
+        if user is not None:
+            return user
+        db.session.add(User(username=username))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Created by a concurrent request in the meantime.
+            db.session.rollback()
+        return User.query.filter_by(username=username).one()
+
+
+tenancy = Tenancy()
@@ -0,0 +1,30 @@
+"""
+Fixtures for the todo app tests.
+
+Every test gets its own SQLite file, and apps are built with
+``create_app`` the way gunicorn and asgi.py build them.
+"""
+import os
+import sys
+
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+
+@pytest.fixture
+def database_url(tmp_path):
+    return f"sqlite:///{tmp_path / 'todo.db'}"
+
+
+@pytest.fixture
+def make_app(database_url):
+    """Build an app on the test's database; keyword arguments override config."""
+    from app import create_app
+
+    def make(**config):
+        config.setdefault('SQLALCHEMY_DATABASE_URI', database_url)
+        config.setdefault('ARCHIVE_INTERVAL', 0)
+        return create_app(config)
+    return make
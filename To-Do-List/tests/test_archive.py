@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta
+
+from archive import archiver
+from models import Todo, TodoArchive, db
+
+
+def test_completed_todos_are_archived_after_the_grace_period(make_app):
+    app = make_app(ARCHIVE_COMPLETED_AFTER_DAYS=30)
+    client = app.test_client()
+    for title in ('Done', 'Open'):
+        client.post('/', data={'title': title, 'desc': ''})
+    client.post('/complete/1')
+
+    with app.app_context():
+        assert archiver.run() == 0
+        assert archiver.run(now=datetime.utcnow() + timedelta(days=31)) == 1
+        assert [todo.title for todo in Todo.query] == ['Open']
+        assert [row.title for row in TodoArchive.query] == ['Done']
+
+
+def test_completed_todos_stay_when_the_setting_is_off(make_app):
+    app = make_app()
+    client = app.test_client()
+    client.post('/', data={'title': 'Done', 'desc': ''})
+    client.post('/complete/1')
+
+    with app.app_context():
+        assert archiver.run(now=datetime.utcnow() + timedelta(days=3650)) == 0
+
+
+def test_completed_query_uses_its_partial_index(make_app):
+    app = make_app(ARCHIVE_COMPLETED_AFTER_DAYS=30)
+    app.test_client().get('/')
+    with app.app_context():
+        query = archiver.candidate_queries()[1].limit(10)
+        sql = str(query.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+        plan = db.session.execute(db.text(f"EXPLAIN QUERY PLAN {sql}")).all()
+        assert 'ix_todo_live_completed_at' in ' '.join(str(row) for row in plan)
@@ -0,0 +1,116 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+import asgi
+
+
+@pytest.fixture
+def serve(make_app, monkeypatch):
+    """
+    Run a coroutine against the ASGI app on the test database.
+
+    ``serve(scenario)`` calls ``scenario(client)`` inside the app's
+    lifespan and returns its result.
+    """
+    flask_app = make_app(RATE_LIMIT_BURST=1000)
+    monkeypatch.setattr(asgi, 'flask_app', flask_app)
+
+    async def run(scenario):
+        async with asgi.app.router.lifespan_context(asgi.app):
+            transport = httpx.ASGITransport(app=asgi.app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+                return await scenario(client)
+
+    return lambda scenario: asyncio.run(run(scenario))
+
+
+def rows(html: str) -> int:
+    return html.count('data-sno=')
+
+
+def test_create_update_complete_delete(serve):
+    async def scenario(client):
+        response = await client.post('/', data={'title': 'Buy milk', 'desc': 'Two litres',
+                                                'priority': '1'})
+        assert response.status_code == 200 and 'Buy milk' in response.text
+
+        response = await client.post('/update/1', data={'title': 'Buy oat milk', 'desc': 'One'})
+        assert response.status_code == 302
+        assert 'Buy oat milk' in (await client.get('/update/1')).text
+
+        await client.post('/complete/1', data={'next': '/next'})
+        assert 'Nothing left to do.' in (await client.get('/next')).text
+
+        assert (await client.get('/delete/1')).status_code == 302
+        assert rows((await client.get('/')).text) == 0
+        assert (await client.get('/update/1')).status_code == 404
+
+    serve(scenario)
+
+
+def test_tenants_only_see_their_own_todos(serve):
+    async def scenario(client):
+        await client.post('/', data={'title': 'Shared', 'desc': ''})
+        await client.post('/', data={'title': 'Private', 'desc': ''},
+                          headers={'X-Todo-User': 'alice'})
+        alice = (await client.get('/', headers={'X-Todo-User': 'alice'})).text
+        assert 'Private' in alice and 'Shared' not in alice
+        assert (await client.get('/update/2')).status_code == 404
+
+    serve(scenario)
+
+
+def test_overlapping_writes_are_all_committed(serve):
+    async def scenario(client):
+        responses = await asyncio.gather(*(
+            client.post('/', data={'title': f'todo {number}', 'desc': 'concurrent'})
+            for number in range(40)))
+        assert [response.status_code for response in responses] == [200] * 40
+        page = await client.get('/', params={'per_page': 100})
+        return page.text
+
+    page = serve(scenario)
+    assert rows(page) == 40
+    assert all(f'todo {number}<' in page for number in range(40))
+
+
+def test_requests_overlap_while_queries_wait(serve, monkeypatch):
+    # Slow every query down; served one at a time, 20 pages would take 2 s.
+    in_flight = peak = 0
+    fetchall = asgi.Database.fetchall
+
+    async def slow_fetchall(self, sql, params=()):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        try:
+            await asyncio.sleep(0.1)
+            return await fetchall(self, sql, params)
+        finally:
+            in_flight -= 1
+
+    monkeypatch.setattr(asgi.Database, 'fetchall', slow_fetchall)
+
+    async def scenario(client):
+        started = time.perf_counter()
+        responses = await asyncio.gather(*(client.get('/') for _ in range(20)))
+        assert all(response.status_code == 200 for response in responses)
+        return time.perf_counter() - started
+
+    elapsed = serve(scenario)
+    assert peak > 1
+    assert elapsed < 1.0
+
+
+def test_write_invalidates_wsgi_page_cache(serve, make_app):
+    flask_client = make_app().test_client()
+    assert rows(flask_client.get('/').get_data(as_text=True)) == 0
+
+    async def scenario(client):
+        await client.post('/', data={'title': 'From the ASGI app', 'desc': ''})
+
+    serve(scenario)
+    assert 'From the ASGI app' in flask_client.get('/').get_data(as_text=True)
@@ -0,0 +1,37 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Another worker process adding todos through the form.
+ADD_TODOS = textwrap.dedent("""
+    from app import create_app
+    client = create_app({{'SQLALCHEMY_DATABASE_URI': {url!r}, 'ARCHIVE_INTERVAL': 0}}).test_client()
+    for number in range({count}):
+        client.post('/', data={{'title': f'todo {{number}}', 'desc': 'from another worker'}})
+""")
+
+
+def test_write_in_another_process_invalidates_cached_list(make_app, database_url):
+    client = make_app().test_client()
+    first = client.get('/')
+    assert first.data.count(b'data-sno=') == 0
+
+    subprocess.run([sys.executable, '-c', ADD_TODOS.format(url=database_url, count=3)],
+                   cwd=APP_DIR, check=True)
+
+    response = client.get('/', headers={'If-None-Match': first.headers['ETag']})
+    assert response.status_code == 200
+    assert response.data.count(b'data-sno=') == 3
+
+
+def test_write_in_same_process_invalidates_cached_list(make_app):
+    client = make_app().test_client()
+    assert client.get('/').data.count(b'data-sno=') == 0
+    client.post('/', data={'title': 'first', 'desc': 'todo'})
+    client.get('/delete/1')
+    client.post('/', data={'title': 'second', 'desc': 'todo'})
+    page = client.get('/').data
+    assert b'second' in page and b'first' not in page
@@ -0,0 +1,43 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from cache import cache
+from groupcommit import committer
+from models import Todo, db
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app(GROUP_COMMIT=True, GROUP_COMMIT_WINDOW_MS=20, RATE_LIMIT_BURST=1000)
+
+
+def post_concurrently(app, count: int) -> list:
+    def post(number):
+        client = app.test_client()
+        return client.post('/', data={'title': f'todo {number}', 'desc': ''}).status_code
+
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        return list(pool.map(post, range(count)))
+
+
+def titles(app) -> Counter:
+    with app.app_context():
+        return Counter(title for title, in db.session.query(Todo.title))
+
+
+def test_concurrent_posts_are_committed_in_batches(app):
+    batches = committer.counters['batches']
+    assert post_concurrently(app, 40) == [200] * 40
+    assert titles(app) == Counter(f'todo {number}' for number in range(40))
+    assert committer.counters['batches'] - batches < 40
+
+
+def test_failed_invalidation_does_not_insert_twice(app, monkeypatch):
+    def fail():
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(cache, 'invalidate', fail)
+    assert post_concurrently(app, 20) == [200] * 20
+    assert titles(app) == Counter(f'todo {number}' for number in range(20))
@@ -0,0 +1,18 @@
+def test_feed_is_off_by_default(make_app):
+    client = make_app().test_client()
+    assert b'live.js' not in client.get('/').data
+    # 204 tells EventSource not to reconnect.
+    assert client.get('/events').status_code == 204
+
+
+def test_feed_streams_events_when_enabled(make_app):
+    client = make_app(LIVE_UPDATES=True, LIVE_KEEPALIVE=0.05,
+                      LIVE_MAX_STREAM_SECONDS=0.2).test_client()
+    assert b'live.js' in client.get('/').data
+    client.post('/', data={'title': 'Streamed', 'desc': ''})
+
+    response = client.get('/events', headers={'Last-Event-ID': '0'})
+    body = response.get_data(as_text=True)
+    assert response.mimetype == 'text/event-stream'
+    assert body.startswith('retry: ')
+    assert 'event: todo.created' in body and 'Streamed' in body
@@ -0,0 +1,41 @@
+import threading
+import uuid
+
+import pytest
+
+from ratelimit import limiter
+
+
+@pytest.fixture
+def client(make_app):
+    return make_app(RATE_LIMIT_PER_MINUTE=1, RATE_LIMIT_BURST=3,
+                    RATE_LIMIT_API_KEYS='partner-key').test_client()
+
+
+def post(client, **headers):
+    return client.post('/', data={'title': 'todo', 'desc': ''}, headers=headers).status_code
+
+
+def test_new_api_key_per_request_does_not_reset_the_bucket(client):
+    statuses = [post(client, **{'X-API-Key': uuid.uuid4().hex}) for _ in range(5)]
+    assert statuses == [200, 200, 200, 429, 429]
+
+
+def test_configured_api_key_has_its_own_bucket(client):
+    assert [post(client) for _ in range(4)] == [200, 200, 200, 429]
+    assert post(client, **{'X-API-Key': 'partner-key'}) == 200
+
+
+def test_refusal_counters_are_exact_under_threads(client):
+    before = limiter.counters['limited']
+
+    def refuse():
+        for _ in range(2000):
+            limiter.count('limited')
+
+    threads = [threading.Thread(target=refuse) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert limiter.counters['limited'] - before == 16000
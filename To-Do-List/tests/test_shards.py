@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+from shards import shards
+
+
+@pytest.fixture
+def sharded_client(make_app, tmp_path):
+    spec = ','.join(f"{name}=sqlite:///{tmp_path / f'shard-{name}.db'}" for name in 'ab')
+    return make_app(TODO_SHARDS=spec).test_client()
+
+
+def add_todos(client, user, count):
+    for number in range(count):
+        client.post('/', data={'title': f'{user} {number}', 'desc': ''},
+                    headers={'X-Todo-User': user})
+
+
+@pytest.mark.parametrize('fmt', ['ndjson', 'csv'])
+def test_streamed_export_reads_the_users_shard(sharded_client, fmt):
+    # Both users, so at least one of them lives on a shard file.
+    add_todos(sharded_client, 'alice', 3)
+    add_todos(sharded_client, 'bob', 2)
+    for user, count in (('alice', 3), ('bob', 2)):
+        response = sharded_client.get(f'/api/v1/todos/export.{fmt}',
+                                      headers={'X-Todo-User': user})
+        lines = response.get_data(as_text=True).splitlines()
+        if fmt == 'csv':
+            lines = lines[1:]
+        assert len(lines) == count
+        assert all(user in line for line in lines)
+
+
+def test_users_are_spread_over_shards(sharded_client):
+    users = [f'user{number}' for number in range(8)]
+    for user in users:
+        add_todos(sharded_client, user, 1)
+    placed = {shards.shard_for(user) for user in users}
+    assert placed == {'a', 'b'}
+    for user in users:
+        response = sharded_client.get('/api/v1/todos/export.ndjson', headers={'X-Todo-User': user})
+        assert json.loads(response.get_data(as_text=True))['title'] == f'{user} 0'
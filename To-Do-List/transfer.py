@@ -0,0 +1,232 @@
+"""
+Streaming export and import of todos.
+
+Exports walk the table with ``yield_per`` and write each batch straight
+into the response, and imports parse the request body line by line and
+insert in chunked transactions. Neither side ever holds more than one
+batch in memory, so multi-GB backups work with a flat RSS.
+
+Formats are CSV (header row with the column names) and NDJSON (one JSON
+object per line). Both only ever cover the todos of the current user.
+"""
+import csv
+import io
+import json
+from datetime import date, datetime
+
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+from sqlalchemy.exc import IntegrityError
+
+from api import clean_fields, error_response
+from cache import cache
+from database import read_session
+from models import PRIORITY_NORMAL, Todo, TodoList, current_owner_id, db, shard_engine
+from shards import shards
+from tasks import tasks
+
+transfer = Blueprint('transfer', __name__, url_prefix='/api/v1/todos')
+
+COLUMNS = ('sno', 'title', 'desc', 'date_created', 'updated_at', 'list_id', 'due_date',
+           'priority', 'completed_at')
+
+# Only the first few bad rows are reported back; the rest are counted.
+MAX_REPORTED_ERRORS = 100
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def _export_rows(owner_id, engine):
+    """
+    Yield live todo rows as dicts, ``EXPORT_BATCH`` rows per database fetch.
+
+    The rows are read while the response is sent, after the request's
+    teardown has reset the shard routing of shards.py, so the generator
+    routes to ``engine`` (the request's shard engine, None for the main
+    database) itself.
+    """
+    token = shard_engine.set(engine)
+    try:
+        batch = current_app.config['EXPORT_BATCH']
+        columns = [getattr(Todo, name) for name in COLUMNS]
+        query = (read_session().query(*columns)
+                 .filter(Todo.owner_id == owner_id, Todo.deleted_at.is_(None))
+                 .order_by(Todo.sno)
+                 .execution_options(stream_results=True)
+                 .yield_per(batch))
+        for row in query:
+            yield {
+                name: value.isoformat() if isinstance(value, date) else value
+                for name, value in zip(COLUMNS, row)
+            }
+    finally:
+        shard_engine.reset(token)
+
+
+def _csv_chunks(rows, batch):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=COLUMNS)
+    writer.writeheader()
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if count % batch == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _ndjson_chunks(rows, batch):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(row, ensure_ascii=False))
+        if len(lines) == batch:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+@transfer.route('/export.<fmt>', methods=['GET'])
+def export_todos(fmt):
+    if fmt not in FORMATS:
+        return error_response(f"Unknown export format '{fmt}'", 404)
+    chunks = _csv_chunks if fmt == 'csv' else _ndjson_chunks
+    rows = _export_rows(current_owner_id(), shard_engine.get())
+    body = chunks(rows, current_app.config['EXPORT_BATCH'])
+    response = Response(stream_with_context(body), mimetype=FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename=todos.{fmt}'
+    return response
+
+
+def _body_lines():
+    """Decode the request body lazily, one line at a time."""
+    for line in request.stream:
+        yield line.decode('utf-8')
+
+
+def _parse_records(fmt):
+    """Yield ``(line_number, record_or_error)`` pairs from the upload."""
+    if fmt == 'csv':
+        reader = csv.DictReader(_body_lines())
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for number, line in enumerate(_body_lines(), 1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError as exc:
+            yield number, ValueError(f"Invalid JSON: {exc}")
+
+
+def _to_row(record, preserve_ids: bool, owned_lists):
+    """
+    Validate one record and turn it into insert parameters.
+
+    Every row gets the same keys, because an executemany() insert takes
+    its column list from the first row of the chunk.
+    """
+    if isinstance(record, Exception):
+        raise record
+    if isinstance(record, dict) and isinstance(record.get('list_id'), str):
+        # CSV has no types: '' is no list, anything else must be a number.
+        list_id = record['list_id'].strip()
+        record = dict(record, list_id=int(list_id) if list_id else None)
+    if isinstance(record, dict) and isinstance(record.get('priority'), str):
+        priority = record['priority'].strip()
+        record = dict(record, priority=int(priority) if priority else PRIORITY_NORMAL)
+    if isinstance(record, dict) and record.get('due_date') == '':
+        record = dict(record, due_date=None)
+    fields, message = clean_fields(record, partial=False)
+    if message:
+        raise ValueError(message)
+    fields.setdefault('list_id', None)
+    fields.setdefault('due_date', None)
+    fields.setdefault('priority', PRIORITY_NORMAL)
+    if fields['list_id'] is not None and fields['list_id'] not in owned_lists:
+        raise ValueError(f"Unknown list {fields['list_id']}")
+    fields['owner_id'] = current_owner_id()
+    created = record.get('date_created')
+    updated = record.get('updated_at')
+    fields['date_created'] = datetime.fromisoformat(created) if created else datetime.utcnow()
+    fields['updated_at'] = datetime.fromisoformat(updated) if updated else fields['date_created']
+    completed = record.get('completed_at')
+    fields['completed_at'] = datetime.fromisoformat(completed) if completed else None
+    if preserve_ids:
+        sno = record.get('sno')
+        # NULL makes SQLite assign the next id as usual.
+        fields['sno'] = int(sno) if sno not in (None, '') else None
+    if shards.enabled and fields.get('sno') is None:
+        # Core inserts skip the ORM hook that numbers todos across shards.
+        fields['sno'] = shards.next_id('todo')
+    return fields
+
+
+def _import_format():
+    fmt = request.args.get('format')
+    if fmt:
+        return fmt
+    mimetype = request.mimetype
+    if mimetype in ('application/x-ndjson', 'application/jsonl', 'application/json'):
+        return 'ndjson'
+    return 'csv'
+
+
+@transfer.route('/import', methods=['POST'])
+def import_todos():
+    """
+    Import todos from a CSV or NDJSON body.
+
+    The format follows ``?format=`` or the Content-Type. Rows are inserted
+    in transactions of ``IMPORT_BATCH``; invalid rows are skipped and
+    reported. With ``?preserve_ids=1`` the ``sno`` column is kept, which
+    restores a backup into an empty table.
+    """
+    fmt = _import_format()
+    if fmt not in FORMATS:
+        return error_response(f"Unknown import format '{fmt}'")
+    preserve_ids = request.args.get('preserve_ids', type=int) == 1
+    batch = current_app.config['IMPORT_BATCH']
+    insert = Todo.__table__.insert()
+    owned_lists = {row.id for row in TodoList.query.with_entities(TodoList.id)
+                   .filter(TodoList.owner_id == current_owner_id())}
+
+    imported = skipped = 0
+    errors = []
+    rows = []
+
+    def flush():
+        db.session.execute(insert, rows)
+        tasks.record('todo.imported', [{'count': len(rows)}])
+        db.session.commit()
+        count = len(rows)
+        rows.clear()
+        return count
+
+    try:
+        for line, record in _parse_records(fmt):
+            try:
+                rows.append(_to_row(record, preserve_ids, owned_lists))
+            except (TypeError, ValueError) as exc:
+                skipped += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append({'line': line, 'error': str(exc)})
+                continue
+            if len(rows) == batch:
+                imported += flush()
+        if rows:
+            imported += flush()
+    except IntegrityError as exc:
+        # Earlier chunks stay committed; report how far the import got.
+        db.session.rollback()
+        return jsonify(imported=imported, skipped=skipped, errors=errors,
+                       error=f"Import stopped: {exc.orig}"), 409
+    finally:
+        if imported:
+            cache.invalidate()
+
+    return jsonify(imported=imported, skipped=skipped, errors=errors)